@@ -0,0 +1,125 @@
+# html_text_benchmark.py
+"""
+对比帖子HTML转文本的两种实现：原来的 BeautifulSoup 实现和 src/ForumBot/html_text.py 的单遍实现
+
+先逐条检查两者输出完全一致，再分别统计吞吐量。帖子来源（可组合）：
+    python benchmarks/html_text_benchmark.py                         使用内置的Discourse帖子样例
+    python benchmarks/html_text_benchmark.py data/t/*.json           使用保存的 /t/<id>.json 响应
+    python benchmarks/html_text_benchmark.py --topics 1201 1202      按配置文件从论坛获取帖子
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ForumBot import html_text
+
+# 按Discourse cooked格式构造的样例：图片lightbox、onebox、引用、代码块、提及、列表和表格
+SAMPLE_POSTS = [
+    '<p>升级到 2.3 之后 <code>kubectl get pods</code> 一直报错，日志如下：</p>\n'
+    '<pre><code class="lang-auto">Error from server (Forbidden): pods is forbidden:\n'
+    '  User "system:anonymous" cannot list resource "pods"\n\n\n</code></pre>\n'
+    '<p>截图：</p>\n'
+    '<p><div class="lightbox-wrapper"><a class="lightbox" href="https://forum.example.com/uploads/default/original/2X/a/abc123.png" '
+    'data-download-href="https://forum.example.com/uploads/default/abc123" title="image">'
+    '<img src="https://forum.example.com/uploads/default/optimized/2X/a/abc123_2_690x388.png" alt="image" '
+    'data-base62-sha1="abc123" width="690" height="388" srcset="https://forum.example.com/a.png, https://forum.example.com/b.png 1.5x">'
+    '<div class="meta"><svg class="fa d-icon d-icon-far-image svg-icon" aria-hidden="true"><use href="#far-image"></use></svg>'
+    '<span class="filename">image</span><span class="informations">1920×1080 142 KB</span>'
+    '<svg class="fa d-icon d-icon-discourse-expand svg-icon" aria-hidden="true"><use href="#discourse-expand"></use></svg>'
+    '</div></a></div></p>\n<p>请问 <a class="mention" href="/u/admin">@admin</a> 这个怎么处理？</p>',
+
+    '<aside class="quote no-group" data-username="alice" data-post="3" data-topic="1024">\n'
+    '<div class="title">\n<div class="quote-controls"></div>\n'
+    '<img loading="lazy" alt="" width="24" height="24" src="https://forum.example.com/user_avatar/alice/48/1.png" class="avatar"> alice:</div>\n'
+    '<blockquote>\n<p>可以先检查一下 <code>config.yaml</code> 中的 <code>api_key</code> 配置</p>\n</blockquote>\n</aside>\n'
+    '<p>检查过了，配置没问题 &amp; 网络也是通的，&lt;timeout&gt; 设置为 30s。</p>\n'
+    '<ul>\n<li>版本：v2.3.1</li>\n<li>系统：Ubuntu 22.04</li>\n<li>部署方式：Docker&nbsp;Compose</li>\n</ul>',
+
+    '<aside class="onebox githubrepo" data-onebox-src="https://github.com/example/project">\n'
+    '<header class="source">\n<a href="https://github.com/example/project" target="_blank" rel="noopener">github.com</a>\n</header>\n'
+    '<article class="onebox-body">\n<h3><a href="https://github.com/example/project" target="_blank" rel="noopener">'
+    'GitHub - example/project</a></h3>\n<p><span class="label1">An example project.</span></p>\n</article>\n'
+    '<div style="clear: both"></div>\n</aside>\n\n'
+    '<p>参考文档：<a href="https://docs.example.com/install#step-2">安装指南</a>，第二步需要先执行</p>\n'
+    '<pre><code class="lang-bash">pip install -r requirements.txt\npython main.py --config config/config.yaml\n</code></pre>\n'
+    '<div class="md-table">\n<table>\n<thead>\n<tr>\n<th>参数</th>\n<th>默认值</th>\n</tr>\n</thead>\n'
+    '<tbody>\n<tr>\n<td>check_interval</td>\n<td>300</td>\n</tr>\n<tr>\n<td>max_workers</td>\n<td>4</td>\n</tr>\n</tbody>\n</table>\n</div>',
+
+    '<p>谢谢，问题解决了 <img src="https://forum.example.com/images/emoji/twitter/+1.png?v=12" title=":+1:" '
+    'class="emoji" alt=":+1:" loading="lazy" width="20" height="20"><br>\n'
+    '原因是代理把 <code>Authorization</code> 头去掉了。</p>\n<p><img src="upload://xYz12AbC.png" alt="result"></p>',
+]
+
+
+def load_posts(paths, topic_ids):
+    posts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            posts.extend(item for item in data if isinstance(item, str))
+        else:
+            posts.extend(post['cooked'] for post in data.get('post_stream', {}).get('posts', []) if post.get('cooked'))
+    if topic_ids:
+        from src.utils import load_config
+        from src.ForumBot.data_processor import fetch_topic_details
+        config = load_config()
+        for topic_id in topic_ids:
+            details = fetch_topic_details(topic_id, config)
+            if details:
+                posts.extend(post['cooked'] for post in details.get('post_stream', {}).get('posts', [])
+                             if post.get('cooked'))
+    return posts or SAMPLE_POSTS
+
+
+def reference_text_with_image_links(html):
+    return re.sub(r'\n+', '\n', html_text.bs4_text_with_image_links(html)).strip()
+
+
+def reference_text_and_links(html):
+    text_content, links = html_text.bs4_text_and_links(html)
+    return re.sub(r'\n{3,}', '\n\n', text_content).strip(), links
+
+
+def bench(name, func, posts, rounds):
+    total_bytes = sum(len(post.encode('utf-8')) for post in posts) * rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for post in posts:
+            func(post)
+    elapsed = time.perf_counter() - start
+    count = len(posts) * rounds
+    print(f"{name:<40} {count / elapsed:>10.0f} 帖/秒 {total_bytes / elapsed / 1024 / 1024:>8.2f} MB/秒")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='帖子HTML转文本的正确性和吞吐量对比')
+    parser.add_argument('paths', nargs='*', help='保存的 /t/<id>.json 响应或cooked字符串列表的JSON文件')
+    parser.add_argument('--topics', nargs='*', type=int, default=[], help='从论坛获取的帖子ID')
+    parser.add_argument('--rounds', type=int, default=0, help='重复轮数，默认按帖子数量自动选择')
+
+    args = parser.parse_args()
+    posts = load_posts(args.paths, args.topics)
+    rounds = args.rounds or max(1, 2000 // len(posts))
+
+    cases = [
+        ('图片链接文本', html_text.text_with_image_links, reference_text_with_image_links),
+        ('文本和链接', html_text.text_and_links, reference_text_and_links),
+    ]
+    print(f"共 {len(posts)} 条帖子，重复 {rounds} 轮")
+    for name, fast, reference in cases:
+        mismatches = sum(1 for post in posts if fast(post) != reference(post))
+        print(f"\n[{name}] 与 BeautifulSoup 输出不一致的帖子数: {mismatches}")
+        slow_time = bench('BeautifulSoup', reference, posts, rounds)
+        fast_time = bench('单遍解析 (html_text)', fast, posts, rounds)
+        print(f"加速比: {slow_time / fast_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from src.ForumBot.monitor import ForumMonitor
 from src.update_lightrag.full_data_init import FullDataUpdate
 from src.update_lightrag.increment_date_update_timer import UpdateLightRAGTimer
 from src.ForumBot.logging_config import setup_logger
+from src.ForumBot.webhook import verify_signature, extract_topic_id
 import os
+import signal
+import sys
 import threading
 import netifaces
 import socket
@@ -185,6 +188,9 @@ def detailed_health_check():
             "monitor_thread_alive": monitor_thread.is_alive() if monitor_thread else False
         }
     }
+    if monitor_instance:
+        health_info["last_poll"] = monitor_instance.last_poll_stats
+        health_info["last_pipeline"] = monitor_instance.last_pipeline_stats
 
     if service_initialized and monitor_instance and monitor_thread and monitor_thread.is_alive():
         health_info["message"] = "All components are working properly"
@@ -193,8 +199,34 @@ def detailed_health_check():
         health_info["message"] = "Service initialization failed or monitor not running"
         return jsonify(health_info), 503
 
+@app.route('/webhooks/discourse', methods=['POST'])
+def discourse_webhook():
+    """
+    接收Discourse的 topic_created/post_created 事件，校验签名后将新帖子放入监控器的处理队列
+    """
+    if not monitor_instance or not monitor_instance.webhook_enabled:
+        return jsonify({"status": "disabled"}), 404
+
+    body = request.get_data()
+    secret = monitor_instance.config.get('webhook', {}).get('secret', '')
+    if not verify_signature(secret, body, request.headers.get('X-Discourse-Event-Signature', '')):
+        logger.warning("webhook签名校验失败")
+        return jsonify({"status": "invalid signature"}), 403
+
+    event = request.headers.get('X-Discourse-Event', '')
+    payload = request.get_json(silent=True)
+    topic_id = extract_topic_id(event, payload)
+    if topic_id is None:
+        return jsonify({"status": "ignored", "event": event}), 200
+
+    queued = monitor_instance.enqueue_topic(topic_id)
+    logger.info(f"收到webhook事件 {event}，帖子 {topic_id}{'已加入处理队列' if queued else '已在队列中'}")
+    return jsonify({"status": "queued" if queued else "duplicate", "topic_id": topic_id}), 202
+
 def main():
     logger.info("Robot应用启动")
+    # 收到SIGTERM时正常退出，让后台写入线程在退出前写完队列中的记录
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     # 确保必要目录存在
     try:
         from src.utils import load_config, delete_config_file
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from .logging_config import main_logger as logger
+
+INDEX_FILE = 'index.tsv'
+# compact_directory 已迁移的旧产物文件名，每行一个
+MIGRATED_FILE = 'migrated.txt'
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+_SEGMENT_PATTERN = re.compile(r'^artifacts-(\d{6})\.jsonl$')
+# forum_data_dir 中旧的单文件产物
+_SEARCH_FILE_PATTERN = re.compile(r'^search_results_topic_(\d+)_(\d{8}_\d{6})\.json$')
+_RETRIEVAL_FILE_PATTERN = re.compile(r'^retrieval_results_(\d{8}_\d{6})\.json$')
+
+
+class ArtifactLog:
+    """
+    只追加的JSONL产物日志，按大小滚动分段，并维护按帖子ID的偏移索引
+
+    每条记录占一行：{"kind": 类型, "topic_id": 帖子ID, "timestamp": 时间, "data": 内容}。
+    index.tsv 每行记录 帖子ID、类型、段号、偏移、长度，启动时加载到内存，
+    读取某个帖子的产物时直接按偏移定位，不需要扫描段文件。
+    索引在记录写入之后追加，进程中断时最多留下没有索引的记录，可用 rebuild_index 重建。
+    已滚动的段不再修改，prune 按段内最新记录的时间整段删除过期的段。
+    """
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.index = {}
+        self.records = 0
+        # 已滚动的段中最新记录的时间，段不再修改，计算一次后缓存
+        self.segment_newest = {}
+        segments = self._segment_numbers()
+        self.segment = segments[-1] if segments else 1
+        if os.path.exists(self.index_path):
+            self._load_index()
+        elif segments:
+            self.rebuild_index()
+
+    def _segment_numbers(self):
+        return sorted(int(match.group(1)) for match in
+                      (_SEGMENT_PATTERN.match(name) for name in os.listdir(self.directory)) if match)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"artifacts-{segment:06d}.jsonl")
+
+    def _load_index(self):
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 5:
+                    continue
+                topic_id, kind, segment, offset, length = parts
+                self._add_to_index(topic_id, kind, int(segment), int(offset), int(length))
+
+    def _add_to_index(self, topic_id, kind, segment, offset, length):
+        self.index.setdefault(str(topic_id), []).append((kind, segment, offset, length))
+        self.records += 1
+
+    def rebuild_index(self):
+        """
+        扫描全部段文件重建偏移索引
+        """
+        with self.lock:
+            self.index = {}
+            self.records = 0
+            lines = []
+            for segment in self._segment_numbers():
+                offset = 0
+                with open(self._segment_path(segment), 'rb') as f:
+                    for raw in f:
+                        try:
+                            record = json.loads(raw)
+                        except ValueError:
+                            # 中断写入留下的不完整行
+                            offset += len(raw)
+                            continue
+                        entry = (str(record.get('topic_id')), record.get('kind'), segment, offset, len(raw))
+                        self._add_to_index(*entry)
+                        lines.append('\t'.join(str(value) for value in entry) + '\n')
+                        offset += len(raw)
+            self._write_index(lines)
+        logger.info(f"产物日志索引已重建，共 {self.records} 条记录")
+
+    def _write_index(self, lines):
+        # 调用方已持有 self.lock
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, kind, topic_id, data, timestamp=None):
+        """
+        追加一条产物记录
+        """
+        self.append_many([(kind, topic_id, data, timestamp)])
+
+    def append_many(self, records):
+        """
+        追加多条产物记录 [(类型, 帖子ID, 内容, 时间)]，全部记录写入同一个段并一次写出
+        """
+        timestamp_now = datetime.now().strftime(TIMESTAMP_FORMAT)
+        lines = []
+        for kind, topic_id, data, timestamp in records:
+            record = {
+                'kind': kind,
+                'topic_id': topic_id,
+                'timestamp': timestamp or timestamp_now,
+                'data': data
+            }
+            lines.append((kind, topic_id, (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')))
+        if not lines:
+            return
+        size = sum(len(line) for _, _, line in lines)
+        with self.lock:
+            path = self._segment_path(self.segment)
+            if os.path.exists(path) and os.path.getsize(path) > 0 and \
+                    os.path.getsize(path) + size > self.max_segment_bytes:
+                self.segment += 1
+                path = self._segment_path(self.segment)
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(b''.join(line for _, _, line in lines))
+            entries = []
+            for kind, topic_id, line in lines:
+                entries.append((topic_id, kind, self.segment, offset, len(line)))
+                offset += len(line)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.writelines('\t'.join(str(value) for value in entry) + '\n' for entry in entries)
+            for entry in entries:
+                self._add_to_index(*entry)
+
+    def read(self, topic_id, kind=None):
+        """
+        读取帖子的全部产物记录（按写入顺序），kind 指定时只返回该类型
+        """
+        with self.lock:
+            entries = [entry for entry in self.index.get(str(topic_id), []) if kind is None or entry[0] == kind]
+        records = []
+        for _, segment, offset, length in entries:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                records.append(json.loads(f.read(length)))
+        return records
+
+    def _newest_timestamp(self, segment):
+        """
+        段中最新一条记录的时间，无法解析任何记录的时间时返回None
+        """
+        if segment not in self.segment_newest:
+            newest = None
+            with open(self._segment_path(segment), 'rb') as f:
+                for raw in f:
+                    try:
+                        value = datetime.strptime(json.loads(raw).get('timestamp'), TIMESTAMP_FORMAT)
+                    except (ValueError, TypeError):
+                        continue
+                    newest = value if newest is None or value > newest else newest
+            self.segment_newest[segment] = newest
+        return self.segment_newest[segment]
+
+    def prune(self, max_age_days, now=None):
+        """
+        删除最新记录早于 max_age_days 天的已滚动段，并从索引中去掉指向这些段的记录，返回删除的段数
+
+        当前正在写入的段不删除；段中没有可解析时间的记录时保留。
+        """
+        if not max_age_days:
+            return 0
+        cutoff = (now or datetime.now()) - timedelta(days=max_age_days)
+        with self.lock:
+            expired = set()
+            for segment in self._segment_numbers():
+                if segment == self.segment:
+                    continue
+                newest = self._newest_timestamp(segment)
+                if newest is not None and newest < cutoff:
+                    expired.add(segment)
+            if not expired:
+                return 0
+            index = {}
+            records = 0
+            lines = []
+            for topic_id, entries in self.index.items():
+                kept = [entry for entry in entries if entry[1] not in expired]
+                if kept:
+                    index[topic_id] = kept
+                    records += len(kept)
+                    lines.extend(f"{topic_id}\t{kind}\t{segment}\t{offset}\t{length}\n"
+                                 for kind, segment, offset, length in kept)
+            # 先更新索引再删除段文件，中断时最多留下没有索引指向的段
+            self._write_index(lines)
+            self.index = index
+            self.records = records
+            for segment in sorted(expired):
+                os.remove(self._segment_path(segment))
+                self.segment_newest.pop(segment, None)
+        logger.info(f"已删除 {len(expired)} 个过期的产物日志段")
+        return len(expired)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'records': self.records,
+                'topics': len(self.index),
+                'segment': self.segment
+            }
+
+
+def compact_directory(source_dir, artifact_log, delete=False):
+    """
+    将 forum_data_dir 中旧的 search_results_topic_*.json 和 retrieval_results_*.json
+    按时间顺序写入产物日志，delete 为True时写入成功后删除原文件，返回迁移的文件数
+
+    每个文件的全部记录一次写入，写入后把文件名追加到产物日志目录的 migrated.txt，
+    重复执行时跳过已迁移的文件。
+    """
+    manifest_path = os.path.join(artifact_log.directory, MIGRATED_FILE)
+    done = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            done = {line.rstrip('\n') for line in f if line.strip()}
+
+    files = []
+    for name in os.listdir(source_dir):
+        if name in done:
+            continue
+        match = _SEARCH_FILE_PATTERN.match(name)
+        if match:
+            files.append((match.group(2), name, 'search'))
+            continue
+        match = _RETRIEVAL_FILE_PATTERN.match(name)
+        if match:
+            files.append((match.group(1), name, 'retrieval'))
+
+    migrated = 0
+    for timestamp, name, kind in sorted(files):
+        path = os.path.join(source_dir, name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if kind == 'search':
+                records = [(kind, data.get('topic_id'), data, timestamp)]
+            else:
+                # 一个检索结果文件中可能包含多个帖子，每个帖子一条记录
+                records = [(kind, result.get('topic_id'), result, timestamp)
+                           for result in (data if isinstance(data, list) else [data])]
+            artifact_log.append_many(records)
+            with open(manifest_path, 'a', encoding='utf-8') as f:
+                f.write(name + '\n')
+        except Exception as e:
+            logger.error(f"迁移产物文件 {path} 时出错: {e}")
+            continue
+        if delete:
+            os.remove(path)
+        migrated += 1
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将单文件JSON产物合并到JSONL产物日志')
+    parser.add_argument('source_dir', help='旧产物所在目录（forum_data_dir）')
+    parser.add_argument('--log-dir', default=None, help='产物日志目录，默认为 source_dir/artifacts')
+    parser.add_argument('--max-segment-mb', type=int, default=64, help='单个段文件的最大大小（MB）')
+    parser.add_argument('--delete', action='store_true', help='迁移成功后删除原文件')
+    parser.add_argument('--rebuild-index', action='store_true', help='只重建产物日志的偏移索引')
+
+    args = parser.parse_args()
+    log_dir = args.log_dir or os.path.join(args.source_dir, 'artifacts')
+    artifact_log = ArtifactLog(log_dir, args.max_segment_mb * 1024 * 1024)
+    if args.rebuild_index:
+        artifact_log.rebuild_index()
+        return
+    migrated = compact_directory(args.source_dir, artifact_log, delete=args.delete)
+    logger.info(f"已将 {migrated} 个产物文件合并到 {log_dir}")
+
+
+if __name__ == "__main__":
+    main()
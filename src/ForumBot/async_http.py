@@ -0,0 +1,45 @@
+import httpx
+
+
+def build_async_http_client(config, verify=True, timeout=30):
+    """
+    创建带连接池的异步HTTP客户端，连接池大小由 async_io 配置控制
+
+    httpx 的SSL校验设置在客户端级别，需要不同校验设置时分别创建客户端。
+    """
+    async_config = config.get('async_io', {})
+    limits = httpx.Limits(
+        max_connections=async_config.get('max_connections', 200),
+        max_keepalive_connections=async_config.get('max_keepalive_connections', 50),
+        keepalive_expiry=async_config.get('keepalive_expiry', 30)
+    )
+    return httpx.AsyncClient(verify=verify, limits=limits, timeout=timeout)
+
+
+class AsyncHttpClientMixin:
+    """
+    按SSL校验设置缓存异步HTTP客户端，同一事件循环内复用连接
+    """
+    def _get_http_client(self, verify):
+        if not hasattr(self, '_http_clients'):
+            self._http_clients = {}
+        client = self._http_clients.get(verify)
+        if client is None:
+            client = build_async_http_client(self.config, verify)
+            self._http_clients[verify] = client
+        return client
+
+    async def close(self):
+        """
+        关闭所有异步HTTP客户端
+        """
+        for client in getattr(self, '_http_clients', {}).values():
+            await client.aclose()
+        self._http_clients = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+        return False
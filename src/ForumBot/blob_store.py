@@ -0,0 +1,156 @@
+import hashlib
+import re
+import threading
+import zlib
+from psycopg2.extras import execute_values
+from .logging_config import main_logger as logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 按 ```json 代码块切分检索上下文：每个JSON块单独成段，块之间的标题和说明文字合并为一段
+_JSON_BLOCK_PATTERN = re.compile(r"(```json\s.*?```)", re.DOTALL)
+
+
+def split_sections(text):
+    """
+    将检索上下文切分为若干段，按顺序拼接后与原文完全一致
+
+    LightRAG 返回的实体、关系、文档块以及提示词模板在不同帖子之间经常整段重复，
+    按段存储可以让相同的段只保存一份。
+    """
+    if not text:
+        return []
+    return [part for part in _JSON_BLOCK_PATTERN.split(text) if part]
+
+
+def section_hash(section):
+    return hashlib.sha256(section.encode('utf-8')).hexdigest()
+
+
+def section_hashes(text):
+    """
+    计算检索上下文各段的内容哈希，不访问数据库
+    """
+    return [section_hash(section) for section in split_sections(text)]
+
+
+class BlobStore:
+    """
+    按内容哈希寻址的压缩存储，保存在 retrieval_blobs 表中
+
+    写入时把文本切分为段，每段以 sha256 为键压缩保存，已存在的段不再写入；
+    业务表只保存各段哈希组成的数组，读取时按顺序解压拼接还原原文。
+    codec 支持 zlib 和 zstd（需要安装 zstandard，未安装时退回 zlib）。
+    """
+    def __init__(self, codec='zlib', level=None):
+        if codec == 'zstd' and zstandard is None:
+            logger.warning("未安装 zstandard，检索上下文改用 zlib 压缩")
+            codec = 'zlib'
+        if codec not in ('zlib', 'zstd'):
+            logger.warning(f"不支持的压缩方式 {codec}，改用 zlib")
+            codec = 'zlib'
+        self.codec = codec
+        self.level = level if level is not None else (3 if codec == 'zstd' else 6)
+        self.lock = threading.Lock()
+        self.sections = 0
+        self.new_blobs = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    @staticmethod
+    def create_table(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS retrieval_blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                data BYTEA NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def _compress(self, data):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def _decompress(codec, data):
+        data = bytes(data)
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("读取 zstd 压缩的数据需要安装 zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put(self, cursor, text):
+        """
+        保存文本并返回各段哈希，只有数据库中还没有的段才会压缩写入
+        """
+        sections = {}
+        hashes = []
+        for section in split_sections(text):
+            digest = section_hash(section)
+            hashes.append(digest)
+            sections.setdefault(digest, section)
+        if not sections:
+            return hashes
+
+        # 先查询已有的段，避免重复压缩和传输；在调用方的事务内执行，回滚后也不会留下不一致
+        cursor.execute("SELECT hash FROM retrieval_blobs WHERE hash = ANY(%s)", (list(sections),))
+        existing = {row[0] for row in cursor.fetchall()}
+        rows = []
+        stored_bytes = 0
+        for digest, section in sections.items():
+            if digest in existing:
+                continue
+            raw = section.encode('utf-8')
+            data = self._compress(raw)
+            stored_bytes += len(data)
+            rows.append((digest, self.codec, len(raw), data))
+        if rows:
+            execute_values(
+                cursor,
+                "INSERT INTO retrieval_blobs (hash, codec, size, data) VALUES %s ON CONFLICT (hash) DO NOTHING",
+                rows
+            )
+
+        with self.lock:
+            self.sections += len(hashes)
+            self.new_blobs += len(rows)
+            self.raw_bytes += len(text.encode('utf-8'))
+            self.stored_bytes += stored_bytes
+        return hashes
+
+    def get(self, cursor, hashes):
+        """
+        按哈希数组还原文本，缺少某段时返回None
+        """
+        if not hashes:
+            return ''
+        cursor.execute("SELECT hash, codec, data FROM retrieval_blobs WHERE hash = ANY(%s)", (list(set(hashes)),))
+        sections = {digest: self._decompress(codec, data).decode('utf-8')
+                    for digest, codec, data in cursor.fetchall()}
+        missing = [digest for digest in hashes if digest not in sections]
+        if missing:
+            logger.error(f"检索上下文缺少 {len(missing)} 个数据段: {missing[:3]}")
+            return None
+        return ''.join(sections[digest] for digest in hashes)
+
+    def get_stats(self):
+        """
+        获取写入统计：段数、新写入的段数、原文字节数和实际写入的压缩字节数
+        """
+        with self.lock:
+            return {
+                'codec': self.codec,
+                'sections': self.sections,
+                'new_blobs': self.new_blobs,
+                'dedup_rate': round(1 - self.new_blobs / self.sections, 4) if self.sections else 0.0,
+                'raw_bytes': self.raw_bytes,
+                'stored_bytes': self.stored_bytes,
+                'compression_ratio': round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else 0.0
+            }
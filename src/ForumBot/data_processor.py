@@ -1,16 +1,27 @@
 import csv
+import io
 import json
 import os
 from datetime import datetime
 import time
+import threading
 import requests
-from bs4 import BeautifulSoup
 from .logging_config import main_logger as logger
 import pytz
 import psycopg2
 from psycopg2.extras import Json, execute_values
 from .image_processor import ImageProcessor
+from .http_cache import get_json
+from .seen_index import SeenTopicIndex
+from .db_pool import DatabasePool
+from .write_behind import WriteBehindWriter, write_json_file
+from .blob_store import BlobStore, section_hashes
+from .retention import PARTITIONED_TABLES, partition_table
+from .segment_store import SegmentStore
+from .artifact_log import ArtifactLog
+from .html_text import text_with_image_links
 import re
+from urllib.parse import quote
 import pandas as pd
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -56,12 +67,13 @@ The answer must integrate relevant facts from the Knowledge Graph and Document C
 """
 
 
-def fetch_topic_details(topic_id, config=None):
+def fetch_topic_details(topic_id, config=None, rate_limiter=None):
     """
     根据 topic_id 获取单个帖子的详细内容。
 
     参数:
         topic_id (int): 帖子的 ID。
+        rate_limiter (TokenBucketRateLimiter): 可选的共享限流器，传入时由限流器控制请求节奏，不再固定休眠
 
     返回:
         dict or None: 如果请求成功，返回包含详细内容的字典；否则返回 None。
@@ -77,36 +89,147 @@ def fetch_topic_details(topic_id, config=None):
     request_delay = config.get('forum', {}).get('request_delay', 0.1)
     verify_ssl = config.get('forum', {}).get('verify_ssl', True)
     try:
-        response = requests.get(url, verify=verify_ssl, timeout=30)
-        response.raise_for_status()  # 检查响应状态码是否为 2xx
+        # 检查响应状态码是否为 2xx，并返回解析后的 JSON 数据（304时复用缓存）
+        if rate_limiter is not None:
+            with rate_limiter:
+                return get_json(url, config, verify=verify_ssl, timeout=30)
+        data = get_json(url, config, verify=verify_ssl, timeout=30)
         time.sleep(request_delay)  # 每次请求后暂停0.1秒
-        return response.json()  # 返回解析后的 JSON 数据
+        return data
     except requests.exceptions.RequestException as e:
         # 如果是 429 错误，提示用户增加请求间隔或使用代理
         logger.error(f"请求帖子 {topic_id} 时出错: {e}")
         return None
 
 
-def fetch_all_forum_topics(config):
-    # 如果没有传入配置，则加载默认配置
-    if config is None:
-        logger.error("未提供配置文件")
-        return []
+def parse_discourse_time(time_str):
+    """
+    解析Discourse返回的ISO时间字符串（如 2025-09-01T08:00:00.000Z），失败时返回None
+    """
+    if not time_str:
+        return None
+    try:
+        return datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
 
-    base_url = config.get('forum', {}).get('base_url', '') + "/latest.json"
-    page = 0
-    all_topics = []
 
+def _is_older_than_mark(topic, mark_time, mark_topic_id):
+    """
+    判断帖子是否早于增量轮询高水位：bumped_at不晚于高水位且ID不大于已见过的最大ID
+    """
+    bumped_at = parse_discourse_time(topic.get('bumped_at'))
+    if bumped_at is None:
+        return False
+    return bumped_at <= mark_time and int(topic.get('id', 0)) <= mark_topic_id
+
+
+def _filter_topics(topics, required_tags, cutoff_date):
+    """
+    按所需标签（子串匹配）和创建时间过滤帖子
+    """
+    filtered_topics = []
+    for topic in topics:
+        # 检查标签是否包含所需标签
+        topic_tags = topic.get('tags', [])
+        if isinstance(topic_tags, list):
+            topic_tags_str = ','.join(topic_tags)
+        else:
+            topic_tags_str = str(topic_tags)
+
+        # 检查是否有任何一个所需的标签存在于帖子标签中
+        tag_matched = False
+        for required_tag in required_tags:
+            if required_tag in topic_tags_str:
+                tag_matched = True
+                break
+
+        if not tag_matched:
+            continue  # 如果不包含任何所需标签，则跳过
+
+        # 检查创建时间是否在指定日期之后
+        created_at_str = topic.get('created_at', '')
+        if created_at_str:
+            try:
+                # 解析创建时间
+                created_at = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%fZ')
+                created_at = pytz.utc.localize(created_at)  # 设置为UTC时区
+
+                # 只处理创建时间在指定日期之后的帖子
+                if created_at >= cutoff_date:
+                    filtered_topics.append(topic)
+            except ValueError:
+                # 如果日期解析失败，默认添加该帖子
+                logger.warning(f"无法解析帖子 {topic.get('id')} 的创建时间: {created_at_str}")
+                filtered_topics.append(topic)
+    return filtered_topics
+
+
+def _monitor_filters(config):
+    """
+    从配置中读取监控的标签和起始日期
+    """
     # 获取过滤条件 - 支持多个标签
     required_tags = config['monitor'].get('required_tag', [])
-    # 获取SSL验证设置
-    verify_ssl = config.get('forum', {}).get('verify_ssl', True)
-    request_delay = config.get('forum', {}).get('request_delay', 0.1)
 
     # 设置过滤日期 (2025年9月1日)
     cutoff_date = datetime.strptime(config['monitor']['topic_cutoff_date'], '%Y-%m-%d')
     cutoff_date = pytz.utc.localize(cutoff_date)  # 设置为UTC时区
+    return required_tags, cutoff_date
+
+
+def filter_monitored_topics(topics, config):
+    """
+    按监控配置的标签和起始日期过滤帖子，与轮询时的过滤条件一致（用于webhook推送的帖子）
+    """
+    required_tags, cutoff_date = _monitor_filters(config)
+    return _filter_topics(topics, required_tags, cutoff_date)
+
+
+def _new_crawl_stats(since):
+    """
+    初始化一次爬取的统计信息
+    """
+    return {
+        'pages_fetched': 0,
+        'topics_skipped': 0,
+        'completed': False,
+        'failed_page': None,
+        'max_bumped_at': since.get('bumped_at') if since else None,
+        'max_topic_id': int(since.get('topic_id', 0)) if since else 0,
+    }
+
+
+def _merge_crawl_stats(stats, feed_stats):
+    """
+    将单个列表源的统计合并到本轮汇总统计中
+    """
+    stats['pages_fetched'] += feed_stats['pages_fetched']
+    stats['topics_skipped'] += feed_stats['topics_skipped']
+    stats['max_topic_id'] = max(stats['max_topic_id'], feed_stats['max_topic_id'])
+    merged_time = parse_discourse_time(stats['max_bumped_at'])
+    feed_time = parse_discourse_time(feed_stats['max_bumped_at'])
+    if feed_time is not None and (merged_time is None or feed_time > merged_time):
+        stats['max_bumped_at'] = feed_stats['max_bumped_at']
+
 
+def _crawl_topic_listing(listing_url, config, since, stats, required_tags, cutoff_date):
+    """
+    逐页爬取一个Discourse帖子列表（/latest.json 或标签列表），返回过滤后的帖子
+
+    增量模式下（since不为空）跳过早于高水位的帖子，并在整页都早于高水位时停止翻页。
+    统计信息写入stats，只有正常翻到结束条件时 stats['completed'] 才为True。
+    """
+    mark_time = parse_discourse_time(since.get('bumped_at')) if since else None
+    mark_topic_id = int(since.get('topic_id', 0)) if since else 0
+    max_bumped_time = parse_discourse_time(stats['max_bumped_at'])
+
+    # 获取SSL验证设置
+    verify_ssl = config.get('forum', {}).get('verify_ssl', True)
+    request_delay = config.get('forum', {}).get('request_delay', 0.1)
+
+    page = 0
+    all_topics = []
     while True:
         params = {
             "no_definitions": "true",
@@ -115,68 +238,144 @@ def fetch_all_forum_topics(config):
 
         try:
             time.sleep(request_delay)
-            response = requests.get(base_url, params=params, verify=verify_ssl, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = get_json(listing_url, config, params=params, verify=verify_ssl, timeout=30)
+            stats['pages_fetched'] += 1
 
             topic_list = data.get("topic_list", {})
             topics = topic_list.get("topics", [])
 
             if not topics:
                 logger.info(f"第 {page} 页没有更多帖子，结束爬取。")
+                stats['completed'] = True
                 break
-            # 对当前页的帖子进行过滤
-            filtered_topics = []
+
+            # 记录本页看到的最大bumped_at和ID，作为下一轮的高水位
             for topic in topics:
-                # 检查标签是否包含所需标签
-                topic_tags = topic.get('tags', [])
-                if isinstance(topic_tags, list):
-                    topic_tags_str = ','.join(topic_tags)
-                else:
-                    topic_tags_str = str(topic_tags)
-
-                # 检查是否有任何一个所需的标签存在于帖子标签中
-                tag_matched = False
-                for required_tag in required_tags:
-                    if required_tag in topic_tags_str:
-                        tag_matched = True
-                        break
-
-                if not tag_matched:
-                    continue  # 如果不包含任何所需标签，则跳过
-
-                # 检查创建时间是否在指定日期之后
-                created_at_str = topic.get('created_at', '')
-                if created_at_str:
-                    try:
-                        # 解析创建时间
-                        created_at = datetime.strptime(created_at_str, '%Y-%m-%dT%H:%M:%S.%fZ')
-                        created_at = pytz.utc.localize(created_at)  # 设置为UTC时区
-
-                        # 只处理创建时间在指定日期之后的帖子
-                        if created_at >= cutoff_date:
-                            filtered_topics.append(topic)
-                    except ValueError:
-                        # 如果日期解析失败，默认添加该帖子
-                        logger.warning(f"无法解析帖子 {topic.get('id')} 的创建时间: {created_at_str}")
-                        filtered_topics.append(topic)
+                bumped_at = parse_discourse_time(topic.get('bumped_at'))
+                if bumped_at is not None and (max_bumped_time is None or bumped_at > max_bumped_time):
+                    max_bumped_time = bumped_at
+                    stats['max_bumped_at'] = topic.get('bumped_at')
+                stats['max_topic_id'] = max(stats['max_topic_id'], int(topic.get('id', 0)))
+
+            # 增量模式下跳过早于高水位的帖子（上一轮已经见过）
+            if mark_time is not None:
+                older_flags = [_is_older_than_mark(topic, mark_time, mark_topic_id) for topic in topics]
+                stats['topics_skipped'] += sum(older_flags)
+                # 置顶帖子会一直出现在第一页，不参与是否继续翻页的判断
+                page_all_older = all(
+                    older for topic, older in zip(topics, older_flags) if not topic.get('pinned', False)
+                )
+                topics = [topic for topic, older in zip(topics, older_flags) if not older]
+            else:
+                page_all_older = False
 
+            # 对当前页的帖子进行过滤
+            filtered_topics = _filter_topics(topics, required_tags, cutoff_date)
             all_topics.extend(filtered_topics)
 
             logger.info(f"已获取第 {page} 页的 {len(filtered_topics)} 个符合条件的帖子。")
-            # if len(filtered_topics) < 1:
-            #     logger.info(f"当前页已获取的帖子数量为0，结束爬取。")
-            #     break
+
+            if page_all_older:
+                logger.info(f"第 {page} 页的帖子均早于上次轮询高水位，结束爬取。")
+                stats['completed'] = True
+                break
 
             page += 1
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"请求第 {page} 页时出错: {e}")
+            # 重试用尽后仍然失败，本轮结果不完整，不推进高水位，下一轮从头补齐
+            stats['failed_page'] = page
+            logger.error(f"请求第 {page} 页时出错: {e}，本轮爬取未完成")
             break
 
     return all_topics
 
 
+def _tag_listing_url(config, tag):
+    """
+    构造标签列表地址，配置了 monitor.tag_feed_category 时只取该分类下的标签帖子
+    """
+    base_url = config.get('forum', {}).get('base_url', '')
+    category = config['monitor'].get('tag_feed_category')
+    quoted_tag = quote(tag, safe='')
+    if category:
+        return f"{base_url}/tags/c/{category}/{quoted_tag}/l/latest.json"
+    return f"{base_url}/tag/{quoted_tag}/l/latest.json"
+
+
+def fetch_all_forum_topics(config, since=None, stats=None):
+    """
+    获取论坛中符合标签和日期条件的帖子
+
+    monitor.crawl_mode 为 'tag_feeds' 时只请求所需标签的列表接口，合并去重后返回；
+    任一标签列表不可用时回退为爬取 /latest.json 并在本地过滤。
+
+    参数:
+        config (dict): 配置
+        since (dict): 增量轮询高水位 {'bumped_at': str, 'topic_id': int}；为空时全量爬取全部页面
+        stats (dict): 可选，用于回传本轮爬取统计：pages_fetched、topics_skipped、completed、
+                      max_bumped_at、max_topic_id、failed_page（请求失败的页码）
+
+    返回:
+        list: 符合条件的帖子列表
+    """
+    # 如果没有传入配置，则加载默认配置
+    if config is None:
+        logger.error("未提供配置文件")
+        return []
+
+    if stats is None:
+        stats = {}
+    stats.update(_new_crawl_stats(since))
+
+    required_tags, cutoff_date = _monitor_filters(config)
+
+    if config['monitor'].get('crawl_mode', 'latest') == 'tag_feeds' and required_tags:
+        topics = _fetch_tag_feed_topics(config, since, stats, required_tags, cutoff_date)
+        if topics is not None:
+            return topics
+        logger.warning("标签列表不可用，回退为爬取全部帖子后本地过滤")
+        # 保留回退前已请求的页数，便于评估本轮的真实开销
+        pages_fetched = stats['pages_fetched']
+        stats.update(_new_crawl_stats(since))
+        stats['pages_fetched'] = pages_fetched
+
+    base_url = config.get('forum', {}).get('base_url', '') + "/latest.json"
+    return _crawl_topic_listing(base_url, config, since, stats, required_tags, cutoff_date)
+
+
+def _fetch_tag_feed_topics(config, since, stats, required_tags, cutoff_date):
+    """
+    逐个请求所需标签的列表接口，合并并按ID去重
+
+    注意标签列表是按标签名精确匹配的，而本地过滤是子串匹配，required_tag 需配置为完整的标签名。
+
+    返回:
+        list or None: 帖子列表（按bumped_at倒序）；任一标签列表请求失败时返回None
+    """
+    merged_topics = {}
+    for tag in required_tags:
+        feed_stats = _new_crawl_stats(since)
+        topics = _crawl_topic_listing(_tag_listing_url(config, tag), config, since, feed_stats,
+                                      required_tags, cutoff_date)
+        if not feed_stats['completed']:
+            logger.warning(f"标签 {tag} 的列表接口不可用")
+            stats['pages_fetched'] += feed_stats['pages_fetched']
+            return None
+        _merge_crawl_stats(stats, feed_stats)
+        for topic in topics:
+            merged_topics.setdefault(int(topic['id']), topic)
+        logger.info(f"标签 {tag} 获取到 {len(topics)} 个符合条件的帖子")
+
+    stats['completed'] = True
+    epoch = datetime.min.replace(tzinfo=pytz.utc)
+    return sorted(
+        merged_topics.values(),
+        key=lambda topic: parse_discourse_time(topic.get('bumped_at')) or epoch,
+        reverse=True
+    )
+
+
 def format_search_results_as_json(search_results):
     """
     将搜索结果格式化为JSON字符串
@@ -245,44 +444,59 @@ def process_html_content_with_image_links(html_content):
     """
     if pd.isna(html_content) or not isinstance(html_content, str):
         return html_content  # 或者返回空字符串 ""，根据需求决定
-    # 解析HTML内容
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # 创建副本以避免修改原始soup
-    soup_copy = BeautifulSoup(str(soup), 'html.parser')
-
-    # 替换img标签为文本格式的图片链接
-    img_tags = soup_copy.find_all('img')
-    for img in img_tags:
-        img_src = img.get('src')
-        if img_src:
-            # 将图片标签替换为只包含链接的文本格式
-            img.replace_with(f"[img: ({img_src})]")
-
-    # 替换lightbox链接为文本格式
-    lightbox_links = soup_copy.find_all('a', class_='lightbox')
-    for link in lightbox_links:
-        href = link.get('href')
-        if href:
-            # 将链接替换为只包含链接的文本格式
-            link.replace_with(f"[img: ({href})]")
-
-    # 提取处理后的文本内容
-    text_content = soup_copy.get_text(strip=False)
-    # 清理多余的空白字符和换行符
-    text_content = re.sub(r'\n+', '\n', text_content).strip()
-
-    # 处理上传的图片标记 (如 upload://...)
-    upload_images = re.findall(r'\(upload://[^\)]+\)', text_content)
-
-    return text_content
+    # 单遍解析：替换img标签和lightbox链接为文本格式的图片链接，清理多余的换行
+    return text_with_image_links(html_content)
 
 class DataProcessor:
     def __init__(self, config):
         self.config = config
         # 不再在初始化时建立数据库连接
         self.db_conn = None
+        # 启用 database.pool.enabled 时复用连接池中的连接，首次使用时创建连接池
+        self.db_pool_config = self.config.get('database', {}).get('pool', {})
+        self.db_pool = None
+        self.db_pool_lock = threading.Lock()
         self.image_processor = ImageProcessor(config)
+        # 流水线并发持久化时，保证同一CSV文件的追加写入不交错
+        self.csv_lock = threading.Lock()
+        # 已见帖子的判断方式：full 每轮从数据库加载全部ID，memory 使用常驻内存索引，
+        # db_any 只用 = ANY(...) 查询本轮候选ID
+        seen_config = self.config.get('seen_index', {})
+        self.seen_mode = seen_config.get('mode', 'full')
+        self.seen_reconcile_interval = seen_config.get('reconcile_interval', 3600)
+        self.seen_index = SeenTopicIndex()
+        # 搜索结果的存储方式：wide 每次搜索一行、结果拆成10个JSONB列；
+        # normalized 每个结果一行写入 forum_search_result_items，用COPY批量写入
+        self.search_storage = self.config.get('database', {}).get('search_storage', 'wide')
+        # 启用 database.blob_store.enabled 时检索上下文按内容哈希分段压缩存储，相同的段只保存一份
+        blob_config = self.config.get('database', {}).get('blob_store', {})
+        self.blob_store = None
+        if blob_config.get('enabled', False):
+            self.blob_store = BlobStore(codec=blob_config.get('codec', 'zlib'), level=blob_config.get('level'))
+        # 启用 segment_store.enabled 时帖子数据同时写入按列存储的Parquet段，
+        # csv_export 为False时不再追加CSV文件
+        self.segment_store_config = self.config.get('segment_store', {})
+        self.segment_stores = {}
+        self.csv_export = self.segment_store_config.get('csv_export', True) or \
+            not self.segment_store_config.get('enabled', False)
+        # 启用 artifact_log.enabled 时搜索/检索结果追加到按帖子ID索引的JSONL日志，不再每次生成一个JSON文件
+        artifact_config = self.config.get('artifact_log', {})
+        self.artifact_log = None
+        if artifact_config.get('enabled', False):
+            self.artifact_log = ArtifactLog(
+                artifact_config.get('directory') or os.path.join(self.config['paths']['forum_data_dir'], 'artifacts'),
+                max_segment_bytes=artifact_config.get('max_segment_mb', 64) * 1024 * 1024
+            )
+        # 启用 write_behind.enabled 时CSV、JSON文件和数据库写入交给后台线程执行
+        write_behind_config = self.config.get('write_behind', {})
+        self.write_behind = None
+        if write_behind_config.get('enabled', False):
+            self.write_behind = WriteBehindWriter(
+                self,
+                queue_size=write_behind_config.get('queue_size', 1000),
+                batch_size=write_behind_config.get('batch_size', 50),
+                enqueue_timeout=write_behind_config.get('enqueue_timeout', 10)
+            )
 
     def _get_db_connection(self):
         """
@@ -298,6 +512,8 @@ class DataProcessor:
                 'password': self.config['database']['password'],
                 'sslmode': self.config['database']['sslmode']
             }
+            if self.db_pool_config.get('enabled', False):
+                return self._get_db_pool(db_params).getconn()
             conn = psycopg2.connect(**db_params)
             logger.debug("数据库连接已建立")
             return conn
@@ -305,12 +521,78 @@ class DataProcessor:
             logger.error(f"数据库连接失败: {e}")
             return None
 
+    def _get_db_pool(self, db_params):
+        """
+        获取连接池，首次调用时创建
+        """
+        with self.db_pool_lock:
+            if self.db_pool is None:
+                self.db_pool = DatabasePool(
+                    db_params,
+                    min_size=self.db_pool_config.get('min_size', 1),
+                    max_size=self.db_pool_config.get('max_size', 10),
+                    wait_timeout=self.db_pool_config.get('wait_timeout', 30),
+                    health_check_interval=self.db_pool_config.get('health_check_interval', 60)
+                )
+                logger.info(f"数据库连接池已创建，最大连接数 {self.db_pool.max_size}")
+            return self.db_pool
+
+    def _defer_write(self, func, *args, **kwargs):
+        """
+        启用后台写入且不在写入线程中时，把写操作放入写入队列，返回True表示已入队
+        """
+        if self.write_behind is None or self.write_behind.in_worker():
+            return False
+        self.write_behind.enqueue('call', func, args, kwargs)
+        return True
+
+    def _in_transaction(self, write, *args):
+        """
+        在一个事务中执行 write(cursor, *args) 并提交，出错时回滚并抛出异常（后台写入线程据此统计失败）
+        """
+        conn = self._get_db_connection()
+        if not conn:
+            raise ConnectionError("无法建立数据库连接")
+        try:
+            cursor = conn.cursor()
+            result = write(cursor, *args)
+            conn.commit()
+            cursor.close()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._close_db_connection(conn)
+
+    def flush_writes(self):
+        """
+        等待后台写入队列中的记录全部写完，读取数据库前调用以保证读到已提交的写入
+        """
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def get_write_behind_stats(self):
+        """
+        获取后台写入统计，未启用时返回空字典
+        """
+        return self.write_behind.get_stats() if self.write_behind is not None else {}
+
+    def get_db_pool_stats(self):
+        """
+        获取连接池统计，未启用连接池时返回空字典
+        """
+        return self.db_pool.get_stats() if self.db_pool is not None else {}
+
     def _close_db_connection(self, conn):
         """
         关闭数据库连接
         """
         if conn:
             try:
+                if self.db_pool is not None:
+                    self.db_pool.putconn(conn)
+                    return
                 conn.close()
                 logger.debug("数据库连接已关闭")
             except Exception as e:
@@ -341,6 +623,40 @@ class DataProcessor:
         finally:
             self._close_db_connection(conn)
 
+    def get_answered_topics(self, min_id=0, since=None, answer_prefix=''):
+        """
+        获取ID大于 min_id、创建时间不早于 since 且回答以 answer_prefix 开头的已处理帖子，按ID排序
+
+        Returns:
+            list: [(id, title, user_question, llm_answer, created_at)]，出错时返回空列表
+        """
+        query = """
+            SELECT id, title, user_question, llm_answer, created_at
+            FROM processed_forum_topics
+            WHERE id > %s AND llm_answer LIKE %s
+        """
+        params = [min_id or 0, answer_prefix.replace('%', r'\%').replace('_', r'\_') + '%']
+        if since is not None:
+            query += " AND created_at >= %s"
+            params.append(since)
+        query += " ORDER BY id"
+        conn = self._get_db_connection()
+        if not conn:
+            logger.error("无法建立数据库连接")
+            return []
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            cursor.close()
+            return results
+        except Exception as e:
+            logger.error(f"获取已回答的帖子时出错: {e}")
+            return []
+        finally:
+            self._close_db_connection(conn)
+
     def get_unprocessed_topics(self, processed_ids):
         """
         获取在 forum_topics 表中存在但 processed_forum_topics 表中不存在的帖子 IDs
@@ -462,6 +778,22 @@ class DataProcessor:
                                       )
                                   """)
 
+            if self.search_storage == 'normalized':
+                self._create_search_result_items_table(cursor)
+            # 启用 database.partitioning.enabled 时搜索/检索结果表按月分区，已有的普通表原地转换
+            partitioning_config = self.config.get('database', {}).get('partitioning', {})
+            if partitioning_config.get('enabled', False):
+                for table, column in PARTITIONED_TABLES.items():
+                    partition_table(cursor, table, column, partitioning_config.get('months_ahead', 2))
+
+            self._create_indexes(cursor)
+            if self.blob_store is not None:
+                BlobStore.create_table(cursor)
+                cursor.execute("ALTER TABLE forum_retrieval_results ADD COLUMN IF NOT EXISTS blob_hashes TEXT[]")
+            if self.search_storage == 'normalized':
+                self._create_search_result_item_indexes(cursor)
+                self._migrate_wide_search_results(cursor)
+
             conn.commit()
             cursor.close()
             logger.info("数据库表创建成功")
@@ -471,6 +803,72 @@ class DataProcessor:
         finally:
             self._close_db_connection(conn)
 
+    def _create_indexes(self, cursor):
+        """
+        为按帖子查询的辅助表创建 topic_id 索引，并为 consume_tokens_topic 补上唯一约束
+        """
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forum_search_results_topic_id "
+                       "ON forum_search_results (topic_id, search_timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_forum_retrieval_results_topic_id "
+                       "ON forum_retrieval_results (topic_id, created_at)")
+
+        # save_token_usage_to_db 使用 ON CONFLICT (topic_id)，需要 topic_id 上的唯一索引
+        cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'uq_consume_tokens_topic_topic_id'")
+        if cursor.fetchone() is None:
+            # 先清理重复记录，每个帖子只保留最新一条
+            cursor.execute("""
+                DELETE FROM consume_tokens_topic a
+                USING consume_tokens_topic b
+                WHERE a.topic_id = b.topic_id AND a.id < b.id
+            """)
+            if cursor.rowcount:
+                logger.info(f"清理了 {cursor.rowcount} 条重复的token使用量记录")
+            cursor.execute("CREATE UNIQUE INDEX uq_consume_tokens_topic_topic_id ON consume_tokens_topic (topic_id)")
+
+    def _create_search_result_items_table(self, cursor):
+        """
+        创建每个搜索结果一行的规范化表，search_id 对应 forum_search_results 中的一次搜索
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS forum_search_result_items (
+                id BIGSERIAL PRIMARY KEY,
+                search_id INTEGER NOT NULL,
+                topic_id INTEGER NOT NULL,
+                search_keyword TEXT,
+                search_timestamp TIMESTAMP,
+                rank SMALLINT NOT NULL,
+                result JSONB NOT NULL
+            )
+        """)
+
+    def _create_search_result_item_indexes(self, cursor):
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_result_items_topic_id "
+                       "ON forum_search_result_items (topic_id, search_timestamp DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_result_items_search_id "
+                       "ON forum_search_result_items (search_id, rank)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_result_items_rank "
+                       "ON forum_search_result_items (rank)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_result_items_timestamp "
+                       "ON forum_search_result_items (search_timestamp)")
+
+    def _migrate_wide_search_results(self, cursor):
+        """
+        将宽表 result_1..result_10 中尚未迁移的搜索结果展开为规范化表的行，可重复执行
+        """
+        rank_values = ", ".join(f"({rank}, s.result_{rank})" for rank in range(1, 11))
+        cursor.execute(f"""
+            INSERT INTO forum_search_result_items
+                (search_id, topic_id, search_keyword, search_timestamp, rank, result)
+            SELECT s.id, s.topic_id, s.search_keyword, s.search_timestamp, v.rank, v.result
+            FROM forum_search_results s
+            CROSS JOIN LATERAL (VALUES {rank_values}) AS v(rank, result)
+            WHERE v.result IS NOT NULL
+              AND s.topic_id IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM forum_search_result_items i WHERE i.search_id = s.id)
+        """)
+        if cursor.rowcount:
+            logger.info(f"已将 {cursor.rowcount} 条搜索结果从宽表迁移到 forum_search_result_items")
+
     def append_to_db(self, data, table_name='forum_topics'):
         """
         将数据插入到数据库表中
@@ -478,202 +876,350 @@ class DataProcessor:
         if not data:
             logger.info("没有数据需要插入")
             return
-
-        conn = self._get_db_connection()
-        if not conn:
-            logger.error("无法建立数据库连接")
+        if self._defer_write(self._save_topics, [dict(row) for row in data], table_name):
             return
-
         try:
-            cursor = conn.cursor()
-
-            # 准备插入数据
-            insert_data = []
-            for row in data:
-                # 处理 replies 字段
-                replies = row.get('replies', [])
-                if isinstance(replies, list):
-                    replies_json = Json(replies)
-                else:
-                    replies_json = replies
-
-                insert_data.append((
-                    int(row['id']),
-                    row.get('title', ''),
-                    row.get('user_question', ''),
-                    row.get('best_answer', ''),
-                    row.get('tags', ''),
-                    replies_json,
-                    row.get('created_at'),
-                    row.get('llm_answer', ''),
-                    row.get('summary_question', '')
-                ))
-
-            # 批量插入数据
-            insert_query = f"""
-                   INSERT INTO {table_name} 
-                   (id, title, user_question, best_answer, tags, replies, created_at, llm_answer, summary_question)
-                   VALUES %s
-                   ON CONFLICT (id) 
-                   DO UPDATE SET
-                       title = EXCLUDED.title,
-                       user_question = EXCLUDED.user_question,
-                       best_answer = EXCLUDED.best_answer,
-                       tags = EXCLUDED.tags,
-                       replies = EXCLUDED.replies,
-                       created_at = EXCLUDED.created_at,
-                       llm_answer = EXCLUDED.llm_answer,
-                       summary_question = EXCLUDED.summary_question
-               """
-
-            execute_values(cursor, insert_query, insert_data)
-            conn.commit()
-            cursor.close()
-
-            logger.info(f"成功插入/更新 {len(data)} 条数据到 {table_name} 表")
+            self._save_topics(data, table_name)
         except Exception as e:
             logger.error(f"插入数据到数据库时出错: {e}")
-            conn.rollback()
-        finally:
-            self._close_db_connection(conn)
+
+    def _save_topics(self, data, table_name):
+        """
+        插入或更新帖子数据并提交，出错时抛出异常
+        """
+        topic_ids = self._in_transaction(self._insert_topics, data, table_name)
+        self._mark_topics_seen(table_name, topic_ids)
+        logger.info(f"成功插入/更新 {len(data)} 条数据到 {table_name} 表")
+
+    def _insert_topics(self, cursor, data, table_name):
+        """
+        批量插入或更新帖子数据，返回写入的帖子ID
+        """
+        # 准备插入数据
+        insert_data = []
+        for row in data:
+            # 处理 replies 字段
+            replies = row.get('replies', [])
+            if isinstance(replies, list):
+                replies_json = Json(replies)
+            else:
+                replies_json = replies
+
+            insert_data.append((
+                int(row['id']),
+                row.get('title', ''),
+                row.get('user_question', ''),
+                row.get('best_answer', ''),
+                row.get('tags', ''),
+                replies_json,
+                row.get('created_at'),
+                row.get('llm_answer', ''),
+                row.get('summary_question', '')
+            ))
+
+        # 批量插入数据
+        insert_query = f"""
+               INSERT INTO {table_name} 
+               (id, title, user_question, best_answer, tags, replies, created_at, llm_answer, summary_question)
+               VALUES %s
+               ON CONFLICT (id) 
+               DO UPDATE SET
+                   title = EXCLUDED.title,
+                   user_question = EXCLUDED.user_question,
+                   best_answer = EXCLUDED.best_answer,
+                   tags = EXCLUDED.tags,
+                   replies = EXCLUDED.replies,
+                   created_at = EXCLUDED.created_at,
+                   llm_answer = EXCLUDED.llm_answer,
+                   summary_question = EXCLUDED.summary_question
+           """
+
+        execute_values(cursor, insert_query, insert_data)
+        return [row[0] for row in insert_data]
+
+    def _mark_topics_seen(self, table_name, topic_ids):
+        """
+        forum_topics 写入成功后更新常驻内存的已见帖子索引
+        """
+        if table_name == 'forum_topics' and self.seen_index.loaded_at is not None:
+            self.seen_index.add_many(topic_ids)
 
     def save_search_results_to_db(self, topic_id, search_results, search_keyword):
         """
         将搜索结果保存到数据库
         """
-        conn = self._get_db_connection()
-        if not conn:
-            logger.error("无法建立数据库连接")
+        if self._defer_write(self._save_search_results, topic_id, search_results, search_keyword):
             return
-
         try:
-            cursor = conn.cursor()
-
-            # 限制结果数量为10个
-            limited_results = search_results[:10]
+            self._save_search_results(topic_id, search_results, search_keyword)
+        except Exception as e:
+            logger.error(f"保存搜索结果到数据库时出错: {e}")
 
-            # 将结果拆分成10个列，不足的用NULL填充
-            result_columns = [None] * 10
-            for i, result in enumerate(limited_results):
-                result_columns[i] = Json(result)
+    def _save_search_results(self, topic_id, search_results, search_keyword):
+        """
+        保存一条搜索结果并提交，出错时抛出异常
+        """
+        self._in_transaction(self._insert_search_results, topic_id, search_results, search_keyword)
+        logger.info(f"主题 {topic_id} 的搜索结果已保存到数据库")
 
-            # 插入数据
-            insert_query = """
-                   INSERT INTO forum_search_results 
-                   (topic_id, search_keyword, search_timestamp, total_results, displayed_results, 
-                    result_1, result_2, result_3, result_4, result_5, 
-                    result_6, result_7, result_8, result_9, result_10)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-               """
+    def _insert_search_results(self, cursor, topic_id, search_results, search_keyword, item_rows=None):
+        """
+        插入一条搜索结果记录
 
+        规范化存储时只在 forum_search_results 中写入搜索本身，结果逐条用COPY写入
+        forum_search_result_items；传入 item_rows 时结果行追加到其中，由调用方统一COPY。
+        """
+        # 限制结果数量为10个
+        limited_results = search_results[:10]
+        if self.search_storage == 'normalized':
             timestamp = datetime.now()
+            cursor.execute("""
+                INSERT INTO forum_search_results
+                (topic_id, search_keyword, search_timestamp, total_results, displayed_results)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            """, (topic_id, search_keyword, timestamp, len(search_results), len(limited_results)))
+            search_id = cursor.fetchone()[0]
+            rows = [
+                (search_id, topic_id, search_keyword, timestamp, rank, result)
+                for rank, result in enumerate(limited_results, 1)
+            ]
+            if item_rows is not None:
+                item_rows.extend(rows)
+            else:
+                self._copy_search_result_items(cursor, rows)
+            return
 
-            cursor.execute(insert_query, (
+        # 将结果拆分成10个列，不足的用NULL填充
+        result_columns = [None] * 10
+        for i, result in enumerate(limited_results):
+            result_columns[i] = Json(result)
+
+        # 插入数据
+        insert_query = """
+               INSERT INTO forum_search_results 
+               (topic_id, search_keyword, search_timestamp, total_results, displayed_results, 
+                result_1, result_2, result_3, result_4, result_5, 
+                result_6, result_7, result_8, result_9, result_10)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+           """
+
+        timestamp = datetime.now()
+
+        cursor.execute(insert_query, (
+            topic_id,
+            search_keyword,
+            timestamp,
+            len(search_results),
+            len(limited_results),
+            result_columns[0],
+            result_columns[1],
+            result_columns[2],
+            result_columns[3],
+            result_columns[4],
+            result_columns[5],
+            result_columns[6],
+            result_columns[7],
+            result_columns[8],
+            result_columns[9]
+        ))
+
+    def _copy_search_result_items(self, cursor, rows):
+        """
+        使用 COPY 批量写入规范化的搜索结果行
+        """
+        if not rows:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for search_id, topic_id, search_keyword, timestamp, rank, result in rows:
+            writer.writerow([
+                search_id,
                 topic_id,
                 search_keyword,
-                timestamp,
-                len(search_results),
-                len(limited_results),
-                result_columns[0],
-                result_columns[1],
-                result_columns[2],
-                result_columns[3],
-                result_columns[4],
-                result_columns[5],
-                result_columns[6],
-                result_columns[7],
-                result_columns[8],
-                result_columns[9]
-            ))
-
-            conn.commit()
-            cursor.close()
-            logger.info(f"主题 {topic_id} 的搜索结果已保存到数据库")
-        except Exception as e:
-            logger.error(f"保存搜索结果到数据库时出错: {e}")
-            conn.rollback()
-        finally:
-            self._close_db_connection(conn)
+                timestamp.isoformat(sep=' '),
+                rank,
+                json.dumps(result, ensure_ascii=False)
+            ])
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY forum_search_result_items (search_id, topic_id, search_keyword, search_timestamp, rank, result) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
 
     def save_retrieval_results_to_db(self, topic_id, related_docs):
         """
         将检索结果保存到数据库
         """
+        if self._defer_write(self._save_retrieval_results, topic_id, related_docs):
+            return
+        try:
+            self._save_retrieval_results(topic_id, related_docs)
+        except Exception as e:
+            logger.error(f"保存检索结果到数据库时出错: {e}")
+
+    def _save_retrieval_results(self, topic_id, related_docs):
+        """
+        保存一条检索结果并提交，出错时抛出异常
+        """
+        self._in_transaction(self._insert_retrieval_results, topic_id, related_docs)
+        logger.info(f"主题 {topic_id} 的检索结果已保存到数据库")
+
+    def _insert_retrieval_results(self, cursor, topic_id, related_docs):
+        """
+        插入一条检索结果记录，启用分段存储时 related_docs 留空，只保存各段哈希
+        """
+        if self.blob_store is not None:
+            cursor.execute("""
+                INSERT INTO forum_retrieval_results (topic_id, blob_hashes)
+                VALUES (%s, %s)
+            """, (topic_id, self.blob_store.put(cursor, related_docs)))
+            return
+
+        insert_query = """
+               INSERT INTO forum_retrieval_results 
+               (topic_id, related_docs)
+               VALUES (%s, %s)
+           """
+
+        cursor.execute(insert_query, (
+            topic_id,
+            related_docs
+        ))
+
+    def get_retrieval_docs(self, topic_id):
+        """
+        读取帖子最近一次保存的检索上下文，兼容原文存储和分段存储两种格式
+        """
         conn = self._get_db_connection()
         if not conn:
             logger.error("无法建立数据库连接")
-            return
+            return None
 
         try:
             cursor = conn.cursor()
-
-            # 插入数据
-            insert_query = """
-                   INSERT INTO forum_retrieval_results 
-                   (topic_id, related_docs)
-                   VALUES (%s, %s)
-               """
-
-            cursor.execute(insert_query, (
-                topic_id,
-                related_docs
-            ))
-
-            conn.commit()
+            columns = "related_docs, blob_hashes" if self.blob_store is not None else "related_docs, NULL"
+            cursor.execute(f"""
+                SELECT {columns} FROM forum_retrieval_results
+                WHERE topic_id = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+            """, (topic_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            related_docs, blob_hashes = row
+            if blob_hashes is not None:
+                related_docs = self.blob_store.get(cursor, blob_hashes)
             cursor.close()
-            logger.info(f"主题 {topic_id} 的检索结果已保存到数据库")
+            return related_docs
         except Exception as e:
-            logger.error(f"保存检索结果到数据库时出错: {e}")
-            conn.rollback()
+            logger.error(f"读取检索结果时出错: {e}")
+            return None
         finally:
             self._close_db_connection(conn)
 
+    def get_blob_store_stats(self):
+        """
+        获取检索上下文分段存储的统计，未启用时返回None
+        """
+        if self.blob_store is None:
+            return None
+        return self.blob_store.get_stats()
+
         # 在 src/data_processor.py 文件中添加新方法
     def save_token_usage_to_db(self, topic_id, token_usage):
         """
         将token使用量保存到consume_tokens_topic表中
         """
+        if self._defer_write(self._save_token_usage, topic_id, dict(token_usage)):
+            return
+        try:
+            self._save_token_usage(topic_id, token_usage)
+        except Exception as e:
+            logger.error(f"保存token使用量到数据库时出错: {e}")
+
+    def _save_token_usage(self, topic_id, token_usage):
+        """
+        保存一个帖子的token使用量并提交，出错时抛出异常
+        """
+        self._in_transaction(self._upsert_token_usage, topic_id, token_usage)
+        logger.info(f"主题 {topic_id} 的token使用量已保存到数据库")
+
+    def _upsert_token_usage(self, cursor, topic_id, token_usage):
+        """
+        插入或更新一个帖子的token使用量
+        """
+        insert_query = """
+            INSERT INTO consume_tokens_topic 
+            (topic_id, prompt_tokens, completion_tokens, total_tokens, model_calls)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (topic_id) 
+            DO UPDATE SET
+                prompt_tokens = EXCLUDED.prompt_tokens,
+                completion_tokens = EXCLUDED.completion_tokens,
+                total_tokens = EXCLUDED.total_tokens,
+                model_calls = EXCLUDED.model_calls,
+                created_at = CURRENT_TIMESTAMP
+        """
+
+        cursor.execute(insert_query, (
+            topic_id,
+            token_usage.get('prompt_tokens', 0),
+            token_usage.get('completion_tokens', 0),
+            token_usage.get('total_tokens', 0),
+            token_usage.get('model_calls', 0)
+        ))
+
+    def commit_outcomes(self, outcomes):
+        """
+        在一个事务中提交一个或多个帖子的全部写入（处理后的帖子、搜索结果、检索结果、token使用量），返回是否提交成功
+
+        整批失败时的逐个重试见 unit_of_work.commit_with_retry。
+        """
+        if not outcomes:
+            return True
+
         conn = self._get_db_connection()
         if not conn:
             logger.error("无法建立数据库连接")
-            return
+            return False
 
         try:
             cursor = conn.cursor()
-
-            # 插入或更新token使用量数据
-            insert_query = """
-                INSERT INTO consume_tokens_topic 
-                (topic_id, prompt_tokens, completion_tokens, total_tokens, model_calls)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (topic_id) 
-                DO UPDATE SET
-                    prompt_tokens = EXCLUDED.prompt_tokens,
-                    completion_tokens = EXCLUDED.completion_tokens,
-                    total_tokens = EXCLUDED.total_tokens,
-                    model_calls = EXCLUDED.model_calls,
-                    created_at = CURRENT_TIMESTAMP
-            """
-
-            cursor.execute(insert_query, (
-                topic_id,
-                token_usage.get('prompt_tokens', 0),
-                token_usage.get('completion_tokens', 0),
-                token_usage.get('total_tokens', 0),
-                token_usage.get('model_calls', 0)
-            ))
-
+            self._write_outcomes(cursor, outcomes)
             conn.commit()
             cursor.close()
-            logger.info(f"主题 {topic_id} 的token使用量已保存到数据库")
+            logger.info(f"成功在一个事务中提交 {len(outcomes)} 个帖子的处理结果")
+            return True
         except Exception as e:
-            logger.error(f"保存token使用量到数据库时出错: {e}")
+            logger.error(f"提交帖子 {[outcome.topic_id for outcome in outcomes]} 的处理结果时出错: {e}")
             conn.rollback()
+            return False
         finally:
             self._close_db_connection(conn)
 
-
-    def load_existing_data(self, csv_file=None):
+    def _write_outcomes(self, cursor, outcomes):
+        processed_topics = {}
+        # 规范化存储时整批的搜索结果行合并为一次COPY
+        item_rows = []
+        for outcome in outcomes:
+            for search_results, search_keyword in outcome.search_results:
+                self._insert_search_results(cursor, outcome.topic_id, search_results, search_keyword, item_rows)
+            for topic_id, related_docs in outcome.retrieval_results:
+                self._insert_retrieval_results(cursor, topic_id, related_docs)
+            for topic in outcome.processed_topics:
+                # 同一条语句中不能两次更新同一行，同一帖子只保留最后一条
+                processed_topics[int(topic['id'])] = topic
+            if outcome.token_usage is not None:
+                self._upsert_token_usage(cursor, outcome.topic_id, outcome.token_usage)
+        if processed_topics:
+            self._insert_topics(cursor, list(processed_topics.values()), 'processed_forum_topics')
+        self._copy_search_result_items(cursor, item_rows)
+
+
+    def load_existing_data(self, csv_file=None, candidate_ids=None):
         # """
         # 从现有CSV文件中加载已有的帖子数据
         # """
@@ -692,7 +1238,23 @@ class DataProcessor:
         #         logger.error(f"读取现有CSV文件时出错: {e}")
         """
            从数据库中加载已有的帖子数据
+
+           seen_index.mode 为 memory 时返回常驻内存的ID索引（首次加载，超过对账间隔后重新加载），
+           为 db_any 且传入 candidate_ids 时只查询候选ID中已存在的部分。
            """
+        self.flush_writes()
+        if self.seen_mode == 'memory':
+            if self.seen_index.is_stale(self.seen_reconcile_interval):
+                topic_ids = self._load_topic_ids()
+                if topic_ids is not None:
+                    self.seen_index.replace(topic_ids)
+                    logger.info(f"已见帖子索引已与数据库对账，共 {len(self.seen_index)} 个帖子")
+                elif self.seen_index.loaded_at is None:
+                    return {}
+            return self.seen_index
+        if self.seen_mode == 'db_any' and candidate_ids is not None:
+            return self._load_existing_candidates(candidate_ids)
+
         existing_data = {}
 
         conn = self._get_db_connection()
@@ -715,6 +1277,55 @@ class DataProcessor:
 
         return existing_data
 
+    def _load_topic_ids(self):
+        """
+        从数据库读取全部帖子ID，失败时返回None
+        """
+        conn = self._get_db_connection()
+        if not conn:
+            logger.error("无法建立数据库连接")
+            return None
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM forum_topics")
+            topic_ids = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            return topic_ids
+        except Exception as e:
+            logger.error(f"从数据库加载数据时出错: {e}")
+            return None
+        finally:
+            self._close_db_connection(conn)
+
+    def _load_existing_candidates(self, candidate_ids):
+        """
+        只查询候选ID中已存在于数据库的部分
+        """
+        existing_data = {}
+        candidate_ids = [int(topic_id) for topic_id in candidate_ids]
+        if not candidate_ids:
+            return existing_data
+
+        conn = self._get_db_connection()
+        if not conn:
+            logger.error("无法建立数据库连接")
+            return existing_data
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM forum_topics WHERE id = ANY(%s)", (candidate_ids,))
+            for row in cursor.fetchall():
+                existing_data[row[0]] = True
+            cursor.close()
+            logger.info(f"{len(candidate_ids)} 个候选帖子中有 {len(existing_data)} 个已存在")
+        except Exception as e:
+            logger.error(f"从数据库加载数据时出错: {e}")
+        finally:
+            self._close_db_connection(conn)
+
+        return existing_data
+
     def extract_topic_data(self, topic_details):
         """
         提取每个帖子的 id、标题、用户问题和最佳答案。
@@ -780,24 +1391,87 @@ class DataProcessor:
         if filename is None:
             filename = self.config['paths']['csv_file']
 
+        if self.write_behind is not None and not self.write_behind.in_worker():
+            # replies 的序列化在入队前完成，调用方看到的数据与同步写入时一致
+            self._serialize_replies(data)
+            self.write_behind.enqueue('csv', filename, [dict(row) for row in data])
+            return
+
         try:
-            file_exists = os.path.exists(filename)
+            self._append_csv_rows(data, filename)
+        except Exception as e:
+            logger.error(f"追加数据到CSV文件时出错: {e}")
 
-            with open(filename, mode='a', newline='', encoding='utf-8') as file:
-                fieldnames = ['id', 'title', 'user_question', 'best_answer', 'tags', 'replies','created_at', 'llm_answer', 'summary_question']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
+    def _append_csv_rows(self, data, filename):
+        """
+        追加数据到段存储和CSV文件，出错时抛出异常（后台写入线程直接调用）
+        """
+        with self.csv_lock:
+            if self.segment_store_config.get('enabled', False):
+                self._serialize_replies(data)
+                self._get_segment_store(filename).append(data)
+            if self.csv_export:
+                self._write_csv_rows(data, filename)
+        logger.info(f"成功追加 {len(data)} 条新数据到 {filename}")
+
+    def _get_segment_store(self, filename):
+        """
+        获取CSV文件对应的段存储，每个CSV文件对应 segment_store.directory 下的一个同名子目录
+        """
+        dataset = os.path.splitext(os.path.basename(filename))[0]
+        if dataset not in self.segment_stores:
+            self.segment_stores[dataset] = SegmentStore(
+                os.path.join(self.segment_store_config.get('directory', 'data/segments'), dataset),
+                max_rows=self.segment_store_config.get('max_rows', 5000),
+                max_age=self.segment_store_config.get('max_age', 3600),
+                compression=self.segment_store_config.get('compression', 'snappy')
+            )
+        return self.segment_stores[dataset]
 
-                if not file_exists:
-                    writer.writeheader()
+    def rotate_segments(self):
+        """
+        将暂存超过 segment_store.max_age 秒的数据写成段
+        """
+        with self.csv_lock:
+            stores = list(self.segment_stores.values())
+        for store in stores:
+            try:
+                store.rotate_if_due()
+            except Exception as e:
+                logger.error(f"写出数据段时出错: {e}")
 
-                for row in data:
-                    if 'replies' in row and isinstance(row['replies'], list):
-                        row['replies'] = json.dumps(row['replies'], ensure_ascii=False)
-                    writer.writerow(row)
+    def get_segment_store_stats(self):
+        """
+        获取各数据集的段数、行数和暂存行数，未启用时返回None
+        """
+        if not self.segment_store_config.get('enabled', False):
+            return None
+        return {dataset: store.get_stats() for dataset, store in self.segment_stores.items()}
 
-            logger.info(f"成功追加 {len(data)} 条新数据到 {filename}")
-        except Exception as e:
-            logger.error(f"追加数据到CSV文件时出错: {e}")
+    def _write_csv_rows(self, data, filename):
+        """
+        以追加方式写入CSV行，文件不存在时先写表头
+        """
+        file_exists = os.path.exists(filename)
+
+        with open(filename, mode='a', newline='', encoding='utf-8') as file:
+            fieldnames = ['id', 'title', 'user_question', 'best_answer', 'tags', 'replies','created_at', 'llm_answer', 'summary_question']
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+
+            if not file_exists:
+                writer.writeheader()
+
+            self._serialize_replies(data)
+            for row in data:
+                writer.writerow(row)
+
+    def _serialize_replies(self, data):
+        """
+        将 replies 列表序列化为JSON字符串（原地修改）
+        """
+        for row in data:
+            if 'replies' in row and isinstance(row['replies'], list):
+                row['replies'] = json.dumps(row['replies'], ensure_ascii=False)
 
     def append_to_answer_csv(self, data, filename=None):
         """
@@ -823,9 +1497,9 @@ class DataProcessor:
         except Exception as e:
             logger.error(f"追加数据到CSV文件时出错: {e}")
 
-    def process_search_results(self, topic_id, search_results, search_keyword, max_results=10):
+    def process_search_results(self, topic_id, search_results, search_keyword, max_results=10, outcome=None):
         """
-        处理搜索结果并保存到文件
+        处理搜索结果并保存到文件，传入 outcome 时数据库写入延后到该帖子的事务中提交
         """
         limited_results = search_results[:max_results]
 
@@ -844,16 +1518,22 @@ class DataProcessor:
 
         try:
             # 保存到数据库
-            self.save_search_results_to_db(topic_id, search_results, search_keyword)
-            with open(search_results_file, 'w', encoding='utf-8') as f:
-                json.dump(search_data, f, ensure_ascii=False, indent=2)
-            logger.info(f"主题 {topic_id} 的搜索结果已保存到 {search_results_file}")
+            if outcome is not None:
+                outcome.add_search_results(search_results, search_keyword)
+            else:
+                self.save_search_results_to_db(topic_id, search_results, search_keyword)
+            if self.artifact_log is not None:
+                self._append_artifact('search', topic_id, search_data, timestamp)
+                logger.info(f"主题 {topic_id} 的搜索结果已追加到产物日志")
+            else:
+                self._save_json_file(search_results_file, search_data)
+                logger.info(f"主题 {topic_id} 的搜索结果已保存到 {search_results_file}")
         except Exception as e:
             logger.error(f"保存搜索结果时出错: {e}")
 
-    def process_retrieval_results(self, results):
+    def process_retrieval_results(self, results, outcome=None):
         """
-        处理检索结果
+        处理检索结果，传入 outcome 时数据库写入延后到该帖子的事务中提交
         """
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         results_file = f"{self.config['paths']['forum_data_dir']}/retrieval_results_{timestamp}.json"
@@ -864,13 +1544,53 @@ class DataProcessor:
                 topic_id = result.get('topic_id')
                 related_docs = result.get('related_docs')
                 if topic_id and related_docs:
-                    self.save_retrieval_results_to_db(topic_id, related_docs)
-            with open(results_file, 'w', encoding='utf-8') as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
-            logger.info(f"检索结果已保存到 {results_file}")
+                    if outcome is not None:
+                        outcome.add_retrieval_result(topic_id, related_docs)
+                    else:
+                        self.save_retrieval_results_to_db(topic_id, related_docs)
+            if self.blob_store is not None:
+                # 全文已分段存入数据库，JSON文件中只记录各段哈希
+                results = [self._retrieval_blob_record(result) for result in results]
+            if self.artifact_log is not None:
+                for result in results:
+                    self._append_artifact('retrieval', result.get('topic_id'), result, timestamp)
+                logger.info("检索结果已追加到产物日志")
+            else:
+                self._save_json_file(results_file, results)
+                logger.info(f"检索结果已保存到 {results_file}")
         except Exception as e:
             logger.error(f"保存检索结果时出错: {e}")
 
+    def _retrieval_blob_record(self, result):
+        record = {key: value for key, value in result.items() if key != 'related_docs'}
+        record['related_docs_blobs'] = section_hashes(result.get('related_docs') or '')
+        return record
+
+    def _append_artifact(self, kind, topic_id, data, timestamp):
+        """
+        追加一条产物记录，启用后台写入时放入写入队列
+        """
+        if not self._defer_write(self.artifact_log.append, kind, topic_id, data, timestamp):
+            self.artifact_log.append(kind, topic_id, data, timestamp)
+
+    def read_artifacts(self, topic_id, kind=None):
+        """
+        从产物日志中读取帖子的搜索/检索结果记录，未启用时返回空列表
+        """
+        if self.artifact_log is None:
+            return []
+        self.flush_writes()
+        return self.artifact_log.read(topic_id, kind)
+
+    def _save_json_file(self, path, data):
+        """
+        写出JSON文件，启用后台写入时放入写入队列
+        """
+        if self.write_behind is not None:
+            self.write_behind.enqueue('json', path, data)
+        else:
+            write_json_file(path, data)
+
     def format_search_results_for_prompt(self, retrieval_result, search_results):
         retrieval_list = extract_json_blocks(retrieval_result.get('related_docs', ''))
         # 处理KG和DC部分
@@ -0,0 +1,123 @@
+import threading
+import time
+from psycopg2 import extensions, pool
+from .logging_config import main_logger as logger
+
+
+class DatabasePool:
+    """
+    线程安全的数据库连接池
+
+    在 psycopg2 的 ThreadedConnectionPool 外加一层信号量：连接用满时调用方排队等待归还，
+    而不是像 ThreadedConnectionPool 那样直接抛出 PoolError。
+    取出空闲超过 health_check_interval 的连接时先执行 SELECT 1 检查，失效的连接丢弃后重新建立。
+    归还时回滚未结束的事务，保证下一个使用者拿到干净的连接。
+    """
+    def __init__(self, db_params, min_size=1, max_size=10, wait_timeout=30, health_check_interval=60):
+        self.max_size = max(1, max_size)
+        self.wait_timeout = wait_timeout
+        self.health_check_interval = health_check_interval
+        self.pool = pool.ThreadedConnectionPool(min(min_size, self.max_size), self.max_size, **db_params)
+        self.slots = threading.BoundedSemaphore(self.max_size)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.acquired = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def getconn(self):
+        """
+        取出一个可用连接，等待超过 wait_timeout 时返回None
+        """
+        start_time = time.time()
+        if not self.slots.acquire(timeout=self.wait_timeout):
+            with self.lock:
+                self.timeouts += 1
+            logger.error(f"等待数据库连接超时（{self.wait_timeout}秒），连接池已用满 {self.max_size} 个连接")
+            return None
+        waited = time.time() - start_time
+
+        try:
+            conn = self._checked_connection()
+        except Exception:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    def _checked_connection(self):
+        # 健康检查失败时丢弃连接重新获取，最多尝试池大小+1次
+        for _ in range(self.max_size + 1):
+            conn = self.pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            with self.lock:
+                self.discarded += 1
+                self.last_used.pop(id(conn), None)
+            logger.warning("数据库连接已失效，丢弃后重新建立")
+            self.pool.putconn(conn, close=True)
+        raise pool.PoolError("无法获取可用的数据库连接")
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self.last_used.get(id(conn))
+        if last_used is not None and time.time() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"数据库连接健康检查失败: {e}")
+            return False
+
+    def putconn(self, conn):
+        """
+        归还连接，未结束的事务会被回滚，已损坏的连接直接关闭
+        """
+        try:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            with self.lock:
+                if broken:
+                    self.discarded += 1
+                    self.last_used.pop(id(conn), None)
+                else:
+                    self.last_used[id(conn)] = time.time()
+            self.pool.putconn(conn, close=broken)
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def get_stats(self):
+        """
+        获取连接池统计：使用中的连接数、累计获取次数、等待时间和超时次数
+        """
+        with self.lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+                'avg_wait_ms': round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2)
+            }
+
+    def closeall(self):
+        self.pool.closeall()
@@ -1,13 +1,29 @@
 import requests
+import httpx
 import json
 from datetime import datetime
-import re
+from concurrent.futures import ThreadPoolExecutor
 from .data_processor import fetch_all_forum_topics,fetch_topic_details
+from .rate_limiter import TokenBucketRateLimiter
+from .async_http import AsyncHttpClientMixin
+from .http_session import session_pool
+from .html_text import strip_tags
 from .logging_config import main_logger as logger
 
 class ForumClient:
     def __init__(self, config):
         self.config = config
+        session_pool.configure(self.config)
+        forum_config = self.config.get('forum', {})
+        # 详情并发获取的线程数，为1时保持逐个获取并在每次请求后休眠
+        self.detail_workers = forum_config.get('detail_workers', 1)
+        request_delay = forum_config.get('request_delay', 0.1)
+        default_rate = 1 / request_delay if request_delay else 10
+        # 所有详情请求共享一个令牌桶，限制每秒请求数和同时在途请求数
+        self.detail_rate_limiter = TokenBucketRateLimiter(
+            rate=forum_config.get('requests_per_second', default_rate),
+            max_in_flight=forum_config.get('max_in_flight', max(1, self.detail_workers))
+        )
 
     # 在 forum_client.py 的 ForumClient 类中添加方法
     def fetch_topic_details(self, topic_id):
@@ -16,17 +32,55 @@ class ForumClient:
         """
         return fetch_topic_details(topic_id, self.config)
 
-    def fetch_all_forum_topics(self):
+    def fetch_topics_details(self, topic_ids):
         """
-        获取所有论坛主题
+        使用有界线程池并发获取多个帖子的详细内容，由共享令牌桶限流
+
+        Returns:
+            list: 与 topic_ids 顺序一致的详情列表，获取失败的位置为 None
+        """
+        if not topic_ids:
+            return []
+        workers = min(max(1, self.detail_workers), len(topic_ids))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='topic-detail') as executor:
+            return list(executor.map(
+                lambda topic_id: fetch_topic_details(topic_id, self.config, rate_limiter=self.detail_rate_limiter),
+                topic_ids
+            ))
+
+    def fetch_all_forum_topics(self, since=None, stats=None):
         """
-        return fetch_all_forum_topics(self.config)
+        获取所有论坛主题，传入since时只翻页到上次轮询的高水位为止
+        """
+        return fetch_all_forum_topics(self.config, since=since, stats=stats)
 
     def reply_to_topic(self, topic_id, reply_content):
         """
         回复指定的论坛主题
         """
         logger.info(f"正在回复主题 {topic_id}")
+        request = self._reply_request(topic_id, reply_content)
+
+        try:
+            response = session_pool.post(
+                request['url'],
+                headers=request['headers'],
+                data=request['data'],
+                verify=request['verify'],
+                timeout=30
+            )
+            return self._handle_reply_response(topic_id, response)
+        except Exception as e:
+            logger.error(f"主题 {topic_id} 回复请求发送失败: {e}")
+            return {
+                "success": False,
+                "error": f"请求发送失败: {e}"
+            }
+
+    def _reply_request(self, topic_id, reply_content):
+        """
+        构造回复请求参数
+        """
         # 获取SSL验证设置
         verify_ssl = self.config.get('posts', {}).get('verify_ssl', True)
         headers = {
@@ -39,40 +93,50 @@ class ForumClient:
             "topic_id": topic_id,
             "raw": reply_content
         }
+        return {
+            'url': f"{self.config['posts']['base_url']}/posts.json",
+            'headers': headers,
+            'data': json.dumps(payload),
+            'verify': verify_ssl
+        }
 
-        try:
-            response = requests.post(
-                f"{self.config['posts']['base_url']}/posts.json",
-                headers=headers,
-                data=json.dumps(payload),
-                verify=verify_ssl,
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                logger.info(f"主题 {topic_id} 回复成功")
-                return {
-                    "success": True,
-                    "data": response.json()
-                }
-            else:
-                logger.error(f"主题 {topic_id} 回复失败，状态码: {response.status_code}")
-                return {
-                    "success": False,
-                    "status_code": response.status_code,
-                    "error_message": response.text
-                }
-        except Exception as e:
-            logger.error(f"主题 {topic_id} 回复请求发送失败: {e}")
+    def _handle_reply_response(self, topic_id, response):
+        """
+        解析回复接口的响应
+        """
+        if response.status_code == 200:
+            logger.info(f"主题 {topic_id} 回复成功")
+            return {
+                "success": True,
+                "data": response.json()
+            }
+        else:
+            logger.error(f"主题 {topic_id} 回复失败，状态码: {response.status_code}")
             return {
                 "success": False,
-                "error": f"请求发送失败: {e}"
+                "status_code": response.status_code,
+                "error_message": response.text
             }
 
     def search_related_topics(self, keyword, query_id, max_results=None):
         """
         搜索相关主题
         """
+        request = self._search_request(keyword, max_results)
+
+        try:
+            response = session_pool.post(request['url'], headers=request['headers'], json=request['json'],
+                                         verify=request['verify'], timeout=30)
+            return self._handle_search_response(response, query_id)
+        except Exception as e:
+            logger.error(f"搜索过程中发生错误，搜索内容为: {request['json']['keyword']}")
+            logger.error(f"搜索过程中发生错误: {e}")
+            return []
+
+    def _search_request(self, keyword, max_results=None):
+        """
+        构造搜索请求参数
+        """
         if max_results is None:
             max_results = self.config['search']['default_page_size']
 
@@ -100,44 +164,51 @@ class ForumClient:
             "filter": [{}],
             "pageSize": max_results
         }
+        return {
+            'url': url,
+            'headers': headers,
+            'json': data,
+            'verify': verify_ssl
+        }
 
-        try:
-            response = requests.post(url, headers=headers, json=data, verify=verify_ssl, timeout=30)
-
-            if response.status_code == 200:
-                result = response.json()
-                records = result.get('obj', {}).get('records', [])
-
-                # 过滤掉当前帖子本身并去除HTML标签
-                filtered_records = []
-                for record in records:
-                    record['title'] = self._remove_html_tags(record.get('title', ''))
-                    record['textContent'] = self._remove_html_tags(record.get('textContent', ''))
-                    filtered_records.append(record)
-
-                return filtered_records
-            else:
-                logger.error(f"搜索请求失败，状态码：{response.status_code}，ID: {query_id}")
-                return []
-        except Exception as e:
-            logger.error(f"搜索过程中发生错误，搜索内容为: {keyword}")
-            logger.error(f"搜索过程中发生错误: {e}")
+    def _handle_search_response(self, response, query_id):
+        """
+        解析搜索接口的响应，去除结果中的HTML标签
+        """
+        if response.status_code == 200:
+            result = response.json()
+            records = result.get('obj', {}).get('records', [])
+
+            # 过滤掉当前帖子本身并去除HTML标签
+            filtered_records = []
+            for record in records:
+                record['title'] = self._remove_html_tags(record.get('title', ''))
+                record['textContent'] = self._remove_html_tags(record.get('textContent', ''))
+                filtered_records.append(record)
+
+            return filtered_records
+        else:
+            logger.error(f"搜索请求失败，状态码：{response.status_code}，ID: {query_id}")
             return []
 
     def retrieve_documents_for_topic(self, topic):
         """
         为单个帖子检索相关文档
         """
-        topic_id = topic['id']
-        title = topic['title']
-        user_question = topic['user_question']
-
-        # 构造查询内容：将标题和用户问题拼接
-        query = f"{title} {user_question}"
+        logger.info(f"正在为帖子 {topic['id']} 检索相关文档...")
+        related_docs = self._get_response_data(self._retrieval_query(topic))
+        return self._retrieval_result(topic['id'], related_docs)
 
-        logger.info(f"正在为帖子 {topic_id} 检索相关文档...")
-        related_docs = self._get_response_data(query)
+    def _retrieval_query(self, topic):
+        """
+        构造查询内容：将标题和用户问题拼接
+        """
+        return f"{topic['title']} {topic['user_question']}"
 
+    def _retrieval_result(self, topic_id, related_docs):
+        """
+        组装检索结果
+        """
         result = {
             'topic_id': topic_id,
             'related_docs': related_docs
@@ -154,6 +225,24 @@ class ForumClient:
         """
         发送查询请求并返回响应数据
         """
+        request = self._query_request(query)
+
+        try:
+            response = session_pool.post(request['url'], json=request['json'], verify=request['verify'], timeout=600)
+            response.raise_for_status()
+            result = response.json()
+            return result.get("response")
+        except requests.RequestException as e:
+            logger.error(f"请求错误: {e}")
+            return None
+        except ValueError as e:
+            logger.error(f"JSON解析错误: {e}")
+            return None
+
+    def _query_request(self, query):
+        """
+        构造LightRAG查询请求参数
+        """
         base_url = self.config['retrieval']['base_url']
         endpoint = self.config['retrieval']['query_endpoint']
         url = f"{base_url}{endpoint}"
@@ -170,22 +259,85 @@ class ForumClient:
             "chunk_top_k": self.config['retrieval']['chunk_top_k'],
             "enable_rerank": self.config['retrieval']['enable_rerank'],
         }
+        return {
+            'url': url,
+            'json': payload,
+            'verify': verify_ssl
+        }
+
+    def _remove_html_tags(self, text):
+        """
+        去除HTML标签
+        """
+        return strip_tags(text)
+
+
+class AsyncForumClient(AsyncHttpClientMixin, ForumClient):
+    """
+    ForumClient 的异步版本，回复、搜索和检索方法名与同步版本一致，需要 await 调用
+
+    同一实例内的请求复用 httpx 连接池，用完后调用 close 释放连接。
+    """
+    async def reply_to_topic(self, topic_id, reply_content):
+        """
+        回复指定的论坛主题
+        """
+        logger.info(f"正在回复主题 {topic_id}")
+        request = self._reply_request(topic_id, reply_content)
 
         try:
-            response = requests.post(url, json=payload, verify=verify_ssl, timeout=600)
+            response = await self._get_http_client(request['verify']).post(
+                request['url'],
+                headers=request['headers'],
+                content=request['data'],
+                timeout=30
+            )
+            return self._handle_reply_response(topic_id, response)
+        except Exception as e:
+            logger.error(f"主题 {topic_id} 回复请求发送失败: {e}")
+            return {
+                "success": False,
+                "error": f"请求发送失败: {e}"
+            }
+
+    async def search_related_topics(self, keyword, query_id, max_results=None):
+        """
+        搜索相关主题
+        """
+        request = self._search_request(keyword, max_results)
+
+        try:
+            response = await self._get_http_client(request['verify']).post(
+                request['url'], headers=request['headers'], json=request['json'], timeout=30)
+            return self._handle_search_response(response, query_id)
+        except Exception as e:
+            logger.error(f"搜索过程中发生错误，搜索内容为: {request['json']['keyword']}")
+            logger.error(f"搜索过程中发生错误: {e}")
+            return []
+
+    async def retrieve_documents_for_topic(self, topic):
+        """
+        为单个帖子检索相关文档
+        """
+        logger.info(f"正在为帖子 {topic['id']} 检索相关文档...")
+        related_docs = await self._get_response_data(self._retrieval_query(topic))
+        return self._retrieval_result(topic['id'], related_docs)
+
+    async def _get_response_data(self, query):
+        """
+        发送查询请求并返回响应数据
+        """
+        request = self._query_request(query)
+
+        try:
+            response = await self._get_http_client(request['verify']).post(
+                request['url'], json=request['json'], timeout=600)
             response.raise_for_status()
             result = response.json()
             return result.get("response")
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"请求错误: {e}")
             return None
         except ValueError as e:
             logger.error(f"JSON解析错误: {e}")
             return None
-
-    def _remove_html_tags(self, text):
-        """
-        去除HTML标签
-        """
-        clean = re.compile('<.*?>')
-        return re.sub(clean, '', text)
@@ -0,0 +1,275 @@
+import re
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+
+# BeautifulSoup(html.parser) 的树构建规则，单遍转换按同样的规则处理文本和标签
+_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta', 'param',
+    'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+])
+_PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+# 这些标签中的文本不是普通文本（get_text 不返回）或在不同Python版本中按原始文本解析，
+# 帖子中几乎不会出现，遇到时交给 BeautifulSoup 处理
+_FALLBACK_TAGS = frozenset([
+    'script', 'style', 'template', 'rt', 'rp', 'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes',
+    'noscript', 'plaintext',
+])
+_SAFE_ATTRIBUTE_NAME = re.compile(r'^[a-zA-Z_:][-a-zA-Z0-9_:.]*$')
+_NON_WHITESPACE = re.compile(r'\S+')
+_TAG_PATTERN = re.compile('<.*?>')
+
+
+class _Unsupported(Exception):
+    """
+    遇到单遍转换无法保证与 BeautifulSoup 结果一致的标记
+    """
+
+
+class _TextExtractor(HTMLParser):
+    """
+    单遍HTML转文本
+
+    在 html.parser 的事件流上按 BeautifulSoup 的规则维护打开的标签栈、合并文本段并折叠纯空白文本，
+    不构建文档树。substitute_images 为True时把图片和 lightbox 链接替换为 [img: (链接)]，
+    并模拟 BeautifulSoup 序列化后重新解析一次（process_html_content_with_image_links 的行为）。
+    """
+    def __init__(self, substitute_images=False, collect_links=False):
+        super().__init__(convert_charrefs=False)
+        self.substitute_images = substitute_images
+        self.collect_links = collect_links
+        self.pieces = []
+        self.links = []
+        # 打开的标签：[(标签名, 是否保留空白, 是否为被替换的 lightbox 链接)]
+        self.stack = []
+        self.open_counts = {}
+        self.preserve_depth = 0
+        self.suppress_depth = 0
+        self.already_closed = []
+        # 当前文本段（未折叠）以及等待与后续文本段合并的已折叠文本段
+        self.current = []
+        self.pending = []
+
+    # ---- 文本段处理 ----
+
+    def _collapse(self, text):
+        if self.preserve_depth:
+            return text
+        for char in text:
+            if char not in _ASCII_SPACES:
+                return text
+        return '\n' if '\n' in text else ' '
+
+    def _end_data(self):
+        if self.current:
+            self.pending.append(self._collapse(''.join(self.current)))
+            self.current = []
+
+    def _flush(self):
+        """
+        可见的标记之前：输出之前的文本段
+        """
+        self._end_data()
+        if not self.pending:
+            return
+        if self.substitute_images:
+            # 序列化后再解析时，只被不可见标记隔开的文本段会合并为一段并再次折叠
+            text = self._collapse(''.join(self.pending))
+        else:
+            text = ''.join(self.pending)
+        self.pending = []
+        if not self.suppress_depth:
+            self.pieces.append(text)
+
+    def _emit(self, text):
+        if not self.suppress_depth:
+            self.pieces.append(text)
+
+    # ---- 标签栈 ----
+
+    def _push(self, name, suppress=False):
+        preserve = name in _PRESERVE_WHITESPACE_TAGS
+        self.stack.append((name, preserve, suppress))
+        self.open_counts[name] = self.open_counts.get(name, 0) + 1
+        if preserve:
+            self.preserve_depth += 1
+        if suppress:
+            self.suppress_depth += 1
+
+    def _pop(self):
+        name, preserve, suppress = self.stack.pop()
+        self.open_counts[name] -= 1
+        if preserve:
+            self.preserve_depth -= 1
+        if suppress:
+            self.suppress_depth -= 1
+
+    def _pop_to(self, name):
+        """
+        弹出到最近一个同名标签（含），没有打开的同名标签时不做任何事，返回是否弹出了标签
+        """
+        if not self.open_counts.get(name):
+            return False
+        while self.stack:
+            top = self.stack[-1][0]
+            self._pop()
+            if top == name:
+                break
+        return True
+
+    # ---- html.parser 回调 ----
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        if tag in _FALLBACK_TAGS:
+            raise _Unsupported(tag)
+        attributes = {}
+        for key, value in attrs:
+            if self.substitute_images and not _SAFE_ATTRIBUTE_NAME.match(key):
+                raise _Unsupported(key)
+            attributes[key] = '' if value is None else value
+        self._flush()
+
+        suppress = False
+        if self.substitute_images and not self.suppress_depth:
+            if tag == 'img' and attributes.get('src'):
+                self._emit(f"[img: ({attributes['src']})]")
+            elif tag == 'a' and attributes.get('href') and \
+                    'lightbox' in _NON_WHITESPACE.findall(attributes.get('class', '')):
+                self._emit(f"[img: ({attributes['href']})]")
+                suppress = True
+        if self.collect_links and tag == 'a' and 'href' in attributes:
+            self.links.append(attributes['href'])
+
+        self._push(tag, suppress)
+        if tag in _VOID_ELEMENTS and handle_empty_element:
+            self._pop_to(tag)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        if tag in self.already_closed:
+            # BeautifulSoup 会把之后的内容当作这个空标签的子节点，结果依赖序列化细节
+            raise _Unsupported(tag)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+        if self.open_counts.get(tag):
+            self._flush()
+            self._pop_to(tag)
+        else:
+            # 没有对应开始标签的结束标签只结束当前文本段，序列化时不会输出
+            self._end_data()
+
+    def handle_data(self, data):
+        self.current.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith('x'):
+            number = int(name.lstrip('x'), 16)
+        elif name.startswith('X'):
+            number = int(name.lstrip('X'), 16)
+        else:
+            number = int(name)
+        data = None
+        if number < 256:
+            try:
+                data = bytearray([number]).decode('windows-1252')
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(number)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        if self.substitute_images and ('--' in data or data.startswith('>') or data.startswith('->')
+                                       or data.endswith('-')):
+            raise _Unsupported('comment')
+        self._flush()
+
+    def handle_decl(self, decl):
+        raise _Unsupported('decl')
+
+    def unknown_decl(self, data):
+        raise _Unsupported('decl')
+
+    def handle_pi(self, data):
+        raise _Unsupported('pi')
+
+    def error(self, message):
+        raise _Unsupported(message)
+
+    def finish(self):
+        self.close()
+        self._flush()
+        return ''.join(self.pieces)
+
+
+def _extract(html, substitute_images=False, collect_links=False):
+    parser = _TextExtractor(substitute_images, collect_links)
+    parser.feed(html)
+    return parser.finish(), parser.links
+
+
+def bs4_text_with_image_links(html_content):
+    """
+    BeautifulSoup 实现（原 process_html_content_with_image_links），用于回退和对比
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    soup_copy = BeautifulSoup(str(soup), 'html.parser')
+    for img in soup_copy.find_all('img'):
+        img_src = img.get('src')
+        if img_src:
+            img.replace_with(f"[img: ({img_src})]")
+    for link in soup_copy.find_all('a', class_='lightbox'):
+        href = link.get('href')
+        if href:
+            link.replace_with(f"[img: ({href})]")
+    return soup_copy.get_text(strip=False)
+
+
+def bs4_text_and_links(html_content):
+    """
+    BeautifulSoup 实现（原 ForumDataFetcher.extract_posts_data 中的处理），用于回退和对比
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    return soup.get_text(), [link['href'] for link in soup.find_all('a', href=True)]
+
+
+def text_with_image_links(html_content):
+    """
+    将帖子HTML转为文本：图片和 lightbox 链接替换为 [img: (链接)]，连续换行合并为一个，去掉首尾空白
+    """
+    try:
+        text_content, _ = _extract(html_content, substitute_images=True)
+    except Exception:
+        text_content = bs4_text_with_image_links(html_content)
+    return re.sub(r'\n+', '\n', text_content).strip()
+
+
+def text_and_links(html_content):
+    """
+    将帖子HTML转为文本并提取全部链接：三个及以上的连续换行合并为两个，去掉首尾空白
+    """
+    try:
+        text_content, links = _extract(html_content, collect_links=True)
+    except Exception:
+        text_content, links = bs4_text_and_links(html_content)
+    return re.sub(r'\n{3,}', '\n\n', text_content).strip(), links
+
+
+def strip_tags(text):
+    """
+    去掉文本中的HTML标签（不解析实体），用于搜索结果的标题和摘要
+    """
+    return _TAG_PATTERN.sub('', text)
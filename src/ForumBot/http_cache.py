@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+from .http_session import session_pool
+from .logging_config import main_logger as logger
+
+
+class ValidatorCache:
+    """
+    按URL保存ETag/Last-Modified校验信息及已解析的JSON，发送条件请求
+
+    服务端返回304时直接复用上次解析好的数据，不再下载和解析响应体。
+    返回的数据是缓存中的共享对象，调用方不应修改。
+    """
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def _make_key(url, params):
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted(params.items()), doseq=True)}"
+
+    def get_json(self, url, params=None, headers=None, **kwargs):
+        """
+        发送带 If-None-Match / If-Modified-Since 的GET请求并返回JSON
+
+        请求失败时与 requests 一致抛出 RequestException
+        """
+        key = self._make_key(url, params)
+        request_headers = dict(headers or {})
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry:
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session_pool.get(url, params=params, headers=request_headers, **kwargs)
+        if response.status_code == 304 and entry:
+            with self.lock:
+                self.hits += 1
+                self.bytes_saved += entry['size']
+                self.entries.move_to_end(key)
+            return entry['data']
+
+        response.raise_for_status()
+        data = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self.lock:
+            self.misses += 1
+            if etag or last_modified:
+                self.entries[key] = {
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'data': data,
+                    'size': len(response.content)
+                }
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.pop(key, None)
+        return data
+
+    def get_stats(self):
+        """
+        获取命中统计
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'entries': len(self.entries)
+            }
+
+
+# 创建全局实例
+validator_cache = ValidatorCache()
+
+
+def get_json(url, config, params=None, **kwargs):
+    """
+    获取JSON数据，启用 http_cache.enabled 时走条件请求缓存
+    """
+    cache_config = (config or {}).get('http_cache', {})
+    if cache_config.get('enabled', False):
+        max_entries = cache_config.get('max_entries')
+        if max_entries and max_entries != validator_cache.max_entries:
+            validator_cache.max_entries = max_entries
+            logger.info(f"条件请求缓存容量设置为 {max_entries}")
+        return validator_cache.get_json(url, params=params, **kwargs)
+
+    response = session_pool.get(url, params=params, **kwargs)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,132 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from .http_transport import AdaptiveTransport
+from .logging_config import main_logger as logger
+
+
+class SessionPool:
+    """
+    按主机复用的HTTP会话池，同一主机的请求共享keep-alive连接，避免每次请求重新握手
+
+    每个主机一个 requests.Session，连接池大小和超时可以按主机单独配置（http.hosts）。
+    会话不保存cookie，请求行为与直接调用 requests.get/post 一致。
+    启用 http.adaptive.enabled 时请求经过 AdaptiveTransport，按主机自适应限制并发并自动重试。
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, timeout=None, host_settings=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.host_settings = host_settings or {}
+        self.sessions = {}
+        self.request_counts = {}
+        self.transport = None
+        self.adaptive_config = None
+        self.lock = threading.Lock()
+
+    def configure(self, config):
+        """
+        从 http 配置节更新连接池设置，只影响之后新建的主机会话
+        """
+        http_config = (config or {}).get('http', {})
+        with self.lock:
+            self.pool_connections = http_config.get('pool_connections', self.pool_connections)
+            self.pool_maxsize = http_config.get('pool_maxsize', self.pool_maxsize)
+            self.timeout = http_config.get('timeout', self.timeout)
+            self.host_settings = http_config.get('hosts', self.host_settings) or {}
+            adaptive_config = http_config.get('adaptive', {})
+            if adaptive_config != self.adaptive_config:
+                # 配置未变化时保留已有的并发状态，避免各客户端初始化时重复重置
+                self.adaptive_config = adaptive_config
+                self.transport = (AdaptiveTransport(adaptive_config, self.host_settings)
+                                  if adaptive_config.get('enabled', False) else None)
+
+    def _session_for(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                settings = self.host_settings.get(host, {})
+                pool_maxsize = settings.get('pool_maxsize', self.pool_maxsize)
+                adapter = HTTPAdapter(
+                    pool_connections=settings.get('pool_connections', self.pool_connections),
+                    pool_maxsize=pool_maxsize
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # 不在请求之间携带服务端下发的cookie
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                self.sessions[host] = session
+                self.request_counts[host] = 0
+                logger.info(f"为主机 {host} 创建HTTP会话，连接池大小 {pool_maxsize}")
+            self.request_counts[host] += 1
+            return session
+
+    def request(self, method, url, **kwargs):
+        """
+        通过对应主机的会话发送请求，参数与 requests.request 相同
+
+        按主机配置了 timeout 时以配置为准，否则使用调用方传入的超时或全局默认超时。
+        """
+        host = urlsplit(url).netloc
+        host_timeout = self.host_settings.get(host, {}).get('timeout')
+        if host_timeout is not None:
+            kwargs['timeout'] = host_timeout
+        elif self.timeout is not None:
+            kwargs.setdefault('timeout', self.timeout)
+        session = self._session_for(host)
+        transport = self.transport
+        if transport is None:
+            return session.request(method, url, **kwargs)
+        return transport.send(method, host, lambda: session.request(method, url, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def get_stats(self):
+        """
+        获取各主机的请求数、新建连接数（即握手次数）和连接复用率
+        """
+        with self.lock:
+            sessions = dict(self.sessions)
+            request_counts = dict(self.request_counts)
+
+        transport_stats = self.transport.get_stats() if self.transport is not None else {}
+        stats = {}
+        for host, session in sessions.items():
+            connections = 0
+            pooled_requests = 0
+            adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        connections += pool.num_connections
+                        pooled_requests += pool.num_requests
+            stats[host] = {
+                'requests': request_counts.get(host, 0),
+                'connections_opened': connections,
+                'reuse_rate': round(1 - connections / pooled_requests, 4) if pooled_requests else 0.0
+            }
+            if host in transport_stats:
+                stats[host].update(transport_stats[host])
+        return stats
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+# 创建全局实例
+session_pool = SessionPool()
@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import requests
+from .logging_config import main_logger as logger
+
+# 可以重试的状态码；429/503表示服务端限流或过载，同时触发并发数下调
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+THROTTLE_STATUS_CODES = (429, 503)
+# 幂等方法在连接错误、超时和5xx时都可以重试，其他方法只在服务端明确拒绝（429/503）时重试，避免重复提交
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'DELETE', 'PUT')
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 头，支持秒数和HTTP日期两种格式，返回需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostConcurrencyLimiter:
+    """
+    单个主机的自适应并发限制（AIMD）
+
+    请求成功且延迟正常时，每完成约一个并发窗口的请求并发上限加1；
+    遇到限流（429/503）或延迟超过目标值时并发上限按比例下降。
+    Retry-After 指定的等待时间内，该主机的所有新请求都会等待。
+    """
+    def __init__(self, host, initial=4, minimum=1, maximum=10, decrease_factor=0.5, latency_target=None):
+        self.host = host
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.successes = 0
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait_seconds = self.blocked_until - time.monotonic()
+                if wait_seconds > 0:
+                    self.condition.wait(wait_seconds)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.condition.wait()
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency):
+        with self.condition:
+            if self.latency_target is not None and latency > self.latency_target:
+                self._decrease(f"延迟 {latency:.2f} 秒超过目标 {self.latency_target} 秒")
+                return
+            self.successes += 1
+            if self.successes >= int(self.limit) and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1)
+                self.successes = 0
+                self.condition.notify_all()
+
+    def on_throttle(self, retry_after=None):
+        with self.condition:
+            self.throttled += 1
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self._decrease("服务端限流")
+
+    def _decrease(self, reason):
+        previous = int(self.limit)
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        self.successes = 0
+        if int(self.limit) != previous:
+            logger.warning(f"主机 {self.host} {reason}，并发上限从 {previous} 降为 {int(self.limit)}")
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'concurrency_limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'throttled': self.throttled,
+                'retries': self.retries
+            }
+
+
+class AdaptiveTransport:
+    """
+    HTTP请求的传输策略：按主机限制并发、抖动退避重试并遵守 Retry-After
+
+    由 SessionPool 在启用 http.adaptive.enabled 时使用，send 接收实际发送请求的函数。
+    重试用尽后返回最后一次响应（由调用方按原有方式处理状态码）或抛出最后一次异常。
+    """
+    def __init__(self, adaptive_config=None, host_settings=None):
+        adaptive_config = adaptive_config or {}
+        self.max_retries = adaptive_config.get('max_retries', 3)
+        self.backoff_base = adaptive_config.get('backoff_base', 0.5)
+        self.backoff_max = adaptive_config.get('backoff_max', 30)
+        self.max_retry_after = adaptive_config.get('max_retry_after', 120)
+        self.initial_concurrency = adaptive_config.get('initial_concurrency', 4)
+        self.min_concurrency = adaptive_config.get('min_concurrency', 1)
+        self.max_concurrency = adaptive_config.get('max_concurrency', 10)
+        self.decrease_factor = adaptive_config.get('decrease_factor', 0.5)
+        self.latency_target = adaptive_config.get('latency_target')
+        self.host_settings = host_settings or {}
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def _limiter_for(self, host):
+        with self.lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                settings = self.host_settings.get(host, {})
+                limiter = HostConcurrencyLimiter(
+                    host,
+                    initial=settings.get('initial_concurrency', self.initial_concurrency),
+                    minimum=settings.get('min_concurrency', self.min_concurrency),
+                    maximum=settings.get('max_concurrency', self.max_concurrency),
+                    decrease_factor=self.decrease_factor,
+                    latency_target=settings.get('latency_target', self.latency_target)
+                )
+                self.limiters[host] = limiter
+            return limiter
+
+    def _backoff(self, attempt, retry_after=None):
+        # 全抖动指数退避，服务端给出 Retry-After 时至少等待该时长
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    def send(self, method, host, send_request):
+        limiter = self._limiter_for(host)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            limiter.acquire()
+            start_time = time.monotonic()
+            try:
+                response = send_request()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"{method} {host} 请求出错: {e}，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+            else:
+                status_code = response.status_code
+                retryable = status_code in (RETRY_STATUS_CODES if idempotent else THROTTLE_STATUS_CODES)
+                retry_after = None
+                if status_code in THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    limiter.on_throttle(min(retry_after, self.max_retry_after) if retry_after else None)
+                elif status_code < 500:
+                    limiter.on_success(time.monotonic() - start_time)
+                if not retryable or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"{method} {host} 返回状态码 {status_code}，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+                response.close()
+            finally:
+                limiter.release()
+
+            with limiter.condition:
+                limiter.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def get_stats(self):
+        with self.lock:
+            limiters = dict(self.limiters)
+        return {host: limiter.get_stats() for host, limiter in limiters.items()}
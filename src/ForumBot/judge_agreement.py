@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+from datetime import datetime
+from .logging_config import main_logger as logger
+
+
+class JudgeAgreement:
+    """
+    答案评判方式的统计
+
+    combined 模式下记录合并评判成功和回退为分开评判的次数；shadow 模式下分开评判的结论用于发布，
+    同时调用合并评判并逐项比较，统计相关性、质量以及最终是否发布的一致率，
+    每次比较写入 judge.shadow_log（JSONL），便于在切换到 combined 之前检查不一致的样本。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.log_path = None
+        self.stats = {
+            'combined': 0,
+            'fallback': 0,
+            'compared': 0,
+            'relevance_agree': 0,
+            'quality_agree': 0,
+            'publish_agree': 0,
+            'shadow_failed': 0
+        }
+
+    def configure(self, config):
+        judge_config = config.get('judge', {})
+        if judge_config.get('mode', 'separate') == 'shadow':
+            self.log_path = judge_config.get('shadow_log') or os.path.join(
+                config.get('paths', {}).get('forum_data_dir', '.'), 'judge_shadow.jsonl')
+        else:
+            self.log_path = None
+
+    def record_combined(self, succeeded):
+        """
+        记录一次合并评判，succeeded 为False表示回退为分开评判
+        """
+        with self.lock:
+            self.stats['combined' if succeeded else 'fallback'] += 1
+
+    def record(self, topic_id, is_relevant, is_qualified, verdict):
+        """
+        比较分开评判的结论和合并评判的结论，verdict 为None表示合并评判失败
+        """
+        if verdict is None:
+            with self.lock:
+                self.stats['shadow_failed'] += 1
+            return
+        is_relevant = (is_relevant or '').lower()
+        is_qualified = (is_qualified or '').lower()
+        relevance_agree = is_relevant == verdict['is_relevant']
+        quality_agree = is_qualified == verdict['is_qualified']
+        publish_agree = (is_relevant == 'yes' and is_qualified == 'yes') == \
+            (verdict['is_relevant'] == 'yes' and verdict['is_qualified'] == 'yes')
+        with self.lock:
+            self.stats['compared'] += 1
+            self.stats['relevance_agree'] += relevance_agree
+            self.stats['quality_agree'] += quality_agree
+            self.stats['publish_agree'] += publish_agree
+            if self.log_path:
+                record = {
+                    'timestamp': datetime.now().isoformat(),
+                    'topic_id': topic_id,
+                    'separate': {'is_relevant': is_relevant, 'is_qualified': is_qualified},
+                    'combined': verdict,
+                    'publish_agree': publish_agree
+                }
+                try:
+                    directory = os.path.dirname(self.log_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with open(self.log_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                except Exception as e:
+                    logger.error(f"写入评判对比日志时出错: {e}")
+        if not publish_agree:
+            logger.info(f"帖子 {topic_id} 的合并评判与分开评判结论不一致: 分开评判 相关={is_relevant} 质量={is_qualified}，"
+                        f"合并评判 相关={verdict['is_relevant']}（{verdict['relevance_reason']}）"
+                        f" 质量={verdict['is_qualified']}（{verdict['quality_reason']}）")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        compared = stats['compared']
+        for key in ('relevance_agree', 'quality_agree', 'publish_agree'):
+            stats[f"{key}_rate"] = round(stats[key] / compared, 4) if compared else 0.0
+        return stats
+
+
+# 创建全局实例
+judge_agreement = JudgeAgreement()
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from .logging_config import main_logger as logger
+
+
+def normalize_input(value):
+    """
+    规范化模型输入：非字符串先序列化为JSON，再合并连续空白并去掉首尾空白
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return ' '.join(value.split())
+
+
+def make_key(kind, model, version, *inputs):
+    """
+    由调用类型、模型、提示词模板版本和规范化后的输入计算缓存键
+    """
+    payload = json.dumps([kind, model, version, [normalize_input(value) for value in inputs]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SqliteCacheBackend:
+    """
+    本地SQLite文件中的缓存结果
+    """
+    def __init__(self, path, ttl_days=30):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_result_cache (
+                key TEXT PRIMARY KEY,
+                kind TEXT,
+                model TEXT,
+                result TEXT,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                total_tokens INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                created_at REAL
+            )
+        """)
+        if self.ttl_seconds:
+            self.conn.execute("DELETE FROM llm_result_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self.conn.commit()
+
+    def get(self, key):
+        query = "SELECT result, prompt_tokens, completion_tokens, total_tokens, created_at FROM llm_result_cache WHERE key = ?"
+        params = [key]
+        if self.ttl_seconds:
+            query += " AND created_at >= ?"
+            params.append(time.time() - self.ttl_seconds)
+        with self.lock:
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE llm_result_cache SET hits = hits + 1 WHERE key = ?", (key,))
+            self.conn.commit()
+        return {'result': row[0], 'prompt_tokens': row[1], 'completion_tokens': row[2], 'total_tokens': row[3],
+                'created_at': row[4]}
+
+    def put(self, key, kind, model, entry):
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO llm_result_cache
+                (key, kind, model, result, prompt_tokens, completion_tokens, total_tokens, hits, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """, (key, kind, model, entry['result'], entry['prompt_tokens'], entry['completion_tokens'],
+                  entry['total_tokens'], time.time()))
+            self.conn.commit()
+
+
+class PostgresCacheBackend:
+    """
+    数据库 llm_result_cache 表中的缓存结果，多个实例共享
+
+    通过 DataProcessor 的连接获取和释放方法访问数据库，启用 database.pool 时与其他写入共用连接池。
+    """
+    def __init__(self, data_processor, ttl_days=30):
+        self.data_processor = data_processor
+        self.ttl_days = ttl_days
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS llm_result_cache (
+                key TEXT PRIMARY KEY,
+                kind TEXT,
+                model TEXT,
+                result TEXT,
+                prompt_tokens INTEGER DEFAULT 0,
+                completion_tokens INTEGER DEFAULT 0,
+                total_tokens INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_hit_at TIMESTAMP
+            )
+        """)
+        if self.ttl_days:
+            self._execute("DELETE FROM llm_result_cache WHERE created_at < NOW() - %s * INTERVAL '1 day'",
+                          (self.ttl_days,))
+
+    def _execute(self, query, params=None, fetch=False):
+        conn = self.data_processor._get_db_connection()
+        if not conn:
+            logger.error("无法建立数据库连接，跳过模型结果缓存表访问")
+            return None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            row = cursor.fetchone() if fetch else None
+            conn.commit()
+            cursor.close()
+            return row
+        except Exception as e:
+            logger.error(f"访问模型结果缓存表时出错: {e}")
+            conn.rollback()
+            return None
+        finally:
+            self.data_processor._close_db_connection(conn)
+
+    def get(self, key):
+        query = """
+            UPDATE llm_result_cache SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP
+            WHERE key = %s
+        """
+        params = [key]
+        if self.ttl_days:
+            query += " AND created_at >= NOW() - %s * INTERVAL '1 day'"
+            params.append(self.ttl_days)
+        query += " RETURNING result, prompt_tokens, completion_tokens, total_tokens, EXTRACT(EPOCH FROM created_at)"
+        row = self._execute(query, params, fetch=True)
+        if row is None:
+            return None
+        return {'result': row[0], 'prompt_tokens': row[1], 'completion_tokens': row[2], 'total_tokens': row[3],
+                'created_at': float(row[4])}
+
+    def put(self, key, kind, model, entry):
+        self._execute("""
+            INSERT INTO llm_result_cache
+            (key, kind, model, result, prompt_tokens, completion_tokens, total_tokens)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET
+                result = EXCLUDED.result,
+                prompt_tokens = EXCLUDED.prompt_tokens,
+                completion_tokens = EXCLUDED.completion_tokens,
+                total_tokens = EXCLUDED.total_tokens,
+                created_at = CURRENT_TIMESTAMP
+        """, (key, kind, model, entry['result'], entry['prompt_tokens'], entry['completion_tokens'],
+              entry['total_tokens']))
+
+
+class LLMResultCache:
+    """
+    模型调用结果缓存
+
+    键由调用类型、模型、提示词模板版本和规范化后的输入决定，相同输入直接复用上次的结果。
+    内存中按LRU保留最近的 max_entries 条，未命中时再查后端（sqlite 本地文件或 postgres 数据库表），
+    后端命中的结果放回内存。内存中的条目同样按写入时间在 ttl_days 天后过期。按调用类型统计命中次数和节省的token数。
+    """
+    def __init__(self, max_entries=2048):
+        self.enabled = False
+        self.max_entries = max_entries
+        self.ttl_seconds = None
+        self.entries = OrderedDict()
+        self.backend = None
+        self.cache_config = None
+        self.data_processor = None
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def configure(self, config, data_processor=None):
+        """
+        从 llm_cache 配置节更新设置，配置未变化时保留已有的缓存内容
+
+        postgres 后端使用 data_processor 的数据库连接，传入 data_processor 之前只使用内存缓存
+        """
+        cache_config = (config or {}).get('llm_cache', {})
+        with self.lock:
+            if cache_config == self.cache_config:
+                if data_processor is None or data_processor is self.data_processor:
+                    return
+                # 配置未变化，只是补充了数据库连接来源
+                self.data_processor = data_processor
+                if self.enabled and self.backend is None:
+                    self._create_backend(config)
+                return
+            self.cache_config = cache_config
+            self.data_processor = data_processor or self.data_processor
+            self.enabled = cache_config.get('enabled', False)
+            self.max_entries = cache_config.get('max_entries', self.max_entries)
+            ttl_days = cache_config.get('ttl_days', 30)
+            self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+            self.entries = OrderedDict()
+            self.backend = None
+            if not self.enabled:
+                return
+            self._create_backend(config)
+            logger.info(f"模型结果缓存已启用，内存容量 {self.max_entries}，后端 {cache_config.get('backend', 'memory')}")
+
+    def _create_backend(self, config):
+        # 调用方已持有 self.lock
+        backend = self.cache_config.get('backend', 'memory')
+        ttl_days = self.cache_config.get('ttl_days', 30)
+        try:
+            if backend == 'sqlite':
+                path = self.cache_config.get('path') or os.path.join(
+                    config.get('paths', {}).get('forum_data_dir', '.'), 'llm_cache.sqlite3')
+                self.backend = SqliteCacheBackend(path, ttl_days)
+            elif backend == 'postgres' and self.data_processor is not None:
+                self.backend = PostgresCacheBackend(self.data_processor, ttl_days)
+        except Exception as e:
+            logger.error(f"初始化模型结果缓存后端 {backend} 时出错，只使用内存缓存: {e}")
+            self.backend = None
+
+    def _kind_stats(self, kind):
+        # 调用方已持有 self.lock
+        if kind not in self.stats:
+            self.stats[kind] = {'hits': 0, 'misses': 0, 'saved_prompt_tokens': 0, 'saved_completion_tokens': 0,
+                                'saved_tokens': 0}
+        return self.stats[kind]
+
+    def _expired(self, entry):
+        return self.ttl_seconds is not None and time.time() - entry['created_at'] > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        # 调用方已持有 self.lock
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, kind, key):
+        """
+        查找缓存结果，返回 {'result', 'prompt_tokens', 'completion_tokens', 'total_tokens'}，未命中返回None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry):
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+            backend = self.backend
+        if entry is None and backend is not None:
+            try:
+                entry = backend.get(key)
+            except Exception as e:
+                logger.error(f"读取模型结果缓存时出错: {e}")
+                entry = None
+        with self.lock:
+            stats = self._kind_stats(kind)
+            if entry is None:
+                stats['misses'] += 1
+                return None
+            self._remember(key, entry)
+            stats['hits'] += 1
+            stats['saved_prompt_tokens'] += entry['prompt_tokens']
+            stats['saved_completion_tokens'] += entry['completion_tokens']
+            stats['saved_tokens'] += entry['total_tokens']
+        return entry
+
+    def put(self, kind, key, model, result, usage):
+        """
+        保存一次模型调用的结果和token用量
+        """
+        entry = {
+            'result': result,
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'total_tokens': usage.get('total_tokens', 0),
+            'created_at': time.time()
+        }
+        with self.lock:
+            self._remember(key, entry)
+            backend = self.backend
+        if backend is not None:
+            try:
+                backend.put(key, kind, model, entry)
+            except Exception as e:
+                logger.error(f"写入模型结果缓存时出错: {e}")
+
+    def get_stats(self):
+        """
+        获取按调用类型的命中统计和合计
+        """
+        with self.lock:
+            by_kind = {kind: dict(stats) for kind, stats in self.stats.items()}
+            entries = len(self.entries)
+        hits = sum(stats['hits'] for stats in by_kind.values())
+        misses = sum(stats['misses'] for stats in by_kind.values())
+        for stats in by_kind.values():
+            total = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'saved_tokens': sum(stats['saved_tokens'] for stats in by_kind.values()),
+            'entries': entries,
+            'by_kind': by_kind
+        }
+
+
+# 创建全局实例
+result_cache = LLMResultCache()
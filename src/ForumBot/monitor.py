@@ -1,15 +1,29 @@
+import asyncio
+import queue
+import threading
 import time
 import os
 import pytz
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from .forum_client import ForumClient
-from .ai_processor import AIProcessor
-from .data_processor import DataProcessor, format_search_results_as_json
+from .forum_client import ForumClient, AsyncForumClient
+from .ai_processor import AIProcessor, AsyncAIProcessor
+from .data_processor import DataProcessor, format_search_results_as_json, filter_monitored_topics
 from src.utils import load_config
 from .logging_config import main_logger as logger
 from .token_tracker import token_tracker
+from .poll_state import get_poll_state_file, load_poll_state, save_poll_state
+from .http_cache import validator_cache
+from .llm_cache import result_cache
+from .http_session import session_pool
+from .pipeline import PipelineStage, TopicPipeline
+from .task_graph import TaskGraph
+from .unit_of_work import TopicOutcome, OutcomeBatcher
+from .retention import RetentionJob
+from .similarity_index import AnswerReuse, ANSWER_NOTICE
+from .judge_agreement import judge_agreement
 # 尝试解析JSON数组
 import json
 import re
@@ -31,6 +45,58 @@ class ForumMonitor:
         self.forum_client = ForumClient(self.config)
         self.ai_processor = AIProcessor(self.config)
         self.data_processor = DataProcessor(self.config)
+        # llm_cache.backend 为 postgres 时缓存表通过 DataProcessor 的数据库连接访问
+        result_cache.configure(self.config, self.data_processor)
+        # 增量轮询：只翻页到上次看到的最新帖子为止
+        self.incremental_polling = self.config['monitor'].get('incremental_polling', False)
+        self.poll_state_file = get_poll_state_file(self.config)
+        # 最近一轮轮询的统计（获取页数、跳过帖子数等），供健康检查查看
+        self.last_poll_stats = {}
+        # 最近一次流水线运行的各阶段统计
+        self.last_pipeline_stats = {}
+        # 单个帖子内部的执行方式：sequential 顺序执行，graph 按依赖图并发执行互不依赖的调用
+        self.execution_mode = self.config['monitor'].get('execution_mode', 'sequential')
+        # 预检方式：separate 注入检测和摘要分两次调用，fused 一次调用返回JSON同时得到两者
+        self.fused_preflight = self.config.get('preflight', {}).get('mode', 'separate') == 'fused'
+        # 答案评判方式：separate 相关性和质量分两次调用，combined 一次调用返回两个结论，
+        # shadow 按分开评判发布，同时调用合并评判统计两者的一致率
+        self.judge_mode = self.config.get('judge', {}).get('mode', 'separate')
+        judge_agreement.configure(self.config)
+        self.graph_executor = None
+        if self.execution_mode == 'graph':
+            self.graph_executor = ThreadPoolExecutor(
+                max_workers=self.config['monitor'].get('graph_workers', 8),
+                thread_name_prefix='topic-graph'
+            )
+        # 影子评判与分开评判并发进行，依赖图执行时共用依赖图的线程池
+        self.shadow_executor = self.graph_executor
+        if self.judge_mode == 'shadow' and self.shadow_executor is None:
+            self.shadow_executor = ThreadPoolExecutor(
+                max_workers=self.config.get('judge', {}).get('shadow_workers', 4),
+                thread_name_prefix='shadow-judge'
+            )
+        # 使用asyncio在单个事件循环中并发处理帖子，替代逐个帖子的同步调用
+        self.async_io = self.config.get('async_io', {}).get('enabled', False)
+        # 单个帖子的数据库写入收集后在一个事务中提交，多个帖子可以分组提交
+        persistence_config = self.config.get('persistence', {})
+        self.unit_of_work = persistence_config.get('unit_of_work', False)
+        self.outcome_batcher = OutcomeBatcher(
+            self.data_processor,
+            batch_size=persistence_config.get('batch_size', 1),
+            max_delay=persistence_config.get('max_delay', 5)
+        )
+        # webhook推送的新帖子队列；启用webhook后轮询只作为低频的补漏扫描
+        webhook_config = self.config.get('webhook', {})
+        self.webhook_enabled = webhook_config.get('enabled', False)
+        self.reconcile_interval = webhook_config.get('reconcile_interval', 1800)
+        self.webhook_batch_window = webhook_config.get('batch_window', 2)
+        self.webhook_queue = queue.Queue()
+        self.pending_webhook_ids = set()
+        self.webhook_lock = threading.Lock()
+        # 数据保留任务（retention.enabled），在轮询间隙按间隔执行
+        self.retention_job = RetentionJob(self.data_processor, self.config)
+        # 启用 answer_reuse.enabled 时新问题与最近已回答的问题近似重复则复用原回答
+        self.answer_reuse = AnswerReuse(self.data_processor, self.config)
         # 创建数据库表（只需要在启动时执行一次）
         self.data_processor.create_tables()
         logger.info("ForumMonitor 初始化完成")
@@ -41,33 +107,132 @@ class ForumMonitor:
         """
         csv_file = self.config['paths']['csv_file']
         check_interval = self.config['monitor']['check_interval']
+        if self.webhook_enabled:
+            check_interval = self.reconcile_interval
+            logger.info(f"已启用webhook，轮询作为补漏扫描，间隔: {check_interval}秒")
         logger.info(f"开始监控新帖子，检查间隔: {check_interval}秒")
         while True:
             try:
                 logger.info(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 正在检查新帖子...")
                 self._check_new_topics(csv_file)
-                time.sleep(check_interval)
+                self.retention_job.run_if_due()
+                self.data_processor.rotate_segments()
+                self._wait_for_next_sweep(csv_file, check_interval)
             except KeyboardInterrupt:
                 logger.info("\n监控任务已停止")
                 break
             except Exception as e:
                 logger.error(f"监控过程中发生错误: {e}")
-                time.sleep(check_interval)
+                # 轮询出错时等待期间同样处理webhook推送的帖子
+                self._wait_for_next_sweep(csv_file, check_interval)
+
+
+    def enqueue_topic(self, topic_id):
+        """
+        将webhook推送的新帖子放入待处理队列，帖子已在队列中时返回False
+        """
+        with self.webhook_lock:
+            if topic_id in self.pending_webhook_ids:
+                return False
+            self.pending_webhook_ids.add(topic_id)
+        self.webhook_queue.put(topic_id)
+        return True
+
+    def _wait_for_next_sweep(self, csv_file, interval):
+        """
+        等待下一轮轮询，期间处理webhook推送的新帖子；未启用webhook时直接休眠
+        """
+        if not self.webhook_enabled:
+            time.sleep(interval)
+            return
+        deadline = time.time() + interval
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            try:
+                topic_ids = [self.webhook_queue.get(timeout=remaining)]
+            except queue.Empty:
+                return
+            # 短暂等待，把同一时间段内推送的帖子合并为一批处理
+            time.sleep(self.webhook_batch_window)
+            while True:
+                try:
+                    topic_ids.append(self.webhook_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process_webhook_topics(csv_file, topic_ids)
+            except Exception as e:
+                logger.error(f"处理webhook推送的帖子 {topic_ids} 时发生错误: {e}")
+
+    def _process_webhook_topics(self, csv_file, topic_ids):
+        """
+        处理webhook推送的新帖子：跳过已处理过的帖子，获取详情并按监控条件过滤后进入处理流程
+        """
+        with self.webhook_lock:
+            self.pending_webhook_ids.difference_update(topic_ids)
+        existing_data = self.data_processor.load_existing_data(csv_file, candidate_ids=topic_ids)
+        new_topic_ids = [topic_id for topic_id in dict.fromkeys(topic_ids) if topic_id not in existing_data]
+        if not new_topic_ids:
+            logger.info(f"webhook推送的帖子 {topic_ids} 均已处理过")
+            return
 
+        logger.info(f"收到webhook推送的 {len(new_topic_ids)} 个新帖子: {new_topic_ids}")
+        new_topics_details = self._fetch_new_topics_details([{'id': topic_id} for topic_id in new_topic_ids])
+        new_topics_details = filter_monitored_topics(new_topics_details, self.config)
+        if not new_topics_details:
+            logger.info("webhook推送的帖子不符合监控条件，跳过")
+            return
+
+        extracted_data = self.data_processor.extract_topic_data(new_topics_details)
+        self.data_processor.append_to_csv(extracted_data, csv_file)
+        self.data_processor.append_to_db(new_topics_details, 'forum_topics')
+        self._process_new_topics(extracted_data)
 
     def _check_new_topics(self, csv_file):
         """
         检查并处理新帖子
         """
-        # 加载已存在的帖子数据
-        existing_data = self.data_processor.load_existing_data(csv_file)
-        logger.info(f"已存在 {len(existing_data)} 个帖子")
         # 获取所有帖子的基本信息
-        all_topics = self.forum_client.fetch_all_forum_topics()
+        poll_stats = {}
+        since = load_poll_state(self.poll_state_file) if self.incremental_polling else None
+        all_topics = self.forum_client.fetch_all_forum_topics(since=since, stats=poll_stats)
+        poll_stats['http_cache'] = validator_cache.get_stats()
+        poll_stats['http_pool'] = session_pool.get_stats()
+        poll_stats['db_pool'] = self.data_processor.get_db_pool_stats()
+        poll_stats['persistence'] = self.outcome_batcher.get_stats()
+        poll_stats['write_behind'] = self.data_processor.get_write_behind_stats()
+        poll_stats['blob_store'] = self.data_processor.get_blob_store_stats()
+        poll_stats['segment_store'] = self.data_processor.get_segment_store_stats()
+        poll_stats['llm_cache'] = result_cache.get_stats()
+        poll_stats['answer_reuse'] = self.answer_reuse.get_stats()
+        poll_stats['preflight'] = AIProcessor.get_preflight_stats()
+        poll_stats['judge'] = judge_agreement.get_stats()
+        self.last_poll_stats = poll_stats
+        logger.info(f"本轮轮询获取 {poll_stats.get('pages_fetched', 0)} 页，"
+                    f"跳过 {poll_stats.get('topics_skipped', 0)} 个早于高水位的帖子，"
+                    f"条件请求缓存累计命中 {poll_stats['http_cache']['hits']} 次/未命中 {poll_stats['http_cache']['misses']} 次")
+        for host, host_stats in poll_stats['http_pool'].items():
+            logger.info(f"主机 {host} 累计请求 {host_stats['requests']} 次，新建连接 {host_stats['connections_opened']} 个，"
+                        f"连接复用率 {host_stats['reuse_rate']:.2%}")
+        if poll_stats['llm_cache']['enabled']:
+            logger.info(f"模型结果缓存累计命中 {poll_stats['llm_cache']['hits']} 次，"
+                        f"命中率 {poll_stats['llm_cache']['hit_rate']:.2%}，节省token {poll_stats['llm_cache']['saved_tokens']}")
         if not all_topics:
-            logger.warning("无法获取帖子数据。")
+            if since is not None and poll_stats.get('completed'):
+                # 增量模式下没有新帖子是正常情况
+                logger.info("没有发现新帖子")
+                self._save_poll_state(poll_stats)
+            else:
+                logger.warning("无法获取帖子数据。")
             return
 
+        # 加载已存在的帖子数据（db_any 模式下只查询本轮获取到的帖子ID）
+        existing_data = self.data_processor.load_existing_data(
+            csv_file, candidate_ids=[topic['id'] for topic in all_topics]
+        )
+        logger.info(f"已存在 {len(existing_data)} 个帖子")
         # 只需要检查ID是否存在，无需重复检查标签和时间
         new_topics = []
         for topic in all_topics:
@@ -87,24 +252,58 @@ class ForumMonitor:
             logger.info(f"发现 {len(new_topics)} 个新帖子!")
 
             # 只对新帖子获取详细信息
-            new_topics_details = []
-            for topic in new_topics:
-                topic_id = topic['id']
-                logger.info(f"正在获取帖子 {topic_id} 的详细信息...")
-                topic_details = self.forum_client.fetch_topic_details(topic_id)
-                if topic_details:
-                    new_topics_details.append(topic_details)
-                else:
-                    logger.warning(f"无法获取帖子 {topic_id} 的详细信息")
+            new_topics_details = self._fetch_new_topics_details(new_topics)
 
             # 提取数据
             extracted_data = self.data_processor.extract_topic_data(new_topics_details)
             # 追加新帖子到CSV文件
             self.data_processor.append_to_csv(extracted_data, csv_file)
             self.data_processor.append_to_db(new_topics, 'forum_topics')
+            self._save_poll_state(poll_stats)
             self._process_new_topics(extracted_data)
         else:
             logger.info("没有发现新帖子")
+            self._save_poll_state(poll_stats)
+
+    def _fetch_new_topics_details(self, new_topics):
+        """
+        获取新帖子的详细信息，配置 forum.detail_workers 大于1时并发获取，结果保持帖子顺序
+        """
+        new_topics_details = []
+        if self.forum_client.detail_workers > 1:
+            topic_ids = [topic['id'] for topic in new_topics]
+            logger.info(f"正在并发获取 {len(topic_ids)} 个帖子的详细信息...")
+            start_time = time.time()
+            details_list = self.forum_client.fetch_topics_details(topic_ids)
+            logger.info(f"帖子详细信息获取完成，耗时 {time.time() - start_time:.2f} 秒")
+            for topic_id, topic_details in zip(topic_ids, details_list):
+                if topic_details:
+                    new_topics_details.append(topic_details)
+                else:
+                    logger.warning(f"无法获取帖子 {topic_id} 的详细信息")
+            return new_topics_details
+
+        for topic in new_topics:
+            topic_id = topic['id']
+            logger.info(f"正在获取帖子 {topic_id} 的详细信息...")
+            topic_details = self.forum_client.fetch_topic_details(topic_id)
+            if topic_details:
+                new_topics_details.append(topic_details)
+            else:
+                logger.warning(f"无法获取帖子 {topic_id} 的详细信息")
+        return new_topics_details
+
+    def _save_poll_state(self, poll_stats):
+        """
+        完整爬取到高水位后才推进高水位，避免中途请求失败时漏掉未翻到的页面
+        """
+        if not self.incremental_polling:
+            return
+        if not poll_stats.get('completed'):
+            logger.warning("本轮轮询未完整结束，不更新高水位")
+            return
+        if poll_stats.get('max_bumped_at'):
+            save_poll_state(self.poll_state_file, poll_stats['max_bumped_at'], poll_stats['max_topic_id'])
 
     def _generate_related_links(self, search_results, retrieval_docs=None):
         """
@@ -304,157 +503,717 @@ class ForumMonitor:
     def _process_new_topics(self, new_topics):
         """
         处理新帖子（生成摘要、搜索相关主题、回复等）
+
+        配置 async_io.enabled 时在事件循环中并发处理，配置 pipeline.enabled 时交给分阶段流水线并发处理，
+        否则逐个帖子顺序执行各阶段。
+        """
+        self.answer_reuse.refresh_if_due()
+        try:
+            if self.async_io:
+                asyncio.run(self._process_topics_async(new_topics))
+            elif self.config.get('pipeline', {}).get('enabled', False) and len(new_topics) > 1:
+                self._process_topics_with_pipeline(new_topics)
+            else:
+                self._process_topics_sequentially(new_topics)
+        finally:
+            # 本轮结束时提交尚未凑满一批的写入
+            self.outcome_batcher.flush()
+
+    def _process_topics_sequentially(self, new_topics):
+        """
+        逐个帖子顺序执行各阶段
         """
-        csv_file = self.config['paths']['csv_file']
-        processed_csv_file = self.config['paths']['processed_csv_file']  # 获取新CSV文件路径
-        answer_csv_file = self.config['paths']['answer_csv_file']
         for i, topic in enumerate(new_topics):
             topic_id = topic['id']
             logger.info(f"正在处理帖子 {topic_id} ({i + 1}/{len(new_topics)})")
+            ctx = self._new_topic_context(topic)
             try:
-                retrieval_results = []
-                # 检查是否为提示词注入攻击
-                is_injection = self.ai_processor.check_prompt_injection(topic['title'], topic['user_question'], topic_id)
-                if is_injection.lower() == 'yes':
-                    logger.info(f"帖子 {topic_id} 被识别为提示词注入攻击，跳过处理")
-                    continue
-                logger.info(f"正在为帖子 {topic_id} 生成摘要...")
-                summary = self.ai_processor.summarize_text(topic['title'], topic['user_question'],topic_id)
-                topic['summary_question'] = summary
-                logger.info(f"帖子 {topic_id}:摘要: {summary}")
-
-                # 基于摘要搜索相关主题
-                logger.info(f"正在为帖子 {topic_id} 搜索相关主题...")
-                search_results = self.forum_client.search_related_topics(
-                    summary, topic_id
-                )
-                # 处理搜索结果
-                if search_results:
-                    logger.info(f"帖子 {topic_id} 搜索到 {len(search_results)} 个相关主题")
-                    self.data_processor.process_search_results(topic_id, search_results, summary, max_results=10)
-                else:
-                    logger.info(f"帖子 {topic_id} 未搜索到相关主题")
+                for stage_name, stage_handler in self._topic_stages():
+                    if not stage_handler(ctx):
+                        break
+            except Exception as e:
+                logger.error(f"处理帖子 {topic_id} 时发生错误: {e}")
+                # 即使某个帖子处理失败，也继续处理下一个帖子
+                continue
+            finally:
+                self._finish_topic(ctx)
 
-                # 检索相关文档
-                logger.info(f"正在为帖子 {topic_id} 检索相关文档...")
-                try:
-                    retrieval_result = self.forum_client.retrieve_documents_for_topic(topic)
-
-                    # 检查retrieval_result是否为空或无效
-                    if not retrieval_result or 'related_docs' not in retrieval_result:
-                        logger.warning(f"帖子 {topic_id} 的检索结果为空，使用空字符串继续处理")
-                        retrieval_result = {'topic_id': topic_id, 'related_docs': ''}
-                        if not search_results:
-                            logger.info(f"帖子 {topic_id} 既没有搜索结果也没有检索结果，跳过回答")
-                            continue
+    def _finish_topic(self, ctx):
+        """
+        帖子处理结束（无论是否走完全部阶段）时提交该帖子收集的数据库写入
+        """
+        if ctx['outcome'] is None:
+            return
+        if self.data_processor.write_behind is not None:
+            # 后台写入线程自己按批合并事务
+            if not ctx['outcome'].is_empty():
+                self.data_processor.write_behind.enqueue('outcome', ctx['outcome'])
+            return
+        self.outcome_batcher.add(ctx['outcome'])
+
+    def _process_topics_with_pipeline(self, new_topics):
+        """
+        使用有界队列连接的多阶段流水线处理新帖子，每个阶段的并发数可单独配置
+        """
+        pipeline_config = self.config.get('pipeline', {})
+        stage_workers = pipeline_config.get('workers', {})
+        stages = [
+            PipelineStage(stage_name, stage_handler, stage_workers.get(stage_name, 1))
+            for stage_name, stage_handler in self._topic_stages()
+        ]
+        pipeline = TopicPipeline(
+            stages,
+            queue_size=pipeline_config.get('queue_size', 10),
+            stats_interval=pipeline_config.get('stats_interval', 60),
+            item_name=lambda ctx: f"帖子 {ctx['topic_id']}",
+            on_done=self._finish_topic
+        )
+        logger.info(f"使用流水线处理 {len(new_topics)} 个新帖子")
+        self.last_pipeline_stats = pipeline.run(self._new_topic_context(topic) for topic in new_topics)
+
+    async def _process_topics_async(self, new_topics):
+        """
+        在单个事件循环中并发处理新帖子，同时处理的帖子数由 async_io.topic_concurrency 控制
+
+        大模型和HTTP调用通过异步客户端共享连接池，数据库和CSV写入放到线程中执行。
+        """
+        semaphore = asyncio.Semaphore(max(1, self.config.get('async_io', {}).get('topic_concurrency', 10)))
+        ai_processor = AsyncAIProcessor(self.config)
+        forum_client = AsyncForumClient(self.config)
 
-                    retrieval_result['related_docs'], context_data = self.data_processor.format_search_results_for_prompt(
-                        retrieval_result, search_results
-                    )
+        async def process_one(i, topic):
+            async with semaphore:
+                topic_id = topic['id']
+                logger.info(f"正在处理帖子 {topic_id} ({i + 1}/{len(new_topics)})")
+                ctx = self._new_topic_context(topic)
+                try:
+                    await self._process_topic_async(ctx, ai_processor, forum_client)
                 except Exception as e:
-                    logger.error(f"帖子 {topic_id} 检索文档时发生异常: {e}，使用空字符串继续处理")
+                    logger.error(f"处理帖子 {topic_id} 时发生错误: {e}")
+                finally:
+                    if ctx['outcome'] is not None:
+                        await asyncio.to_thread(self._finish_topic, ctx)
+
+        logger.info(f"使用异步IO处理 {len(new_topics)} 个新帖子")
+        try:
+            await asyncio.gather(*(process_one(i, topic) for i, topic in enumerate(new_topics)))
+        finally:
+            await forum_client.close()
+            await ai_processor.close()
+
+    async def _process_topic_async(self, ctx, ai_processor, forum_client):
+        """
+        异步处理单个帖子，步骤之间的依赖与依赖图方式一致：
+        注入检测、摘要和文档检索同时开始，搜索只等待摘要，两个评判同时进行。
+        有相似的已回答帖子时，注入检测通过并得到摘要后先尝试复用，复用成功则取消搜索和检索。
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        match = await asyncio.to_thread(self.answer_reuse.find, topic) if self.answer_reuse.enabled else None
+        # 融合预检时注入检测和摘要共用一次调用的结果
+        preflight_task = asyncio.ensure_future(
+            ai_processor.preflight(topic['title'], topic['user_question'], topic_id)
+        ) if self.fused_preflight else None
+
+        async def summarize():
+            logger.info(f"正在为帖子 {topic_id} 生成摘要...")
+            if preflight_task is not None:
+                _, summary = await preflight_task
+                if summary is None:
+                    return None
+            else:
+                summary = await ai_processor.summarize_text(topic['title'], topic['user_question'], topic_id)
+            topic['summary_question'] = summary
+            logger.info(f"帖子 {topic_id}:摘要: {summary}")
+            return summary
+
+        async def search():
+            # 复用成功时取消搜索，shield 避免连带取消摘要
+            summary = await asyncio.shield(summary_task)
+            if summary is None:
+                return
+            # 有相似帖子时等复用检查结束再搜索，复用成功就不再发出搜索请求
+            await reuse_checked.wait()
+            logger.info(f"正在为帖子 {topic_id} 搜索相关主题...")
+            ctx['search_results'] = await forum_client.search_related_topics(summary, topic_id)
+
+        async def retrieve():
+            try:
+                return await forum_client.retrieve_documents_for_topic(topic), None
+            except Exception as e:
+                return None, e
+
+        reuse_checked = asyncio.Event()
+        if match is None:
+            reuse_checked.set()
+        summary_task = asyncio.ensure_future(summarize())
+        search_task = asyncio.ensure_future(search())
+        retrieve_task = asyncio.ensure_future(retrieve())
+        try:
+            if preflight_task is not None:
+                is_injection, _ = await preflight_task
+            else:
+                is_injection = await ai_processor.check_prompt_injection(topic['title'], topic['user_question'],
+                                                                         topic_id)
+            if is_injection.lower() == 'yes':
+                logger.info(f"帖子 {topic_id} 被识别为提示词注入攻击，跳过处理")
+                return
+            retrieval_result, retrieval_error = None, None
+            if match is not None:
+                # 与顺序执行一致，复用前先得到摘要
+                await summary_task
+                if await self._reuse_answer_async(ctx, match, ai_processor):
+                    # 复用相似帖子的回答，不再搜索、检索和生成
+                    search_task.cancel()
+                    retrieve_task.cancel()
+                reuse_checked.set()
+            if ctx['reused_from'] is None:
+                await search_task
+                await asyncio.to_thread(self._save_search_results, ctx)
+                retrieval_result, retrieval_error = await retrieve_task
+        finally:
+            for task in (summary_task, search_task, retrieve_task, preflight_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        if ctx['reused_from'] is None and \
+                not await self._generate_and_judge_async(ctx, ai_processor, retrieval_result, retrieval_error):
+            return
+
+        if ctx['publish']:
+            answer_with_notice = self._compose_reply(ctx)
+            reply_result = await forum_client.reply_to_topic(topic_id, answer_with_notice)
+            self._log_reply_result(topic_id, reply_result)
+
+        await asyncio.to_thread(self._stage_persist, ctx)
+
+    async def _generate_and_judge_async(self, ctx, ai_processor, retrieval_result, retrieval_error):
+        """
+        异步生成回答并同时进行两个评判，跳过回答时返回False
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        if not self._build_context(ctx, retrieval_result, retrieval_error):
+            return False
+
+        try:
+            answer = await ai_processor.call_large_model(
+                ctx['retrieval_result']['related_docs'],
+                topic['title'],
+                topic['user_question'],
+                topic_id
+            )
+        except Exception as e:
+            logger.error(f"帖子 {topic_id} 调用大模型时发生异常: {e}，使用默认回答继续处理")
+            answer = "抱歉，暂时无法生成回答。"
+        if not self._accept_answer(ctx, answer):
+            return False
+
+        verdict = None
+        if self.judge_mode == 'combined':
+            verdict = await ai_processor.judge_answer(ctx['answer'], ctx['context_data'], topic['title'],
+                                                      topic['user_question'], topic_id)
+            judge_agreement.record_combined(verdict is not None)
+        if verdict is not None:
+            self._apply_combined_verdict(ctx, verdict)
+        else:
+            judges = [
+                ai_processor.check_answer_relevance(ctx['answer'], ctx['context_data'], topic_id),
+                ai_processor.check_answer_quality(ctx['answer'], topic['title'], topic['user_question'], topic_id)
+            ]
+            if self.judge_mode == 'shadow':
+                judges.append(ai_processor.judge_answer(ctx['answer'], ctx['context_data'], topic['title'],
+                                                        topic['user_question'], topic_id))
+            results = await asyncio.gather(*judges)
+            ctx['is_relevant'], ctx['is_qualified'] = results[0], results[1]
+            if self.judge_mode == 'shadow':
+                judge_agreement.record(topic_id, ctx['is_relevant'], ctx['is_qualified'], results[2])
+        self._apply_judgement(ctx)
+        return True
+
+    async def _reuse_answer_async(self, ctx, match, ai_processor):
+        """
+        _reuse_answer 的异步版本
+        """
+        topic = ctx['topic']
+        answer = self.answer_reuse.compose(match)
+        is_qualified = 'yes'
+        if self.answer_reuse.verify_quality:
+            is_qualified = await ai_processor.check_answer_quality(answer, topic['title'], topic['user_question'],
+                                                                   ctx['topic_id'])
+        return await asyncio.to_thread(self._apply_reuse, ctx, match, answer, is_qualified)
+
+    def _topic_stages(self):
+        """
+        帖子处理的各个阶段，按执行顺序排列
+        """
+        if self.execution_mode == 'graph':
+            return [
+                ('graph', self._stage_graph),
+                ('publish', self._stage_publish),
+                ('persist', self._stage_persist),
+            ]
+        stages = [
+            ('precheck', self._stage_precheck),
+            ('retrieve', self._stage_search_and_retrieve),
+            ('generate', self._stage_generate),
+            ('judge', self._stage_judge),
+            ('publish', self._stage_publish),
+            ('persist', self._stage_persist),
+        ]
+        if self.answer_reuse.enabled:
+            stages.insert(1, ('reuse', self._stage_reuse))
+        return stages
+
+    def _new_topic_context(self, topic):
+        """
+        创建单个帖子在各阶段之间传递的处理上下文
+        """
+        return {
+            'topic': topic,
+            'topic_id': topic['id'],
+            'search_results': [],
+            'retrieval_result': None,
+            'context_data': '',
+            'answer': None,
+            'is_relevant': None,
+            'is_qualified': None,
+            'publish': False,
+            # 复用了相似帖子的回答时为该帖子的ID
+            'reused_from': None,
+            # 启用 persistence.unit_of_work 时收集该帖子的数据库写入
+            'outcome': TopicOutcome(topic['id']) if self.unit_of_work else None
+        }
+
+    def _stage_precheck(self, ctx):
+        """
+        预检阶段：提示词注入检测和问题摘要
+        """
+        if self.fused_preflight:
+            return self._preflight(ctx)
+        if not self._check_injection(ctx):
+            return False
+        self._summarize(ctx)
+        return True
+
+    def _stage_reuse(self, ctx):
+        """
+        复用阶段：与最近已回答的帖子近似重复时复用原回答，之后的检索、生成和评判阶段直接跳过
+        """
+        match = self.answer_reuse.find(ctx['topic'])
+        if match is not None:
+            self._reuse_answer(ctx, match)
+        return True
+
+    def _reuse_answer(self, ctx, match):
+        """
+        复用相似帖子的回答，answer_reuse.verify_quality 为True时先检查原回答是否回答了新问题
+        """
+        topic = ctx['topic']
+        answer = self.answer_reuse.compose(match)
+        is_qualified = 'yes'
+        if self.answer_reuse.verify_quality:
+            is_qualified = self.ai_processor.check_answer_quality(answer, topic['title'], topic['user_question'],
+                                                                  ctx['topic_id'])
+        return self._apply_reuse(ctx, match, answer, is_qualified)
+
+    def _apply_reuse(self, ctx, match, answer, is_qualified):
+        """
+        根据检查结果采用复用的回答并记录审计日志，返回是否采用
+        """
+        topic_id = ctx['topic_id']
+        if is_qualified.lower() != 'yes':
+            self.answer_reuse.audit(ctx['topic'], match, 'rejected')
+            logger.info(f"帖子 {match['topic_id']} 的回答不适用于帖子 {topic_id}，重新生成回答")
+            return False
+        self.answer_reuse.audit(ctx['topic'], match, 'reused')
+        ctx['answer'] = answer
+        ctx['reused_from'] = match['topic_id']
+        ctx['is_relevant'] = 'yes'
+        ctx['is_qualified'] = is_qualified
+        ctx['retrieval_result'] = {'topic_id': topic_id, 'related_docs': ''}
+        ctx['publish'] = True
+        return True
+
+    def _stage_search_and_retrieve(self, ctx):
+        """
+        搜索与检索阶段：基于摘要搜索相关主题，并从LightRAG检索相关文档
+        """
+        if ctx['reused_from'] is not None:
+            return True
+        self._search_related_topics(ctx)
+        self._save_search_results(ctx)
+        retrieval_result, retrieval_error = self._retrieve_documents(ctx)
+        return self._build_context(ctx, retrieval_result, retrieval_error)
+
+    def _stage_generate(self, ctx):
+        """
+        生成阶段：调大模型生成回答
+        """
+        if ctx['reused_from'] is not None:
+            return True
+        return self._generate_answer(ctx)
+
+    def _stage_judge(self, ctx):
+        """
+        评判阶段：检查答案与搜索结果的相关性以及答案质量，决定是否发布
+        """
+        if ctx['reused_from'] is not None:
+            return True
+        if self.judge_mode == 'combined':
+            self._judge_combined(ctx)
+        elif self.judge_mode == 'shadow':
+            # 合并评判与分开评判同时进行，只用于对比
+            shadow = self.shadow_executor.submit(self._shadow_judge, ctx)
+            self._judge_relevance(ctx)
+            self._judge_quality(ctx)
+            self._record_shadow_judge(ctx, shadow.result())
+        else:
+            self._judge_relevance(ctx)
+            self._judge_quality(ctx)
+        self._apply_judgement(ctx)
+        return True
+
+    def _stage_graph(self, ctx):
+        """
+        以依赖图方式执行预检到评判的全部步骤，互不依赖的调用并发执行：
+        注入检测、摘要和文档检索同时开始，搜索只等待摘要，两个评判同时进行。
+        注入检测判定为攻击时终止整个图，尚未开始的步骤不再执行，
+        已在运行的摘要、检索和搜索通过 graph.cancelled 得知终止，不再调用接口或写入帖子上下文。
+        """
+        topic_id = ctx['topic_id']
+        match = self.answer_reuse.find(ctx['topic'])
+        if match is not None:
+            # 有相似的已回答帖子时按阶段顺序执行，复用成功则不再检索和生成
+            if not self._stage_precheck(ctx):
+                return False
+            if self._reuse_answer(ctx, match):
+                return True
+            return self._stage_search_and_retrieve(ctx) and self._stage_generate(ctx) and self._stage_judge(ctx)
+
+        graph = TaskGraph(self.graph_executor, name=f"帖子 {topic_id}")
+        if self.fused_preflight:
+            # 融合预检一次得到注入检测结果和摘要，搜索等待预检完成
+            graph.add('injection', lambda results: self._preflight(ctx), abort_if=lambda safe: not safe)
+            summary_node = 'injection'
+        else:
+            graph.add('injection', lambda results: self._check_injection(ctx), abort_if=lambda safe: not safe)
+            graph.add('summary', lambda results: self._summarize(ctx, graph.cancelled))
+            summary_node = 'summary'
+        graph.add('retrieve', lambda results: self._retrieve_documents(ctx, graph.cancelled))
+        graph.add('search', lambda results: self._search_related_topics(ctx, graph.cancelled), deps=(summary_node,))
+        graph.add('context', lambda results: self._build_context(ctx, *results['retrieve']),
+                  deps=('search', 'retrieve'), abort_if=lambda ok: not ok)
+        # 生成回答调用成本最高，必须等注入检测通过后才开始
+        graph.add('generate', lambda results: self._generate_answer(ctx),
+                  deps=('context', 'injection'), abort_if=lambda ok: not ok)
+        if self.judge_mode == 'combined':
+            graph.add('judge', lambda results: self._judge_combined(ctx), deps=('generate',))
+        else:
+            graph.add('relevance', lambda results: self._judge_relevance(ctx), deps=('generate',))
+            graph.add('quality', lambda results: self._judge_quality(ctx), deps=('generate',))
+            if self.judge_mode == 'shadow':
+                graph.add('shadow_judge', lambda results: self._shadow_judge(ctx), deps=('generate',))
+
+        start_time = time.time()
+        results = graph.run()
+        logger.info(f"帖子 {topic_id} 依赖图执行耗时 {time.time() - start_time:.2f} 秒")
+        if graph.aborted_by != 'injection':
+            # 搜索结果在注入检测通过后再落盘，与顺序执行时保持一致
+            self._save_search_results(ctx)
+        if graph.aborted_by:
+            return False
+        if self.judge_mode == 'shadow':
+            self._record_shadow_judge(ctx, results.get('shadow_judge'))
+        self._apply_judgement(ctx)
+        return True
+
+    def _check_injection(self, ctx):
+        """
+        检查是否为提示词注入攻击，返回True表示可以继续处理
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        is_injection = self.ai_processor.check_prompt_injection(topic['title'], topic['user_question'], topic_id)
+        if is_injection.lower() == 'yes':
+            logger.info(f"帖子 {topic_id} 被识别为提示词注入攻击，跳过处理")
+            return False
+        return True
+
+    def _preflight(self, ctx):
+        """
+        融合预检：一次调用得到注入检测结果和问题摘要，返回True表示可以继续处理
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        logger.info(f"正在为帖子 {topic_id} 进行预检...")
+        is_injection, summary = self.ai_processor.preflight(topic['title'], topic['user_question'], topic_id)
+        if is_injection.lower() == 'yes':
+            logger.info(f"帖子 {topic_id} 被识别为提示词注入攻击，跳过处理")
+            return False
+        topic['summary_question'] = summary
+        logger.info(f"帖子 {topic_id}:摘要: {summary}")
+        return True
+
+    def _summarize(self, ctx, cancelled=None):
+        """
+        生成问题摘要，cancelled 为依赖图的终止事件，图已终止时不再调用或写入摘要
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        if cancelled is not None and cancelled.is_set():
+            return None
+        logger.info(f"正在为帖子 {topic_id} 生成摘要...")
+        summary = self.ai_processor.summarize_text(topic['title'], topic['user_question'],topic_id)
+        if cancelled is not None and cancelled.is_set():
+            return None
+        topic['summary_question'] = summary
+        logger.info(f"帖子 {topic_id}:摘要: {summary}")
+        return summary
+
+    def _search_related_topics(self, ctx, cancelled=None):
+        """
+        基于摘要搜索相关主题，cancelled 为依赖图的终止事件，图已终止时不再搜索或写入结果
+        """
+        topic_id = ctx['topic_id']
+        if cancelled is not None and cancelled.is_set():
+            return []
+        logger.info(f"正在为帖子 {topic_id} 搜索相关主题...")
+        search_results = self.forum_client.search_related_topics(
+            ctx['topic']['summary_question'], topic_id
+        )
+        if cancelled is not None and cancelled.is_set():
+            return []
+        ctx['search_results'] = search_results
+        return search_results
+
+    def _save_search_results(self, ctx):
+        """
+        保存搜索结果
+        """
+        topic_id = ctx['topic_id']
+        search_results = ctx['search_results']
+        if search_results:
+            logger.info(f"帖子 {topic_id} 搜索到 {len(search_results)} 个相关主题")
+            self.data_processor.process_search_results(topic_id, search_results, ctx['topic']['summary_question'],
+                                                       max_results=10, outcome=ctx['outcome'])
+        else:
+            logger.info(f"帖子 {topic_id} 未搜索到相关主题")
+
+    def _retrieve_documents(self, ctx, cancelled=None):
+        """
+        从LightRAG检索相关文档，cancelled 为依赖图的终止事件，图已终止时不再检索
+
+        Returns:
+            tuple: (检索结果, 异常)，检索出错或图已终止时检索结果为None
+        """
+        if cancelled is not None and cancelled.is_set():
+            return None, None
+        logger.info(f"正在为帖子 {ctx['topic_id']} 检索相关文档...")
+        try:
+            return self.forum_client.retrieve_documents_for_topic(ctx['topic']), None
+        except Exception as e:
+            return None, e
+
+    def _build_context(self, ctx, retrieval_result, retrieval_error=None):
+        """
+        将检索结果和搜索结果组合为生成回答用的上下文，两者都没有时返回False跳过回答
+        """
+        topic_id = ctx['topic_id']
+        search_results = ctx['search_results']
+        if retrieval_error is None:
+            try:
+                # 检查retrieval_result是否为空或无效
+                if not retrieval_result or 'related_docs' not in retrieval_result:
+                    logger.warning(f"帖子 {topic_id} 的检索结果为空，使用空字符串继续处理")
                     retrieval_result = {'topic_id': topic_id, 'related_docs': ''}
-                    context_data = format_search_results_as_json(search_results)
                     if not search_results:
                         logger.info(f"帖子 {topic_id} 既没有搜索结果也没有检索结果，跳过回答")
-                        continue
+                        return False
+
+                retrieval_result['related_docs'], context_data = self.data_processor.format_search_results_for_prompt(
+                    retrieval_result, search_results
+                )
+                ctx['retrieval_result'] = retrieval_result
+                ctx['context_data'] = context_data
+                return True
+            except Exception as e:
+                retrieval_error = e
 
-                retrieval_results.append(retrieval_result)
+        logger.error(f"帖子 {topic_id} 检索文档时发生异常: {retrieval_error}，使用空字符串继续处理")
+        if not search_results:
+            logger.info(f"帖子 {topic_id} 既没有搜索结果也没有检索结果，跳过回答")
+            return False
+        ctx['retrieval_result'] = {'topic_id': topic_id, 'related_docs': ''}
+        ctx['context_data'] = format_search_results_as_json(search_results)
+        return True
 
-                # 调大模型生成回答
-                try:
-                    answer = self.ai_processor.call_large_model(
-                        retrieval_result['related_docs'],
-                        topic['title'],
-                        topic['user_question'],
-                        topic_id
-                    )
-                    # 检查大模型是否正常返回答案
-                    if answer.startswith("处理失败:") or answer.startswith("未知错误:"):
-                        logger.info(f"帖子 {topic_id} 的大模型处理失败，跳过回复: {answer}")
-                        continue
-                except Exception as e:
-                    logger.error(f"帖子 {topic_id} 调用大模型时发生异常: {e}，使用默认回答继续处理")
-                    answer = "抱歉，暂时无法生成回答。"
-
-                # 检查生成的答案与搜索结果是否相关
-                is_relevant = self.ai_processor.check_answer_relevance(answer, context_data, topic_id)
-                is_qualified = self.ai_processor.check_answer_quality(answer, topic['title'], topic['user_question'], topic_id)
-                if is_relevant.lower() != 'yes':
-                    topic['llm_answer'] = answer
-                    token_usage = token_tracker.get_usage(topic_id)
-                    # 每处理完1个topic就处理检索结果
-                    self.data_processor.process_retrieval_results(retrieval_results)
-
-                    single_topic_list = [topic]
-
-                    # 将包含AI回答的数据写入CSV文件
-                    self.data_processor.append_to_csv(single_topic_list, processed_csv_file)
-                    self.data_processor.append_to_db(single_topic_list, 'processed_forum_topics')
-
-                    # 将token使用量数据写入consume_tokens_topic表
-                    self.data_processor.save_token_usage_to_db(topic_id, token_usage)
-                    logger.info(f"帖子 {topic_id} 的答案与搜索结果不相关，跳过回复")
-                    continue
-                if is_qualified.lower() != 'yes':
-                    topic['llm_answer'] = answer
-                    token_usage = token_tracker.get_usage(topic_id)
-                    # 每处理完1个topic就处理检索结果
-                    self.data_processor.process_retrieval_results(retrieval_results)
+    def _generate_answer(self, ctx):
+        """
+        调大模型生成回答，大模型处理失败时返回False跳过回复
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        try:
+            answer = self.ai_processor.call_large_model(
+                ctx['retrieval_result']['related_docs'],
+                topic['title'],
+                topic['user_question'],
+                topic_id
+            )
+        except Exception as e:
+            logger.error(f"帖子 {topic_id} 调用大模型时发生异常: {e}，使用默认回答继续处理")
+            answer = "抱歉，暂时无法生成回答。"
+        return self._accept_answer(ctx, answer)
+
+    def _accept_answer(self, ctx, answer):
+        """
+        检查大模型是否正常返回答案，处理失败时返回False跳过回复
+        """
+        if answer.startswith("处理失败:") or answer.startswith("未知错误:"):
+            logger.info(f"帖子 {ctx['topic_id']} 的大模型处理失败，跳过回复: {answer}")
+            return False
+        ctx['answer'] = answer
+        return True
 
-                    single_topic_list = [topic]
+    def _judge_relevance(self, ctx):
+        """
+        检查生成的答案与搜索结果是否相关
+        """
+        ctx['is_relevant'] = self.ai_processor.check_answer_relevance(ctx['answer'], ctx['context_data'],
+                                                                      ctx['topic_id'])
+        return ctx['is_relevant']
 
-                    # 将包含AI回答的数据写入CSV文件
-                    self.data_processor.append_to_csv(single_topic_list, processed_csv_file)
-                    self.data_processor.append_to_db(single_topic_list, 'processed_forum_topics')
+    def _judge_quality(self, ctx):
+        """
+        检查生成的答案是否回答了用户问题
+        """
+        topic = ctx['topic']
+        ctx['is_qualified'] = self.ai_processor.check_answer_quality(ctx['answer'], topic['title'],
+                                                                     topic['user_question'], ctx['topic_id'])
+        return ctx['is_qualified']
 
-                    # 将token使用量数据写入consume_tokens_topic表
-                    self.data_processor.save_token_usage_to_db(topic_id, token_usage)
-                    logger.info(f"帖子 {topic_id} 的答案不符合要求，跳过回复")
-                    continue
-                # 添加相关链接
-                links_section = self._generate_related_links(search_results, retrieval_result.get('related_docs', ''))
-
-                # 在 reply_to_topic 调用前添加提示语
-                answer_with_notice = "答案内容由AI生成，仅供参考：\n" + answer + "\n\n" + links_section
-                # 将生成的回答保存到topic中，后续写入CSV
-                topic['llm_answer'] = answer_with_notice
-                # 获取token使用量统计
-                token_usage = token_tracker.get_usage(topic_id)
-                logger.info(f"帖子 {topic_id} 回复内容已生成(Token使用: 总计{token_usage['total_tokens']})")
-                # 为单个topic创建临时列表
-                single_topic_list = [topic]
-
-                # answer_data = [{
-                #     'id': topic_id,
-                #     'title': topic['title'],
-                #     'llm_answer': answer_with_notice
-                # }]
-
-                reply_result = self.forum_client.reply_to_topic(topic_id, answer_with_notice)
-                if reply_result['success']:
-                    logger.info(f"帖子 {topic_id} 回复成功")
-                else:
-                    logger.error(f"帖子 {topic_id} 回复失败: {reply_result.get('error_message', '未知错误')}")
-
-                # 每处理完1个topic就处理检索结果
-                self.data_processor.process_retrieval_results(retrieval_results)
-
-                # 将包含AI回答的数据写入CSV文件
-                self.data_processor.append_to_csv(single_topic_list, processed_csv_file)
-                # self.data_processor.append_to_answer_csv(answer_data, answer_csv_file)
-                self.data_processor.append_to_db(single_topic_list, 'processed_forum_topics')
-
-                # 将token使用量数据写入consume_tokens_topic表
-                self.data_processor.save_token_usage_to_db(topic_id, token_usage)
-                #
-                # # 同步到Git仓库
-                # self._sync_csv_to_git_repo(answer_csv_file, topic_id)
-                logger.info(f"已完成处理帖子 {topic_id} 并同步到Git仓库")
-            except Exception as e:
-                logger.error(f"处理帖子 {topic_id} 时发生错误: {e}")
-                # 即使某个帖子处理失败，也继续处理下一个帖子
-                continue
+    def _judge_combined(self, ctx):
+        """
+        一次调用得到相关性和质量两个结论，合并评判失败时回退为分开评判
+        """
+        topic = ctx['topic']
+        verdict = self.ai_processor.judge_answer(ctx['answer'], ctx['context_data'], topic['title'],
+                                                 topic['user_question'], ctx['topic_id'])
+        judge_agreement.record_combined(verdict is not None)
+        if verdict is None:
+            logger.info(f"帖子 {ctx['topic_id']} 的合并评判失败，回退为分开评判")
+            self._judge_relevance(ctx)
+            self._judge_quality(ctx)
+            return
+        self._apply_combined_verdict(ctx, verdict)
+
+    def _apply_combined_verdict(self, ctx, verdict):
+        ctx['is_relevant'] = verdict['is_relevant']
+        ctx['is_qualified'] = verdict['is_qualified']
+        logger.info(f"帖子 {ctx['topic_id']} 合并评判: 相关={verdict['is_relevant']}（{verdict['relevance_reason']}），"
+                    f"质量={verdict['is_qualified']}（{verdict['quality_reason']}）")
+
+    def _shadow_judge(self, ctx):
+        """
+        影子评判：调用合并评判，结论只用于与分开评判对比
+        """
+        topic = ctx['topic']
+        return self.ai_processor.judge_answer(ctx['answer'], ctx['context_data'], topic['title'],
+                                              topic['user_question'], ctx['topic_id'])
+
+    def _record_shadow_judge(self, ctx, verdict):
+        judge_agreement.record(ctx['topic_id'], ctx['is_relevant'], ctx['is_qualified'], verdict)
+
+    def _apply_judgement(self, ctx):
+        """
+        根据两个评判结果决定是否发布，未通过时保存原始答案以便落库
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        if ctx['is_relevant'].lower() != 'yes':
+            topic['llm_answer'] = ctx['answer']
+            logger.info(f"帖子 {topic_id} 的答案与搜索结果不相关，跳过回复")
+            return
+        if ctx['is_qualified'].lower() != 'yes':
+            topic['llm_answer'] = ctx['answer']
+            logger.info(f"帖子 {topic_id} 的答案不符合要求，跳过回复")
+            return
+        ctx['publish'] = True
+
+    def _stage_publish(self, ctx):
+        """
+        发布阶段：拼接相关链接和提示语后回复帖子，未通过评判的答案不发布
+        """
+        if not ctx['publish']:
+            return True
+        answer_with_notice = self._compose_reply(ctx)
+        reply_result = self.forum_client.reply_to_topic(ctx['topic_id'], answer_with_notice)
+        self._log_reply_result(ctx['topic_id'], reply_result)
+        return True
+
+    def _compose_reply(self, ctx):
+        """
+        拼接相关链接和提示语，生成最终回复内容
+        """
+        topic = ctx['topic']
+        topic_id = ctx['topic_id']
+        if ctx['reused_from'] is not None:
+            # 复用的回答中已包含原帖子的相关链接
+            answer_with_notice = ANSWER_NOTICE + ctx['answer']
+        else:
+            # 添加相关链接
+            links_section = self._generate_related_links(ctx['search_results'],
+                                                         ctx['retrieval_result'].get('related_docs', ''))
+
+            # 在 reply_to_topic 调用前添加提示语
+            answer_with_notice = ANSWER_NOTICE + ctx['answer'] + "\n\n" + links_section
+        # 将生成的回答保存到topic中，后续写入CSV
+        topic['llm_answer'] = answer_with_notice
+        token_usage = token_tracker.get_usage(topic_id)
+        logger.info(f"帖子 {topic_id} 回复内容已生成(Token使用: 总计{token_usage['total_tokens']}，"
+                    f"缓存命中{token_usage.get('cache_hits', 0)}次节省{token_usage.get('saved_tokens', 0)})")
+        return answer_with_notice
+
+    def _log_reply_result(self, topic_id, reply_result):
+        if reply_result['success']:
+            logger.info(f"帖子 {topic_id} 回复成功")
+        else:
+            logger.error(f"帖子 {topic_id} 回复失败: {reply_result.get('error_message', '未知错误')}")
+
+    def _stage_persist(self, ctx):
+        """
+        持久化阶段：保存检索结果、处理后的帖子和token使用量
+        """
+        topic_id = ctx['topic_id']
+        processed_csv_file = self.config['paths']['processed_csv_file']  # 获取新CSV文件路径
+        # 获取token使用量统计
+        token_usage = token_tracker.get_usage(topic_id)
+        # 为单个topic创建临时列表
+        single_topic_list = [ctx['topic']]
+
+        outcome = ctx['outcome']
+
+        # 每处理完1个topic就处理检索结果
+        self.data_processor.process_retrieval_results([ctx['retrieval_result']], outcome)
+
+        # 将包含AI回答的数据写入CSV文件
+        self.data_processor.append_to_csv(single_topic_list, processed_csv_file)
+        if outcome is not None:
+            # 数据库写入在帖子处理结束时与搜索结果、检索结果一起提交
+            outcome.add_processed_topics(single_topic_list)
+            outcome.set_token_usage(token_usage)
+        else:
+            self.data_processor.append_to_db(single_topic_list, 'processed_forum_topics')
+
+            # 将token使用量数据写入consume_tokens_topic表
+            self.data_processor.save_token_usage_to_db(topic_id, token_usage)
+        if ctx['publish']:
+            if ctx['reused_from'] is None:
+                # 新生成并发布的回答加入相似问题索引
+                self.answer_reuse.add(ctx['topic'], ctx['topic']['llm_answer'][len(ANSWER_NOTICE):])
+            logger.info(f"已完成处理帖子 {topic_id}")
+        return True
 
     def _sync_csv_to_git_repo(self, csv_file, topic_id=None):
         """
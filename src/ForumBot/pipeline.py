@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from .logging_config import main_logger as logger
+
+# 通知阶段工作线程退出的哨兵对象
+_STOP = object()
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段
+
+    handler 接收一个任务对象，返回True表示交给下一阶段，返回False表示在本阶段结束（如被过滤）。
+    """
+    def __init__(self, name, handler, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def record(self, elapsed, passed=None, failed=False):
+        with self.lock:
+            self.busy_seconds += elapsed
+            if failed:
+                self.failed += 1
+            elif passed:
+                self.processed += 1
+            else:
+                self.dropped += 1
+
+
+class TopicPipeline:
+    """
+    基于有界队列的多阶段处理流水线
+
+    每个阶段有自己的工作线程池，阶段之间用有界队列连接：下游阶段处理不过来时，
+    上游线程在put时阻塞，形成背压，慢阶段不会让内存中的积压无限增长。
+    """
+    def __init__(self, stages, queue_size=10, stats_interval=60, item_name=None, on_done=None):
+        self.stages = stages
+        self.queue_size = max(1, int(queue_size))
+        self.stats_interval = stats_interval
+        # 从任务对象中取出用于日志的名称
+        self.item_name = item_name or (lambda item: item)
+        # 任务离开流水线（走完最后阶段、被过滤或出错）时的回调
+        self.on_done = on_done
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        self.started_at = None
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = input_queue.get()
+            if item is _STOP:
+                return
+            start_time = time.time()
+            try:
+                passed = stage.handler(item)
+            except Exception as e:
+                stage.record(time.time() - start_time, failed=True)
+                logger.error(f"流水线阶段 {stage.name} 处理 {self.item_name(item)} 时发生错误: {e}")
+                self._finish(item)
+                continue
+            stage.record(time.time() - start_time, passed=passed)
+            if passed and output_queue is not None:
+                # 下游队列已满时在此阻塞，形成背压
+                output_queue.put(item)
+            else:
+                self._finish(item)
+
+    def _finish(self, item):
+        if self.on_done is None:
+            return
+        try:
+            self.on_done(item)
+        except Exception as e:
+            logger.error(f"流水线完成回调处理 {self.item_name(item)} 时发生错误: {e}")
+
+    def _report_loop(self, done_event):
+        while not done_event.wait(self.stats_interval):
+            self.log_stats()
+
+    def run(self, items):
+        """
+        将所有任务送入流水线并阻塞直到全部处理完成
+
+        Returns:
+            dict: 各阶段的统计信息
+        """
+        self.started_at = time.time()
+        stage_threads = []
+        for index, stage in enumerate(self.stages):
+            threads = [
+                threading.Thread(target=self._worker, args=(index,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        done_event = threading.Event()
+        reporter = None
+        if self.stats_interval:
+            reporter = threading.Thread(target=self._report_loop, args=(done_event,), daemon=True)
+            reporter.start()
+
+        try:
+            for item in items:
+                self.queues[0].put(item)
+        finally:
+            # 按阶段顺序逐级关闭：上游全部退出后，下游队列中不会再有新任务
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self.queues[index].put(_STOP)
+                for thread in stage_threads[index]:
+                    thread.join()
+            done_event.set()
+            if reporter is not None:
+                reporter.join()
+
+        stats = self.get_stats()
+        self.log_stats()
+        return stats
+
+    def get_stats(self):
+        """
+        获取各阶段的队列深度、处理数量和吞吐量
+        """
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        stats = {}
+        for stage, stage_queue in zip(self.stages, self.queues):
+            with stage.lock:
+                handled = stage.processed + stage.dropped + stage.failed
+                stats[stage.name] = {
+                    'workers': stage.workers,
+                    'queue_depth': stage_queue.qsize(),
+                    'processed': stage.processed,
+                    'dropped': stage.dropped,
+                    'failed': stage.failed,
+                    'throughput_per_min': round(handled / elapsed * 60, 2) if elapsed else 0.0,
+                    'avg_seconds': round(stage.busy_seconds / handled, 2) if handled else 0.0
+                }
+        return stats
+
+    def log_stats(self):
+        for name, stage_stats in self.get_stats().items():
+            logger.info(f"流水线阶段 {name}: 队列深度 {stage_stats['queue_depth']}, "
+                        f"通过 {stage_stats['processed']}, 结束 {stage_stats['dropped']}, 失败 {stage_stats['failed']}, "
+                        f"吞吐 {stage_stats['throughput_per_min']}/分钟, 平均耗时 {stage_stats['avg_seconds']}秒")
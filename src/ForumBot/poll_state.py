@@ -0,0 +1,58 @@
+import json
+import os
+from .logging_config import main_logger as logger
+
+
+def get_poll_state_file(config):
+    """
+    获取增量轮询高水位文件路径，未配置时放在论坛数据目录下
+    """
+    paths = config.get('paths', {})
+    state_file = paths.get('poll_state_file')
+    if state_file:
+        return state_file
+    return os.path.join(paths.get('forum_data_dir', 'data/forum_data'), 'poll_state.json')
+
+
+def load_poll_state(state_file):
+    """
+    读取上次轮询记录的高水位（最后看到的bumped_at与最大topic id）
+
+    Returns:
+        dict or None: {'bumped_at': str, 'topic_id': int}，文件不存在或内容无效时返回None
+    """
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if not state.get('bumped_at') or state.get('topic_id') is None:
+            logger.warning(f"轮询高水位文件 {state_file} 内容不完整，将执行全量爬取")
+            return None
+        return state
+    except FileNotFoundError:
+        logger.info(f"轮询高水位文件 {state_file} 不存在，将执行全量爬取")
+        return None
+    except Exception as e:
+        logger.error(f"读取轮询高水位文件失败: {e}")
+        return None
+
+
+def save_poll_state(state_file, bumped_at, topic_id):
+    """
+    保存本轮轮询的高水位
+    """
+    state = {
+        'bumped_at': bumped_at,
+        'topic_id': int(topic_id)
+    }
+    try:
+        state_dir = os.path.dirname(state_file)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        # 先写临时文件再替换，避免进程中断时留下半截文件
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, state_file)
+        logger.info(f"轮询高水位已保存: bumped_at={bumped_at}, topic_id={topic_id}")
+    except Exception as e:
+        logger.error(f"保存轮询高水位失败: {e}")
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class TokenBucketRateLimiter:
+    """
+    令牌桶限流器：同时限制每秒请求数和同时在途的请求数，可在多个线程间共享
+
+    用法:
+        with limiter:
+            发送请求
+    """
+    def __init__(self, rate, max_in_flight, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def _take_token(self):
+        """
+        取出一个令牌，令牌不足时返回需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        阻塞直到拿到在途名额和令牌
+        """
+        self.in_flight.acquire()
+        while True:
+            wait_seconds = self._take_token()
+            if wait_seconds <= 0:
+                return
+            time.sleep(wait_seconds)
+
+    def release(self):
+        """
+        请求结束后归还在途名额
+        """
+        self.in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
@@ -0,0 +1,364 @@
+import fnmatch
+import gzip
+import os
+import re
+import time
+from datetime import datetime
+from .logging_config import main_logger as logger
+
+# 按月分区的表及其分区键
+PARTITIONED_TABLES = {
+    'forum_search_results': 'search_timestamp',
+    'forum_retrieval_results': 'created_at',
+    'forum_search_result_items': 'search_timestamp',
+}
+
+# 分区键为空的历史数据统一归到这个时间，放入历史分区
+LEGACY_TIMESTAMP = datetime(1970, 1, 1)
+
+# forum_data_dir 中可以按时间清理的处理产物（CSV和轮询状态不在此列）
+ARTIFACT_PATTERNS = ('search_results_topic_*.json', 'retrieval_results_*.json')
+
+_BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return datetime(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_{month.strftime('%Y%m')}"
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def table_exists(cursor, table):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cursor.fetchone()[0]
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions(cursor, table):
+    """
+    列出分区表的分区：[(分区名, 下界, 上界)]，MINVALUE 对应的下界为None，默认分区不返回
+    """
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _BOUND_PATTERN.search(bound or '')
+        if match:
+            partitions.append((name, _parse_bound(match.group(1)), _parse_bound(match.group(2))))
+    return sorted(partitions, key=lambda item: item[2] or datetime.max)
+
+
+def convert_to_partitioned(cursor, table, column):
+    """
+    将普通表原地转换为按月分区的表
+
+    原表改名为 <表名>_legacy 后作为 MINVALUE 到最新数据所在月份末的历史分区挂到新表下，
+    不复制数据；id 继续使用原来的序列。分区表的主键必须包含分区键，因此主键改为 (id, 分区键)。
+    """
+    legacy = f"{table}_legacy"
+    cursor.execute(f"SELECT max({column}) FROM {table}")
+    latest = cursor.fetchone()[0]
+    upper = add_months(month_start(max(latest or datetime.now(), datetime.now())), 1)
+
+    cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {column} IS NULL", (LEGACY_TIMESTAMP,))
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+    # 普通索引在父表上重新创建时会自动建到每个分区上，这里先删掉避免重名
+    cursor.execute("""
+        SELECT i.indexname FROM pg_indexes i
+        WHERE i.tablename = %s
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+    """, (legacy,))
+    for (index_name,) in cursor.fetchall():
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+    cursor.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})")
+    cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})")
+    # 序列改为属于新表，之后删除历史分区时不会连带删除序列
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (legacy,))
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    cursor.execute(f"ALTER TABLE {legacy} ALTER COLUMN {column} SET NOT NULL")
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)", (upper,))
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    logger.info(f"表 {table} 已转换为按月分区，历史数据保存在分区 {legacy}（截至 {upper:%Y-%m}）")
+
+
+def ensure_partitions(cursor, table, months_ahead=2, now=None, column=None):
+    """
+    创建当前月份及之后 months_ahead 个月的分区，已被历史分区覆盖的月份跳过
+
+    没有对应分区时写入的数据落在默认分区 <表名>_default 中，此时直接 CREATE ... PARTITION OF 会因
+    默认分区中已有该范围的行而失败，所以先摘下默认分区、建好新分区、把这些行移过去再挂回；
+    默认分区中其他月份的行也按月建分区移出。每个分区在单独的保存点中创建，一个分区失败只记录日志，
+    不影响同一事务中的其他操作。
+    """
+    column = column or PARTITIONED_TABLES[table]
+    now = now or datetime.now()
+    partitions = list_partitions(cursor, table)
+    covered_until = max((upper for _, _, upper in partitions if upper is not None), default=None)
+    months = []
+    for offset in range(months_ahead + 1):
+        month = add_months(month_start(now), offset)
+        if covered_until is None or month >= covered_until:
+            months.append(month)
+    default = f"{table}_default"
+    has_default = table_exists(cursor, default)
+    default_months = set()
+    if has_default:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', {column}) FROM {default}")
+        default_months = {month_start(row[0]) for row in cursor.fetchall() if row[0] is not None}
+
+    created = []
+    for month in sorted(set(months) | default_months):
+        name = partition_name(table, month)
+        cursor.execute("SAVEPOINT ensure_partition")
+        try:
+            if month in default_months:
+                _create_partition_from_default(cursor, table, column, default, name, month)
+            else:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                    (month, add_months(month, 1))
+                )
+            cursor.execute("RELEASE SAVEPOINT ensure_partition")
+            created.append(name)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT ensure_partition")
+            logger.error(f"创建分区 {name} 时出错: {e}")
+    return created
+
+
+def _create_partition_from_default(cursor, table, column, default, name, month):
+    """
+    默认分区中已有该月的行时：摘下默认分区，建新分区，把该月的行移入新分区，再挂回默认分区
+    """
+    upper = add_months(month, 1)
+    cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+        (month, upper)
+    )
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (month, upper))
+    moved = cursor.rowcount
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+    logger.info(f"已从默认分区 {default} 移出 {moved} 行到新分区 {name}")
+
+
+def partition_table(cursor, table, column, months_ahead=2):
+    """
+    保证表已按月分区并预建后续月份的分区，表不存在时跳过
+    """
+    if not table_exists(cursor, table):
+        return []
+    if not is_partitioned(cursor, table):
+        convert_to_partitioned(cursor, table, column)
+    return ensure_partitions(cursor, table, months_ahead, column=column)
+
+
+def archive_partition(cursor, partition, archive_dir):
+    """
+    将分区导出为 gzip 压缩的CSV文件
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition}.csv.gz")
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        cursor.copy_expert(f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    return path
+
+
+def drop_expired_partitions(cursor, table, cutoff, archive_dir=None):
+    """
+    摘除并删除上界不晚于 cutoff 的分区，指定 archive_dir 时先归档
+    """
+    dropped = []
+    for name, _, upper in list_partitions(cursor, table):
+        if upper is None or upper > cutoff:
+            continue
+        if archive_dir:
+            path = archive_partition(cursor, name, archive_dir)
+            logger.info(f"分区 {name} 已归档到 {path}")
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+    return dropped
+
+
+def create_token_rollup_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS consume_tokens_monthly (
+            month DATE PRIMARY KEY,
+            topics INTEGER DEFAULT 0,
+            prompt_tokens BIGINT DEFAULT 0,
+            completion_tokens BIGINT DEFAULT 0,
+            total_tokens BIGINT DEFAULT 0,
+            model_calls BIGINT DEFAULT 0
+        )
+    """)
+
+
+def rollup_token_usage(cursor, cutoff):
+    """
+    将早于 cutoff 的逐帖token记录按月汇总到 consume_tokens_monthly 后删除，返回汇总的记录数
+
+    consume_tokens_topic 依赖 topic_id 唯一索引做 upsert，而分区表的唯一索引必须包含分区键，
+    所以这张表不分区，改为按月汇总控制大小。
+    """
+    cursor.execute("""
+        WITH expired AS (
+            DELETE FROM consume_tokens_topic
+            WHERE created_at < %s
+            RETURNING created_at, prompt_tokens, completion_tokens, total_tokens, model_calls
+        ), monthly AS (
+            INSERT INTO consume_tokens_monthly
+                (month, topics, prompt_tokens, completion_tokens, total_tokens, model_calls)
+            SELECT date_trunc('month', created_at)::date, count(*),
+                   COALESCE(sum(prompt_tokens), 0), COALESCE(sum(completion_tokens), 0),
+                   COALESCE(sum(total_tokens), 0), COALESCE(sum(model_calls), 0)
+            FROM expired
+            GROUP BY 1
+            ON CONFLICT (month) DO UPDATE SET
+                topics = consume_tokens_monthly.topics + EXCLUDED.topics,
+                prompt_tokens = consume_tokens_monthly.prompt_tokens + EXCLUDED.prompt_tokens,
+                completion_tokens = consume_tokens_monthly.completion_tokens + EXCLUDED.completion_tokens,
+                total_tokens = consume_tokens_monthly.total_tokens + EXCLUDED.total_tokens,
+                model_calls = consume_tokens_monthly.model_calls + EXCLUDED.model_calls
+        )
+        SELECT count(*) FROM expired
+    """, (cutoff,))
+    return cursor.fetchone()[0]
+
+
+def prune_artifacts(directory, max_age_days, patterns=ARTIFACT_PATTERNS, now=None):
+    """
+    删除目录中修改时间早于 max_age_days 天的搜索/检索结果JSON文件，返回删除的文件数
+    """
+    if not directory or not os.path.isdir(directory):
+        return 0
+    deadline = (now or time.time()) - max_age_days * 86400
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or not any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns):
+                continue
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"删除过期文件 {entry.path} 失败: {e}")
+    return removed
+
+
+class RetentionJob:
+    """
+    数据保留任务：预建分区、删除（可先归档）过期分区、汇总旧的token记录、清理过期的JSON产物和产物日志段
+
+    配置项 retention：
+        enabled                  是否启用，默认不启用
+        interval                 执行间隔（秒），默认每天一次
+        partition_months         分区保留的月数，默认12
+        archive_dir              删除分区前导出CSV的目录，不设置时直接删除
+        token_detail_months      逐帖token记录保留的月数，默认6，更早的按月汇总
+        artifact_max_age_days    forum_data_dir 中JSON产物以及产物日志段保留的天数，默认30
+    """
+    def __init__(self, data_processor, config):
+        self.data_processor = data_processor
+        self.config = config
+        retention_config = config.get('retention', {})
+        self.enabled = retention_config.get('enabled', False)
+        self.interval = retention_config.get('interval', 86400)
+        self.partition_months = retention_config.get('partition_months', 12)
+        self.archive_dir = retention_config.get('archive_dir')
+        self.token_detail_months = retention_config.get('token_detail_months', 6)
+        self.artifact_max_age_days = retention_config.get('artifact_max_age_days', 30)
+        self.months_ahead = config.get('database', {}).get('partitioning', {}).get('months_ahead', 2)
+        self.last_run = None
+        self.last_stats = None
+
+    def run_if_due(self):
+        if not self.enabled:
+            return None
+        if self.last_run is not None and time.time() - self.last_run < self.interval:
+            return None
+        return self.run()
+
+    def run(self):
+        """
+        执行一次数据保留任务，返回统计信息
+        """
+        self.last_run = time.time()
+        now = datetime.now()
+        stats = {'partitions_created': [], 'partitions_dropped': [], 'token_rows_rolled_up': 0, 'artifacts_removed': 0,
+                 'artifact_segments_removed': 0}
+
+        conn = self.data_processor._get_db_connection()
+        if not conn:
+            logger.error("无法建立数据库连接，跳过本次数据保留任务")
+        else:
+            try:
+                cursor = conn.cursor()
+                partition_cutoff = add_months(month_start(now), -self.partition_months)
+                for table in PARTITIONED_TABLES:
+                    if not is_partitioned(cursor, table):
+                        continue
+                    stats['partitions_created'] += ensure_partitions(cursor, table, self.months_ahead, now)
+                    stats['partitions_dropped'] += drop_expired_partitions(
+                        cursor, table, partition_cutoff, self.archive_dir
+                    )
+                create_token_rollup_table(cursor)
+                stats['token_rows_rolled_up'] = rollup_token_usage(
+                    cursor, add_months(month_start(now), -self.token_detail_months)
+                )
+                conn.commit()
+                cursor.close()
+            except Exception as e:
+                logger.error(f"执行数据保留任务时出错: {e}")
+                conn.rollback()
+            finally:
+                self.data_processor._close_db_connection(conn)
+
+        forum_data_dir = self.config.get('paths', {}).get('forum_data_dir')
+        stats['artifacts_removed'] = prune_artifacts(forum_data_dir, self.artifact_max_age_days)
+        artifact_log = self.data_processor.artifact_log
+        if artifact_log is not None:
+            try:
+                stats['artifact_segments_removed'] = artifact_log.prune(self.artifact_max_age_days, now)
+            except Exception as e:
+                logger.error(f"清理产物日志段时出错: {e}")
+        self.last_stats = stats
+        logger.info(f"数据保留任务完成：新建分区 {len(stats['partitions_created'])} 个，"
+                    f"删除分区 {len(stats['partitions_dropped'])} 个，"
+                    f"汇总token记录 {stats['token_rows_rolled_up']} 条，"
+                    f"清理过期文件 {stats['artifacts_removed']} 个，"
+                    f"产物日志段 {stats['artifact_segments_removed']} 个")
+        return stats
@@ -0,0 +1,62 @@
+import bisect
+import threading
+import time
+from array import array
+
+# 一次新增的ID少于该数量时逐个插入，否则合并后整体重排
+_INSORT_LIMIT = 64
+
+
+class SeenTopicIndex:
+    """
+    常驻内存的已见帖子ID索引
+
+    使用有序的64位整数数组保存ID，二分查找判断是否存在，每个ID只占8字节。
+    启动时从数据库加载一次，之后随入库增量更新，并按固定间隔与数据库全量对账。
+    支持 in 和 len，可以直接替代 load_existing_data 原来返回的字典。
+    """
+    def __init__(self):
+        self.ids = array('q')
+        self.lock = threading.Lock()
+        self.loaded_at = None
+
+    def replace(self, topic_ids):
+        """
+        用数据库中的全量ID替换索引内容
+        """
+        ids = array('q', sorted(set(int(topic_id) for topic_id in topic_ids)))
+        with self.lock:
+            self.ids = ids
+            self.loaded_at = time.time()
+
+    def add_many(self, topic_ids):
+        """
+        增量加入新入库的帖子ID
+        """
+        with self.lock:
+            new_ids = sorted(set(int(topic_id) for topic_id in topic_ids if not self._contains(int(topic_id))))
+            if not new_ids:
+                return
+            if len(new_ids) < _INSORT_LIMIT:
+                for topic_id in new_ids:
+                    self.ids.insert(bisect.bisect_left(self.ids, topic_id), topic_id)
+            else:
+                self.ids = array('q', sorted(self.ids.tolist() + new_ids))
+
+    def is_stale(self, max_age):
+        return self.loaded_at is None or time.time() - self.loaded_at >= max_age
+
+    def _contains(self, topic_id):
+        index = bisect.bisect_left(self.ids, topic_id)
+        return index < len(self.ids) and self.ids[index] == topic_id
+
+    def __contains__(self, topic_id):
+        try:
+            topic_id = int(topic_id)
+        except (TypeError, ValueError):
+            return False
+        with self.lock:
+            return self._contains(topic_id)
+
+    def __len__(self):
+        return len(self.ids)
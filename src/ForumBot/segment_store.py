@@ -0,0 +1,203 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import pandas as pd
+from .logging_config import main_logger as logger
+
+# 帖子数据的列，与CSV文件的表头一致
+TOPIC_COLUMNS = ['id', 'title', 'user_question', 'best_answer', 'tags', 'replies', 'created_at', 'llm_answer',
+                 'summary_question']
+
+MANIFEST_FILE = 'manifest.json'
+STAGING_FILE = '_staging.jsonl'
+
+
+def _as_utc(value):
+    """
+    转换为UTC时间戳，不带时区的时间按UTC处理
+    """
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tz is None else value.tz_convert('UTC')
+
+
+class SegmentStore:
+    """
+    按列存储的帖子数据段（Parquet）
+
+    追加的行先写入暂存文件（JSON Lines，进程退出后不丢失），暂存行数达到 max_rows
+    或最早一行已暂存超过 max_age 秒时转换为一个Parquet段文件并清空暂存文件。
+    manifest.json 记录每个段的文件名、行数、帖子ID和创建时间范围，读取时只打开时间范围内的段，
+    并且只读取需要的列。
+    """
+    def __init__(self, directory, max_rows=5000, max_age=3600, compression='snappy'):
+        self.directory = directory
+        self.max_rows = max(1, max_rows)
+        self.max_age = max_age
+        self.compression = compression
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.staging_path = os.path.join(directory, STAGING_FILE)
+        self.manifest = self._load_manifest()
+        self.staged_rows = 0
+        self.staged_since = None
+        if os.path.exists(self.staging_path):
+            with open(self.staging_path, 'r', encoding='utf-8') as f:
+                self.staged_rows = sum(1 for line in f if line.strip())
+            if self.staged_rows:
+                self.staged_since = os.path.getmtime(self.staging_path)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'segments': []}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"读取段清单 {self.manifest_path} 时出错: {e}")
+            return {'segments': []}
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def append(self, rows):
+        """
+        追加帖子行（replies 已序列化为JSON字符串），需要时滚动生成新段
+        """
+        if not rows:
+            return
+        with self.lock:
+            with open(self.staging_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    record = {column: row.get(column) for column in TOPIC_COLUMNS}
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            if self.staged_since is None:
+                self.staged_since = time.time()
+            self.staged_rows += len(rows)
+            if self._rotation_due():
+                self._rotate()
+
+    def _rotation_due(self):
+        if not self.staged_rows:
+            return False
+        if self.staged_rows >= self.max_rows:
+            return True
+        return bool(self.max_age) and time.time() - self.staged_since >= self.max_age
+
+    def rotate_if_due(self):
+        """
+        暂存超过 max_age 秒时滚动生成新段，供定时调用
+        """
+        with self.lock:
+            if self._rotation_due():
+                self._rotate()
+
+    def flush(self):
+        """
+        将暂存的行全部写成一个段
+        """
+        with self.lock:
+            if self.staged_rows:
+                self._rotate()
+
+    def _rotate(self):
+        # 调用方已持有 self.lock
+        with open(self.staging_path, 'r', encoding='utf-8') as f:
+            frame = pd.DataFrame.from_records([json.loads(line) for line in f if line.strip()],
+                                              columns=TOPIC_COLUMNS)
+        if frame.empty:
+            os.remove(self.staging_path)
+            self.staged_rows = 0
+            self.staged_since = None
+            return
+        frame['id'] = pd.to_numeric(frame['id'], errors='coerce').astype('Int64')
+        frame['created_at'] = pd.to_datetime(frame['created_at'], utc=True, errors='coerce')
+        for column in TOPIC_COLUMNS:
+            if column not in ('id', 'created_at'):
+                frame[column] = frame[column].astype('string')
+
+        name = f"segment_{datetime.now().strftime('%Y%m%d%H%M%S')}_{len(self.manifest['segments']):06d}.parquet"
+        path = os.path.join(self.directory, name)
+        frame.to_parquet(f"{path}.tmp", index=False, compression=self.compression, engine='pyarrow')
+        os.replace(f"{path}.tmp", path)
+
+        created_at = frame['created_at'].dropna()
+        self.manifest['segments'].append({
+            'file': name,
+            'rows': len(frame),
+            'bytes': os.path.getsize(path),
+            'min_id': int(frame['id'].min()) if frame['id'].notna().any() else None,
+            'max_id': int(frame['id'].max()) if frame['id'].notna().any() else None,
+            'min_created_at': created_at.min().isoformat() if not created_at.empty else None,
+            'max_created_at': created_at.max().isoformat() if not created_at.empty else None,
+            'written_at': datetime.now().isoformat()
+        })
+        self._save_manifest()
+        os.remove(self.staging_path)
+        logger.info(f"已写出数据段 {path}，共 {len(frame)} 行")
+        self.staged_rows = 0
+        self.staged_since = None
+
+    def segments(self, start=None, end=None):
+        """
+        返回与 [start, end) 时间范围有交集的段，没有时间信息的段总是返回
+        """
+        start = _as_utc(start)
+        end = _as_utc(end)
+        selected = []
+        for segment in self.manifest['segments']:
+            if segment.get('min_created_at') is None:
+                selected.append(segment)
+                continue
+            if end is not None and pd.Timestamp(segment['min_created_at']) >= end:
+                continue
+            if start is not None and pd.Timestamp(segment['max_created_at']) < start:
+                continue
+            selected.append(segment)
+        return selected, start, end
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        读取时间范围内的数据，只读取 columns 指定的列（默认全部列）
+        """
+        segments, start, end = self.segments(start, end)
+        read_columns = list(columns) if columns else list(TOPIC_COLUMNS)
+        filter_by_time = start is not None or end is not None
+        if filter_by_time and 'created_at' not in read_columns:
+            read_columns.append('created_at')
+        frames = [pd.read_parquet(os.path.join(self.directory, segment['file']), columns=read_columns)
+                  for segment in segments]
+        if not frames:
+            return pd.DataFrame(columns=read_columns)
+        frame = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            frame = frame[frame['created_at'] >= start]
+        if end is not None:
+            frame = frame[frame['created_at'] < end]
+        if columns and filter_by_time and 'created_at' not in columns:
+            frame = frame.drop(columns=['created_at'])
+        return frame.reset_index(drop=True)
+
+    def export_csv(self, path, columns=None, start=None, end=None):
+        """
+        将时间范围内的数据导出为CSV文件，返回导出的行数
+        """
+        frame = self.read(columns, start, end)
+        frame.to_csv(path, index=False, encoding='utf-8')
+        return len(frame)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'segments': len(self.manifest['segments']),
+                'rows': sum(segment['rows'] for segment in self.manifest['segments']),
+                'bytes': sum(segment.get('bytes', 0) for segment in self.manifest['segments']),
+                'staged_rows': self.staged_rows
+            }
@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from .logging_config import main_logger as logger
+
+# 发布的回答以这句提示开头，复用的回答在提示之后加上来源说明，重新加载时跳过，避免层层嵌套
+ANSWER_NOTICE = "答案内容由AI生成，仅供参考：\n"
+REUSE_NOTE_PREFIX = "该问题与已回答的帖子相似"
+
+_PRIME = (1 << 31) - 1
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+
+
+def shingles(text, ngram=3):
+    """
+    字符n-gram集合：转小写并去掉标点和空白后切分（中英文混排时空格的使用不固定）
+    """
+    text = ''.join(_PUNCTUATION.sub(' ', text.lower()).split())
+    if len(text) <= ngram:
+        return {text} if text else set()
+    return {text[i:i + ngram] for i in range(len(text) - ngram + 1)}
+
+
+def _as_utc(value):
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if pd.isna(value):
+        return None
+    value = value.tz_localize('UTC') if value.tz is None else value.tz_convert('UTC')
+    return value.to_pydatetime()
+
+
+class SimilarityIndex:
+    """
+    基于MinHash和LSH分桶的近重复文本索引
+
+    每条文本按字符n-gram计算 num_perm 个最小哈希，签名分成 bands 段，任意一段完全相同的文本成为候选，
+    候选按签名中相同位置的比例估计Jaccard相似度。索引只在内存中，由调用方增量添加。
+    """
+    def __init__(self, ngram=3, num_perm=128, bands=32, max_age_days=90, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_age_days = max_age_days
+        rng = random.Random(seed)
+        self.perm_a = np.array([rng.randrange(1, _PRIME) for _ in range(num_perm)], dtype=np.uint64)
+        self.perm_b = np.array([rng.randrange(0, _PRIME) for _ in range(num_perm)], dtype=np.uint64)
+        self.entries = {}
+        self.buckets = defaultdict(set)
+        self.max_topic_id = 0
+        self.lock = threading.Lock()
+
+    def signature(self, text):
+        """
+        计算文本的MinHash签名，文本为空时返回None
+        """
+        grams = shingles(text, self.ngram)
+        if not grams:
+            return None
+        hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) % _PRIME for gram in grams),
+                             dtype=np.uint64, count=len(grams))
+        # a、b、哈希值都小于 2^31，乘加结果不会溢出 uint64
+        return ((np.outer(self.perm_a, hashes) + self.perm_b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, topic_id, text, **fields):
+        """
+        添加或替换一条文本，fields 随条目保存并在查询命中时返回
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return False
+        with self.lock:
+            self._remove(topic_id)
+            keys = self._band_keys(signature)
+            for key in keys:
+                self.buckets[key].add(topic_id)
+            self.entries[topic_id] = dict(fields, signature=signature, band_keys=keys)
+            self.max_topic_id = max(self.max_topic_id, int(topic_id))
+        return True
+
+    def _remove(self, topic_id):
+        # 调用方已持有 self.lock
+        entry = self.entries.pop(topic_id, None)
+        if entry is None:
+            return
+        for key in entry['band_keys']:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(topic_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def prune(self, now=None):
+        """
+        删除 created_at 早于 max_age_days 的条目，返回删除的条目数
+        """
+        if not self.max_age_days:
+            return 0
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=self.max_age_days)
+        with self.lock:
+            expired = [topic_id for topic_id, entry in self.entries.items()
+                       if entry.get('created_at') is not None and entry['created_at'] < cutoff]
+            for topic_id in expired:
+                self._remove(topic_id)
+        return len(expired)
+
+    def query(self, text, exclude=None):
+        """
+        返回估计相似度最高的条目（包含 topic_id 和 score），没有候选时返回None
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self.buckets.get(key, ()))
+            candidates.discard(exclude)
+            best = None
+            for topic_id in candidates:
+                entry = self.entries[topic_id]
+                score = float(np.mean(entry['signature'] == signature))
+                if best is None or score > best[0]:
+                    best = (score, topic_id, entry)
+        if best is None:
+            return None
+        score, topic_id, entry = best
+        match = {key: value for key, value in entry.items() if key not in ('signature', 'band_keys')}
+        match.update(topic_id=topic_id, score=round(score, 4))
+        return match
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+def question_text(topic):
+    return f"{topic.get('title') or ''}\n{topic.get('user_question') or ''}"
+
+
+class AnswerReuse:
+    """
+    近重复问题的回答复用
+
+    索引最近 max_age_days 内已发布回答的帖子（标题+问题），启动后首次使用时从 processed_forum_topics 加载，
+    之后每 refresh_interval 秒只加载ID更大的新帖子，本进程发布的回答在持久化时直接加入索引。
+    新帖子与已回答帖子的估计相似度达到 threshold 时复用原回答，命中和是否采用都写入审计日志。
+    """
+    def __init__(self, data_processor, config):
+        self.data_processor = data_processor
+        reuse_config = config.get('answer_reuse', {})
+        self.enabled = reuse_config.get('enabled', False)
+        self.threshold = reuse_config.get('threshold', 0.85)
+        self.min_chars = reuse_config.get('min_chars', 20)
+        self.verify_quality = reuse_config.get('verify_quality', True)
+        self.refresh_interval = reuse_config.get('refresh_interval', 600)
+        self.forum_base_url = config.get('links', {}).get('forum_base_url', '')
+        self.audit_path = reuse_config.get('audit_file') or os.path.join(
+            config.get('paths', {}).get('forum_data_dir', '.'), 'answer_reuse_audit.jsonl')
+        self.index = SimilarityIndex(
+            ngram=reuse_config.get('ngram', 3),
+            num_perm=reuse_config.get('num_perm', 128),
+            bands=reuse_config.get('bands', 32),
+            max_age_days=reuse_config.get('max_age_days', 90)
+        )
+        self.last_refresh = 0
+        self.lock = threading.Lock()
+        self.stats = {'lookups': 0, 'matches': 0, 'reused': 0, 'rejected': 0}
+
+    def refresh_if_due(self):
+        if not self.enabled or time.time() - self.last_refresh < self.refresh_interval:
+            return
+        self.refresh()
+
+    def refresh(self):
+        """
+        从 processed_forum_topics 增量加载已发布的回答，并删除过期的条目
+        """
+        since = None
+        if self.index.max_age_days:
+            since = datetime.now(timezone.utc) - timedelta(days=self.index.max_age_days)
+        rows = self.data_processor.get_answered_topics(self.index.max_topic_id, since, ANSWER_NOTICE)
+        added = 0
+        for topic_id, title, user_question, llm_answer, created_at in rows or []:
+            answer = llm_answer[len(ANSWER_NOTICE):]
+            if answer.startswith(REUSE_NOTE_PREFIX):
+                continue
+            topic = {'title': title, 'user_question': user_question}
+            if self.index.add(topic_id, question_text(topic), title=title, answer=answer,
+                              created_at=_as_utc(created_at)):
+                added += 1
+        pruned = self.index.prune()
+        self.last_refresh = time.time()
+        logger.info(f"相似问题索引已更新，新增 {added} 条，过期删除 {pruned} 条，共 {len(self.index)} 条")
+
+    def find(self, topic):
+        """
+        查找与帖子相似度达到阈值的已回答帖子，没有时返回None
+        """
+        if not self.enabled:
+            return None
+        text = question_text(topic)
+        if len(text.strip()) < self.min_chars:
+            return None
+        match = self.index.query(text, exclude=topic['id'])
+        with self.lock:
+            self.stats['lookups'] += 1
+            if match is None or match['score'] < self.threshold:
+                return None
+            self.stats['matches'] += 1
+        logger.info(f"帖子 {topic['id']} 与已回答的帖子 {match['topic_id']} 相似（估计相似度 {match['score']}）")
+        return match
+
+    def add(self, topic, answer):
+        """
+        本进程发布的回答（不含开头的提示）加入索引
+        """
+        if not self.enabled or answer.startswith(REUSE_NOTE_PREFIX):
+            return
+        self.index.add(topic['id'], question_text(topic), title=topic.get('title'), answer=answer,
+                       created_at=_as_utc(topic.get('created_at')) or datetime.now(timezone.utc))
+
+    def compose(self, match):
+        """
+        在原回答前加上来源说明，原回答中已包含相关链接
+        """
+        link = f"{self.forum_base_url}/t/topic/{match['topic_id']}"
+        return f"{REUSE_NOTE_PREFIX}：[{match.get('title') or match['topic_id']}]({link})，以下为该帖子的回答。\n\n" \
+               f"{match['answer']}"
+
+    def audit(self, topic, match, decision):
+        """
+        记录一次相似命中及处理结果（reused 复用、rejected 未通过检查）
+        """
+        record = {
+            'timestamp': datetime.now().isoformat(),
+            'topic_id': topic['id'],
+            'title': topic.get('title'),
+            'matched_topic_id': match['topic_id'],
+            'matched_title': match.get('title'),
+            'score': match['score'],
+            'threshold': self.threshold,
+            'decision': decision
+        }
+        with self.lock:
+            self.stats[decision] = self.stats.get(decision, 0) + 1
+            try:
+                directory = os.path.dirname(self.audit_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.audit_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            except Exception as e:
+                logger.error(f"写入回答复用审计日志时出错: {e}")
+        logger.info(f"回答复用审计: 帖子 {topic['id']} -> {match['topic_id']}，相似度 {match['score']}，结果 {decision}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update(enabled=self.enabled, indexed=len(self.index))
+        return stats
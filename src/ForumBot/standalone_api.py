@@ -13,6 +13,7 @@ from flask import Flask, request, jsonify
 from src.ForumBot.ai_processor import AIProcessor
 from src.ForumBot.forum_client import ForumClient
 from src.ForumBot.data_processor import DataProcessor
+from src.ForumBot.llm_cache import result_cache
 from src.utils import load_config
 from src.ForumBot.logging_config import main_logger as logger
 from src.ForumBot.token_tracker import token_tracker
@@ -53,6 +54,7 @@ def create_standalone_api(config_file=None):
     ai_processor = AIProcessor(config)
     forum_client = ForumClient(config)
     data_processor = DataProcessor(config)
+    result_cache.configure(config, data_processor)
 
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class TaskGraph:
+    """
+    小型依赖图执行器：依赖都已完成的节点提交到线程池并发执行
+
+    节点函数接收已完成节点的结果字典，返回值记录在同名键下。节点可以设置 abort_if，
+    其结果满足条件时终止整个图：未开始的节点不再提交，已提交但未开始的节点被取消，
+    仍在运行的节点结果被丢弃。线程无法被强行停止，运行中的节点需要自行检查 cancelled 事件，
+    在调用外部接口和写入共享状态之前得知图已终止。
+    """
+    def __init__(self, executor, name=''):
+        self.executor = executor
+        self.name = name
+        self.nodes = {}
+        self.cancelled = threading.Event()
+        self.aborted_by = None
+
+    def add(self, name, func, deps=(), abort_if=None):
+        """
+        添加节点
+        """
+        for dep in deps:
+            if dep not in self.nodes:
+                raise ValueError(f"任务图 {self.name} 的节点 {name} 依赖了未定义的节点 {dep}")
+        self.nodes[name] = (func, tuple(deps), abort_if)
+
+    def run(self):
+        """
+        执行整个图，节点抛出的异常会在终止其余节点后重新抛出
+
+        Returns:
+            dict: 各节点的结果；被终止时 aborted_by 记录触发终止的节点
+        """
+        results = {}
+        pending = dict(self.nodes)
+        running = {}
+        try:
+            while pending or running:
+                ready = [name for name, (_, deps, _) in pending.items() if all(dep in results for dep in deps)]
+                for name in ready:
+                    func = pending.pop(name)[0]
+                    running[self.executor.submit(func, results)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    value = future.result()
+                    results[name] = value
+                    abort_if = self.nodes[name][2]
+                    if abort_if is not None and abort_if(value):
+                        self.aborted_by = name
+                        return results
+            return results
+        finally:
+            if pending or running:
+                self.cancelled.set()
+                for future in running:
+                    future.cancel()
@@ -1,5 +1,6 @@
 # src/token_tracker.py
 import time
+import threading
 from datetime import datetime
 from .logging_config import main_logger as logger
 
@@ -9,46 +10,70 @@ class TokenTracker:
     """
     def __init__(self):
         self.token_usage = {}
+        # 流水线中多个线程会同时累加不同topic的用量
+        self.lock = threading.RLock()
 
     def reset_usage(self, topic_id):
         """
         重置指定topic的token使用量统计
         """
-        self.token_usage[topic_id] = {
-            'prompt_tokens': 0,
-            'completion_tokens': 0,
-            'total_tokens': 0,
-            'model_calls': 0
-        }
+        with self.lock:
+            self.token_usage[topic_id] = {
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_tokens': 0,
+                'model_calls': 0,
+                'cache_hits': 0,
+                'saved_tokens': 0
+            }
         logger.info(f"已重置topic {topic_id} 的token统计")
 
     def add_usage(self, topic_id, prompt_tokens=0, completion_tokens=0, total_tokens=0):
         """
         累加指定topic的token使用量
         """
-        if topic_id not in self.token_usage:
-            self.reset_usage(topic_id)
+        with self.lock:
+            if topic_id not in self.token_usage:
+                self.reset_usage(topic_id)
 
-        self.token_usage[topic_id]['prompt_tokens'] += prompt_tokens
-        self.token_usage[topic_id]['completion_tokens'] += completion_tokens
-        self.token_usage[topic_id]['total_tokens'] += total_tokens
-        self.token_usage[topic_id]['model_calls'] += 1
+            self.token_usage[topic_id]['prompt_tokens'] += prompt_tokens
+            self.token_usage[topic_id]['completion_tokens'] += completion_tokens
+            self.token_usage[topic_id]['total_tokens'] += total_tokens
+            self.token_usage[topic_id]['model_calls'] += 1
 
         logger.info(f"Topic {topic_id} token使用量更新: "
                     f"prompt={self.token_usage[topic_id]['prompt_tokens']}, "
                     f"completion={self.token_usage[topic_id]['completion_tokens']}, "
                     f"total={self.token_usage[topic_id]['total_tokens']}")
 
+    def add_cache_hit(self, topic_id, total_tokens=0):
+        """
+        记录指定topic的一次模型结果缓存命中，total_tokens 为原调用消耗、本次节省的token数
+        """
+        with self.lock:
+            if topic_id not in self.token_usage:
+                self.reset_usage(topic_id)
+
+            self.token_usage[topic_id]['cache_hits'] = self.token_usage[topic_id].get('cache_hits', 0) + 1
+            self.token_usage[topic_id]['saved_tokens'] = \
+                self.token_usage[topic_id].get('saved_tokens', 0) + total_tokens
+
+        logger.info(f"Topic {topic_id} 模型结果缓存命中，节省token: {total_tokens}")
+
     def get_usage(self, topic_id):
         """
         获取指定topic的token使用量统计
         """
-        return self.token_usage.get(topic_id, {
-            'prompt_tokens': 0,
-            'completion_tokens': 0,
-            'total_tokens': 0,
-            'model_calls': 0
-        })
+        with self.lock:
+            usage = self.token_usage.get(topic_id, {
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_tokens': 0,
+                'model_calls': 0,
+                'cache_hits': 0,
+                'saved_tokens': 0
+            })
+            return dict(usage)
 
     def get_all_usage(self):
         """
@@ -0,0 +1,123 @@
+import threading
+import time
+from .logging_config import main_logger as logger
+
+
+class TopicOutcome:
+    """
+    一个帖子处理过程中产生的全部数据库写入，由 DataProcessor.commit_outcomes 在一个事务中提交
+    """
+    def __init__(self, topic_id):
+        self.topic_id = topic_id
+        self.search_results = []
+        self.retrieval_results = []
+        self.processed_topics = []
+        self.token_usage = None
+
+    def add_search_results(self, search_results, search_keyword):
+        self.search_results.append((search_results, search_keyword))
+
+    def add_retrieval_result(self, topic_id, related_docs):
+        self.retrieval_results.append((topic_id, related_docs))
+
+    def add_processed_topics(self, topics):
+        self.processed_topics.extend(topics)
+
+    def set_token_usage(self, token_usage):
+        self.token_usage = dict(token_usage)
+
+    def is_empty(self):
+        return not (self.search_results or self.retrieval_results or self.processed_topics or self.token_usage)
+
+
+def commit_with_retry(data_processor, outcomes):
+    """
+    在一个事务中提交一组帖子的写入，整组提交失败时逐个帖子重试，避免一条坏数据导致整组丢失
+
+    Returns:
+        list: 重试后仍提交失败的帖子写入
+    """
+    if data_processor.commit_outcomes(outcomes):
+        return []
+    if len(outcomes) == 1:
+        return list(outcomes)
+    logger.info(f"分组提交失败，逐个重试 {len(outcomes)} 个帖子的写入")
+    return [outcome for outcome in outcomes if not data_processor.commit_outcomes([outcome])]
+
+
+class OutcomeBatcher:
+    """
+    将多个帖子的写入合并为一个事务分组提交（micro-batch）
+
+    积累到 batch_size 个帖子或最早的帖子等待超过 max_delay 秒时提交一批；
+    batch_size 为1时每个帖子处理完立即在一个事务中提交。整批提交失败时逐个帖子重试，仍失败的计入 failed。
+    """
+    def __init__(self, data_processor, batch_size=1, max_delay=5):
+        self.data_processor = data_processor
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.pending = []
+        self.oldest_at = None
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+        self.batches = 0
+        self.outcomes = 0
+        self.failed = 0
+        self.timer = None
+
+    def add(self, outcome):
+        """
+        加入一个帖子的写入，达到批大小时在当前线程提交
+        """
+        if outcome is None or outcome.is_empty():
+            return
+        with self.lock:
+            self.pending.append(outcome)
+            if self.oldest_at is None:
+                self.oldest_at = time.time()
+            ready = len(self.pending) >= self.batch_size
+            if not ready:
+                self._schedule_flush()
+        if ready:
+            self.flush()
+
+    def _schedule_flush(self):
+        # 调用方已持有 self.lock
+        if self.timer is None and self.max_delay:
+            self.timer = threading.Timer(self.max_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """
+        提交当前积累的全部写入
+        """
+        # 取出批次和提交在同一把提交锁内完成，定时提交与达到批大小的提交不会交错，批次按加入顺序提交
+        with self.commit_lock:
+            with self.lock:
+                batch = self.pending
+                self.pending = []
+                self.oldest_at = None
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if not batch:
+                return
+            failed = commit_with_retry(self.data_processor, batch)
+            with self.lock:
+                self.batches += 1
+                self.outcomes += len(batch)
+                self.failed += len(failed)
+        if failed:
+            logger.error(f"帖子 {[outcome.topic_id for outcome in failed]} 的数据库写入提交失败")
+        logger.debug(f"已分组提交 {len(batch)} 个帖子的数据库写入")
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'batches': self.batches,
+                'outcomes': self.outcomes,
+                'failed': self.failed,
+                'pending': len(self.pending),
+                'avg_batch_size': round(self.outcomes / self.batches, 2) if self.batches else 0.0
+            }
@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+
+# 需要处理的Discourse事件：新建主题，以及主题的首帖（post_number为1）
+TOPIC_EVENTS = ('topic_created', 'post_created')
+
+
+def verify_signature(secret, body, signature_header):
+    """
+    校验 X-Discourse-Event-Signature 头（格式为 sha256=<hex>），使用常量时间比较
+    """
+    if not secret or not signature_header:
+        return False
+    algorithm, _, signature = signature_header.partition('=')
+    if algorithm != 'sha256' or not signature:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+def extract_topic_id(event, payload):
+    """
+    从webhook事件中提取新帖子的ID，不需要处理的事件返回None
+
+    post_created 只处理首帖，回复不会触发新帖子处理。
+    """
+    if event not in TOPIC_EVENTS or not isinstance(payload, dict):
+        return None
+    if event == 'topic_created':
+        topic_id = (payload.get('topic') or {}).get('id')
+    else:
+        post = payload.get('post') or {}
+        if post.get('post_number') != 1:
+            return None
+        topic_id = post.get('topic_id')
+    try:
+        return int(topic_id)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,179 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from .logging_config import main_logger as logger
+from .unit_of_work import commit_with_retry
+
+# 通知写入线程退出的哨兵对象
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    后台写入线程：处理路径只把待写记录放入有界队列，由单独的线程批量落盘和入库
+
+    记录类型：
+        csv      追加CSV行，相邻的同一文件的行合并为一次写入
+        json     写出一个JSON文件
+        outcome  一个帖子的数据库写入（TopicOutcome），相邻的合并为一个事务提交
+        call     其他写入操作，入队的应是出错时抛出异常的写入方法，失败计入 failed
+
+    记录按入队顺序写入。队列满时最多等待 enqueue_timeout 秒，仍然放不进去的记录会被丢弃并计入 dropped。
+    进程退出前会自动把队列中的记录写完。
+    """
+    def __init__(self, data_processor, queue_size=1000, batch_size=50, enqueue_timeout=10):
+        self.data_processor = data_processor
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.batch_size = max(1, batch_size)
+        self.enqueue_timeout = enqueue_timeout
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def in_worker(self):
+        """
+        当前是否在写入线程中执行（写入线程中的写操作直接落盘，不再入队）
+        """
+        return threading.current_thread() is self.thread
+
+    def enqueue(self, kind, *payload):
+        """
+        放入一条待写记录，队列满且等待超时时丢弃并返回False
+        """
+        try:
+            self.queue.put((kind, payload), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            logger.error(f"写入队列已满（{self.queue.maxsize}），丢弃一条 {kind} 记录")
+            return False
+        with self.lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                self.queue.task_done()
+                return
+            batch = [record]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+
+            start_time = time.time()
+            self._write_batch(batch)
+            elapsed = time.time() - start_time
+            with self.lock:
+                self.batches += 1
+                self.last_flush_seconds = elapsed
+                self.total_flush_seconds += elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        # 按入队顺序写入，只合并相邻的同类记录（同一文件的CSV行、帖子的数据库写入），
+        # 保证先入队的写入先落盘，例如同一帖子的CSV行不会越过其后的数据库写入
+        for kind, payloads in self._adjacent_groups(batch):
+            if kind == 'csv':
+                filename = payloads[0][0]
+                rows = [row for _, group_rows in payloads for row in group_rows]
+                self._attempt(len(payloads), self.data_processor._append_csv_rows, rows, filename)
+            elif kind == 'outcome':
+                outcomes = [payload[0] for payload in payloads]
+                failed = len(commit_with_retry(self.data_processor, outcomes))
+                with self.lock:
+                    self.written += len(outcomes) - failed
+                    self.failed += failed
+            elif kind == 'json':
+                self._attempt(1, write_json_file, *payloads[0])
+            else:
+                func, args, kwargs = payloads[0]
+                self._attempt(1, func, *args, **kwargs)
+
+    def _adjacent_groups(self, batch):
+        """
+        把批次切分为 (kind, [payload, ...]) 组：相邻的同一文件CSV记录、相邻的outcome记录各成一组，其余记录单独成组
+        """
+        groups = []
+        for kind, payload in batch:
+            if groups and kind in ('csv', 'outcome') and groups[-1][0] == kind and \
+                    (kind == 'outcome' or groups[-1][1][-1][0] == payload[0]):
+                groups[-1][1].append(payload)
+            else:
+                groups.append((kind, [payload]))
+        return groups
+
+    def _attempt(self, count, func, *args, **kwargs):
+        try:
+            func(*args, **kwargs)
+            with self.lock:
+                self.written += count
+        except Exception as e:
+            with self.lock:
+                self.failed += count
+            logger.error(f"后台写入失败: {e}")
+
+    def flush(self):
+        """
+        阻塞直到队列中已有的记录全部写完
+        """
+        if not self.in_worker() and self.thread.is_alive():
+            self.queue.join()
+
+    def shutdown(self):
+        """
+        写完队列中的记录后停止写入线程
+        """
+        if not self.thread.is_alive():
+            return
+        logger.info(f"正在写出剩余的 {self.queue.qsize()} 条待写记录...")
+        self.queue.put(_STOP)
+        self.thread.join()
+
+    def get_stats(self):
+        """
+        获取队列深度、写入/丢弃/失败数量和批量写入耗时
+        """
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_flush_ms': round(self.last_flush_seconds * 1000, 2),
+                'avg_flush_ms': round(self.total_flush_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+                'max_flush_ms': round(self.max_flush_seconds * 1000, 2)
+            }
+
+
+def write_json_file(path, data):
+    """
+    写出JSON文件
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
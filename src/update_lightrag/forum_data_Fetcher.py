@@ -1,14 +1,144 @@
 import requests
-from bs4 import BeautifulSoup
 import re
 import json
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from src.ForumBot.logging_config import main_logger as logger
+from src.ForumBot.http_cache import get_json
+from src.ForumBot.http_session import session_pool
+from src.ForumBot.html_text import text_and_links
+
+
+def extract_posts_data(posts_data):
+    """
+    提取帖子数据
+    """
+    posts = []
+    for post in posts_data:
+        user_name = post['name']
+        topic_closed = post['topic_accepted_answer']
+        is_solution = post['accepted_answer']
+        body_cooked = post['cooked']
+        # 单遍解析得到文本（连续空行已合并）和全部链接
+        text_content, links = text_and_links(body_cooked)
+
+        if links:
+            text = f'content: {text_content}\nlinks: {", ".join(links)}'
+        else:
+            text = text_content
+
+        post_url = post['post_url']
+        posts.append({
+            'user_name': user_name,
+            'topic_closed': topic_closed,
+            'is_solution': is_solution,
+            'post_url': post_url,
+            'text': text,
+        })
+    return posts
+
+
+def build_topic_document(topic_id, topic_title, post_json_data, rag_dir, file_name):
+    """
+    由话题的原始JSON组装文档并写入 rag_dir，返回写入的数据
+
+    只依赖参数，可以在进程池的工作进程中执行
+    """
+    question = ''
+    best_answer_url = ''
+    topic_user_name = ''
+    reply_posts = []
+    if post_json_data.get('post_stream'):
+        post_data = post_json_data['post_stream']['posts']
+        posts = extract_posts_data(post_data)
+        question = f'{topic_title} - {posts[0]["text"]}' if posts else ''
+        topic_user_name = posts[0]['user_name']
+        reply_posts = posts[1:] if len(posts) > 1 else []
+        for post in reply_posts:
+            if post['is_solution']:
+                best_answer_url = post['post_url']
+                break
+
+    write_data = {
+        'topic_id': topic_id,
+        'question': question,
+        'topic_user_name': topic_user_name,
+        'best_answer_url': best_answer_url,
+        'reply_posts': reply_posts,
+    }
+
+    # Ensure the directory exists
+    try:
+        if not os.path.exists(rag_dir):
+            os.makedirs(rag_dir, exist_ok=True)
+    except OSError as e:
+        logger.error(f"创建目录失败 {rag_dir}: {e}")
+        raise
+
+    with open(f'{rag_dir}/{file_name}', 'w', encoding='utf-8') as f:
+        json.dump(write_data, f, ensure_ascii=False, indent=4)
+
+    return write_data
+
+
+class TopicParsePool:
+    """
+    解析话题文档的进程池
+
+    下载线程把原始JSON提交到进程池后继续下载下一个话题，HTML解析和文档组装在工作进程中并行执行。
+    未完成的任务超过 max_pending 时提交会等待最早的任务完成，避免下载速度远快于解析时积压过多JSON。
+
+    工作进程在第一次提交时才创建，此时下载线程和连接池的会话都在运行，fork 会把其他线程持有的锁
+    （日志、连接池）原样复制到子进程中，因此默认使用 spawn 启动工作进程，start_method 为None时使用平台默认方式。
+    """
+    def __init__(self, workers, max_pending=None, start_method='spawn'):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 4
+        mp_context = multiprocessing.get_context(start_method) if start_method else None
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+        self.pending = set()
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, topic_id, topic_title, post_json_data, rag_dir, file_name):
+        if len(self.pending) >= self.max_pending:
+            self._collect(wait(self.pending, return_when=FIRST_COMPLETED).done)
+        future = self.executor.submit(build_topic_document, topic_id, topic_title, post_json_data, rag_dir,
+                                      file_name)
+        future.topic_id = topic_id
+        self.pending.add(future)
+
+    def _collect(self, futures):
+        for future in futures:
+            self.pending.discard(future)
+            try:
+                future.result()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"解析话题内容失败（话题ID {future.topic_id}）: {e}")
+
+    def close(self):
+        """
+        等待全部任务完成并关闭进程池
+        """
+        self._collect(wait(self.pending).done)
+        self.executor.shutdown()
+        logger.info(f"话题解析进程池已关闭，完成 {self.completed} 个，失败 {self.failed} 个")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 
 class ForumDataFetcher:
     def __init__(self, config):
         self.config = config
+        session_pool.configure(self.config)
 
     def fetch_one_page_data(self, page):
         """
@@ -20,72 +150,44 @@ class ForumDataFetcher:
         }
 
         verify_ssl = self.config.get('lightrag_forum_data', {}).get('verify_ssl', True)
-        response = requests.get(
+        return get_json(
             f"{self.config['lightrag_forum_data']['base_url']}/latest.json",
+            self.config,
             params=params,
             timeout=10,
             verify=verify_ssl
         )
-        response.raise_for_status()
-        return response.json()
 
     def extract_posts_data(self, posts_data):
         """
         提取帖子数据
         """
-        posts = []
-        for post in posts_data:
-            user_name = post['name']
-            topic_closed = post['topic_accepted_answer']
-            is_solution = post['accepted_answer']
-            body_cooked = post['cooked']
-            soup = BeautifulSoup(body_cooked, 'html.parser')
-
-            text_content = soup.get_text()
-            text_content = re.sub(r'\n{3,}', '\n\n', text_content)
-
-            text_content = text_content.strip()
-
-            links = []
-            for link in soup.find_all('a', href=True):
-                links.append(link['href'])
-
-            if links:
-                text = f'content: {text_content}\nlinks: {", ".join(links)}'
-            else:
-                text = text_content
-
-            post_url = post['post_url']
-            posts.append({
-                'user_name': user_name,
-                'topic_closed': topic_closed,
-                'is_solution': is_solution,
-                'post_url': post_url,
-                'text': text,
-            })
-        return posts
+        return extract_posts_data(posts_data)
 
-    def get_one_topic_content(self, topic):
+    def topic_file_name(self, topic):
         """
-        获取单条话题内容
+        话题文档的文件名
         """
-        topic_id = topic['id']
-        topic_title = topic['title']
-        topic_url = f"{self.config['lightrag_forum_data']['base_url']}/t/{topic_id}.json"
-
-        safe_title = re.sub(r'[^\w\s-]', '', topic_title).strip()
+        safe_title = re.sub(r'[^\w\s-]', '', topic['title']).strip()
         safe_title = re.sub(r'[-\s]+', '_', safe_title)  # Replace spaces and hyphens with underscores
         max_title_length = 140  # 限制文件名长度
         if len(safe_title) > max_title_length:
             safe_title = safe_title[:max_title_length].rstrip('_')
-        file_name = f'{safe_title}_{topic_id}_topic.json'
+        return f'{safe_title}_{topic["id"]}_topic.json'
+
+    def fetch_topic_json(self, topic):
+        """
+        下载单条话题的原始JSON，失败时返回None
+        """
+        topic_id = topic['id']
+        topic_url = f"{self.config['lightrag_forum_data']['base_url']}/t/{topic_id}.json"
         params = {
             'track_visit': True,
             'forceLoad': True,
         }
         verify_ssl = self.config.get('lightrag_forum_data', {}).get('verify_ssl', True)
         try:
-            response = requests.get(
+            response = session_pool.get(
                 topic_url,
                 params=params,
                 timeout=10,
@@ -95,52 +197,69 @@ class ForumDataFetcher:
         except requests.exceptions.RequestException as e:
             logger.error(f"获取话题内容失败（话题ID {topic_id}）: {e}")
             return None
+        return response.json()
 
-        post_json_data = response.json()
-        question = ''
-        best_answer_url = ''
-        topic_user_name = ''
-        reply_posts = []
-        if post_json_data.get('post_stream'):
-            post_data = post_json_data['post_stream']['posts']
-            posts = self.extract_posts_data(post_data)
-            question = f'{topic_title} - {posts[0]["text"]}' if posts else ''
-            topic_user_name = posts[0]['user_name']
-            reply_posts = posts[1:] if len(posts) > 1 else []
-            for post in reply_posts:
-                if post['is_solution']:
-                    best_answer_url = post['post_url']
-                    break
-
-        write_data = {
-            'topic_id': topic_id,
-            'question': question,
-            'topic_user_name': topic_user_name,
-            'best_answer_url': best_answer_url,
-            'reply_posts': reply_posts,
-        }
+    def get_one_topic_content(self, topic, parse_pool=None):
+        """
+        获取单条话题内容
 
-        # Ensure the directory exists
-        rag_dir = self.config['lightrag_paths']['rag_data_dir']
-        try:
-            if not os.path.exists(rag_dir):
-                os.makedirs(rag_dir)
-        except OSError as e:
-            logger.error(f"创建目录失败 {rag_dir}: {e}")
-            raise
+        传入 parse_pool 时只在当前线程下载，解析和写文件交给进程池，返回 None
+        """
+        post_json_data = self.fetch_topic_json(topic)
+        if post_json_data is None:
+            return None
+        return self.handle_topic_json(topic, post_json_data, parse_pool)
 
-        with open(f'{rag_dir}/{file_name}', 'w', encoding='utf-8') as f:
-            json.dump(write_data, f, ensure_ascii=False, indent=4)
+    def handle_topic_json(self, topic, post_json_data, parse_pool=None):
+        """
+        由下载好的话题JSON生成文档，传入 parse_pool 时提交到进程池并返回 None
+        """
+        rag_dir = self.config['lightrag_paths']['rag_data_dir']
+        file_name = self.topic_file_name(topic)
+        if parse_pool is not None:
+            parse_pool.submit(topic['id'], topic['title'], post_json_data, rag_dir, file_name)
+            return None
+        return build_topic_document(topic['id'], topic['title'], post_json_data, rag_dir, file_name)
 
-        return write_data
+    def extract_one_page_topic_data(self, page, parse_pool=None):
+        """提取单页论坛话题数据
 
-    def extract_one_page_topic_data(self, page):
-        """提取单页论坛话题数据"""
+        lightrag_forum_data.fetch_workers 大于1时多个下载线程同时下载本页的话题，每个线程两次请求之间
+        仍间隔0.5秒，下载速度约为 fetch_workers * 2 个话题/秒；下载好的JSON按话题顺序在当前线程中
+        提交给解析进程池（未配置进程池时直接解析）。单线程下载时每秒最多2个话题，解析进程池多于一个工作进程也不会更快。
+        """
         data = self.fetch_one_page_data(page)
         topics = data.get('topic_list', {}).get('topics', [])
 
-        for topic in topics:
-            self.get_one_topic_content(topic)
-            time.sleep(0.5)
+        fetch_workers = self.config.get('lightrag_forum_data', {}).get('fetch_workers', 1)
+        if fetch_workers <= 1:
+            for topic in topics:
+                self.get_one_topic_content(topic, parse_pool)
+                time.sleep(0.5)
+            return topics
 
-        return topics
\ No newline at end of file
+        with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='topic-fetch') as executor:
+            for topic, post_json_data in zip(topics, executor.map(self._fetch_topic_json_paced, topics)):
+                if post_json_data is not None:
+                    self.handle_topic_json(topic, post_json_data, parse_pool)
+
+        return topics
+
+    def _fetch_topic_json_paced(self, topic):
+        post_json_data = self.fetch_topic_json(topic)
+        time.sleep(0.5)
+        return post_json_data
+
+    def create_parse_pool(self):
+        """
+        按配置创建解析进程池，lightrag_forum_data.parse_workers 未配置或为0时返回 None（在下载线程中解析）
+
+        lightrag_forum_data.parse_start_method 指定工作进程的启动方式，默认 spawn
+        """
+        forum_data_config = self.config.get('lightrag_forum_data', {})
+        workers = forum_data_config.get('parse_workers', 0)
+        if not workers:
+            return None
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        return TopicParsePool(workers, start_method=forum_data_config.get('parse_start_method', 'spawn'))
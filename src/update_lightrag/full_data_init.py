@@ -1,9 +1,10 @@
+import asyncio
 import requests
 import json
 import os
 import time
 from src.update_lightrag.forum_data_Fetcher import ForumDataFetcher
-from src.update_lightrag.lightrag_client import LightRAGClient
+from src.update_lightrag.lightrag_client import LightRAGClient, AsyncLightRAGClient
 from src.update_lightrag.filter import Filter
 from src.update_lightrag.image_processor import ImageProcessor
 from src.utils import clear_directory
@@ -21,6 +22,8 @@ class FullDataUpdate:
             self.config = load_config(config_file)
         self.forum_data_fetcher = ForumDataFetcher(self.config)
         self.lightrag_client = LightRAGClient(self.config)
+        # 启用异步IO时使用连接池并发上传文档
+        self.async_upload = self.config.get('async_io', {}).get('enabled', False)
         self.filter = Filter(self.config)
         self.image_processor = ImageProcessor(self.config)
 
@@ -28,17 +31,23 @@ class FullDataUpdate:
     def get_all_forum_data(self):
         logger.info("开始获取全部论坛数据")
         page = 0
-        while True:
-            try:
-                topics = self.forum_data_fetcher.extract_one_page_topic_data(page)
-                page += 1
-                if not topics:
-                    logger.info("未找到更多topic")
+        # 配置了 parse_workers 时下载线程只负责下载，帖子解析和文档写入在进程池中并行执行
+        parse_pool = self.forum_data_fetcher.create_parse_pool()
+        try:
+            while True:
+                try:
+                    topics = self.forum_data_fetcher.extract_one_page_topic_data(page, parse_pool)
+                    page += 1
+                    if not topics:
+                        logger.info("未找到更多topic")
+                        break
+                except requests.exceptions.RequestException as e:
+                    logger.error(f"请求失败: {e}")
                     break
-            except requests.exceptions.RequestException as e:
-                logger.error(f"请求失败: {e}")
-                break
-            logger.info(f"从第 {page} 页提取了 {len(topics)} 个topic")
+                logger.info(f"从第 {page} 页提取了 {len(topics)} 个topic")
+        finally:
+            if parse_pool is not None:
+                parse_pool.close()
 
     def compare_folder_with_mapping(self, folder_path, mapping_file):
         """
@@ -104,8 +113,7 @@ class FullDataUpdate:
         self.get_full_update_file()  # 获取全量更新文件
         self.filter.filter_upload_files()  # 过滤上传文件
         self.image_processor.process_image_from_files(self.config['lightrag_paths']['new_rag_files'])  # 处理文件中的图片
-        self.lightrag_client.upload_all_documents_from_file(self.config['lightrag_paths']['new_rag_files'],
-                                                            self.config['retrieval']['base_url'])  # 上传文件
+        self.upload_new_files()  # 上传文件
         # 检查文件是否已经上传完成
         while True:
             if self.lightrag_client.is_all_file_processed(self.config['retrieval']['base_url']):
@@ -116,3 +124,13 @@ class FullDataUpdate:
                 break
             else:
                 time.sleep(5)
+
+    def upload_new_files(self):
+        """
+        上传待更新文件列表中的文档，启用异步IO时并发上传
+        """
+        file_list_path = self.config['lightrag_paths']['new_rag_files']
+        api_url = self.config['retrieval']['base_url']
+        if self.async_upload:
+            return asyncio.run(AsyncLightRAGClient(self.config).upload_all_documents_from_file(file_list_path, api_url))
+        return self.lightrag_client.upload_all_documents_from_file(file_list_path, api_url)
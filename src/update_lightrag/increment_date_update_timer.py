@@ -1,10 +1,11 @@
 import schedule
 import time
+import asyncio
 import requests
 import os
 import json
 from .forum_data_Fetcher import ForumDataFetcher
-from .lightrag_client import LightRAGClient
+from .lightrag_client import LightRAGClient, AsyncLightRAGClient
 from .filter import Filter
 from .image_processor import ImageProcessor
 from src.utils import clear_directory
@@ -21,6 +22,8 @@ class UpdateIncrementData:
         self.config = config
         self.forum_data_fetcher = ForumDataFetcher(self.config)
         self.lightrag_client = LightRAGClient(self.config)
+        # 启用异步IO时使用连接池并发上传文档
+        self.async_upload = self.config.get('async_io', {}).get('enabled', False)
         self.filter = Filter(self.config)
         self.image_processor = ImageProcessor(self.config)
 
@@ -158,8 +161,17 @@ class UpdateIncrementData:
                                                        self.config['retrieval']['base_url'])  # 先删除lightrag上的文件
         self.filter.filter_upload_files()  # 过滤上传文件
         self.image_processor.process_image_from_files(self.config['lightrag_paths']['new_rag_files'])  # 处理文件中的图片
-        self.lightrag_client.upload_all_documents_from_file(self.config['lightrag_paths']['new_rag_files'],
-                                                            self.config['retrieval']['base_url'])  # 再上传更新后的文件
+        self.upload_new_files()  # 再上传更新后的文件
+
+    def upload_new_files(self):
+        """
+        上传待更新文件列表中的文档，启用异步IO时并发上传
+        """
+        file_list_path = self.config['lightrag_paths']['new_rag_files']
+        api_url = self.config['retrieval']['base_url']
+        if self.async_upload:
+            return asyncio.run(AsyncLightRAGClient(self.config).upload_all_documents_from_file(file_list_path, api_url))
+        return self.lightrag_client.upload_all_documents_from_file(file_list_path, api_url)
 
 
 class UpdateLightRAGTimer:
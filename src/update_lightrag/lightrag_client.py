@@ -1,14 +1,19 @@
 import time
 from http.client import responses
 
+import asyncio
+import os
 import requests
 import json
 from typing import Dict
+from src.ForumBot.async_http import AsyncHttpClientMixin
+from src.ForumBot.http_session import session_pool
 from src.ForumBot.logging_config import main_logger as logger
 
 class LightRAGClient:
     def __init__(self, config):
         self.config = config
+        session_pool.configure(self.config)
         self.verify_ssl = self.config.get('retrieval', {}).get('verify_ssl', True)
 
     def upload_document(self, file_path, api_url, api_key=None):
@@ -21,9 +26,11 @@ class LightRAGClient:
         if api_key:
             headers["X-API-Key"] = api_key
 
+        # 先读入内容：自适应传输层在429/503时会用相同参数重发请求，文件句柄已读到末尾会上传空文档
         with open(file_path, 'rb') as file:
-            files = {'file': file}
-            response = requests.post(url, files=files, headers=headers, timeout=10, verify=self.verify_ssl)
+            content = file.read()
+        files = {'file': (os.path.basename(file_path), content)}
+        response = session_pool.post(url, files=files, headers=headers, timeout=10, verify=self.verify_ssl)
 
         return response.json()
 
@@ -46,22 +53,7 @@ class LightRAGClient:
                 full_file_path = f"{self.config['lightrag_paths']['rag_data_dir']}/{file_path}"
 
                 result = self.upload_document(full_file_path, api_url, api_key)
-                if result.get("status") == "success":
-                    track_id = result.get("track_id")
-                    logger.info(f"  上传成功, 跟踪ID: {track_id}")
-                    uploaded_documents.append({
-                        "file_path": file_path,
-                        "track_id": track_id,
-                        "status": "success"
-                    })
-
-                else:
-                    logger.info(f"  上传失败: {result}")
-                    uploaded_documents.append({
-                        "file_path": file_path,
-                        "error": result,
-                        "status": "failed"
-                    })
+                uploaded_documents.append(self._upload_record(file_path, result))
             except Exception as e:
                 logger.error(f"  上传出错: {str(e)}")
                 uploaded_documents.append({
@@ -73,7 +65,34 @@ class LightRAGClient:
             # 添加小延迟避免请求过于频繁
             time.sleep(0.1)
 
-        # 打印汇总信息
+        self._log_upload_summary(uploaded_documents)
+
+        return uploaded_documents
+
+    def _upload_record(self, file_path, result):
+        """
+        根据上传接口的返回结果生成上传记录
+        """
+        if result.get("status") == "success":
+            track_id = result.get("track_id")
+            logger.info(f"  上传成功, 跟踪ID: {track_id}")
+            return {
+                "file_path": file_path,
+                "track_id": track_id,
+                "status": "success"
+            }
+
+        logger.info(f"  上传失败: {result}")
+        return {
+            "file_path": file_path,
+            "error": result,
+            "status": "failed"
+        }
+
+    def _log_upload_summary(self, uploaded_documents):
+        """
+        打印上传汇总信息
+        """
         success_count = sum(1 for doc in uploaded_documents if doc["status"] == "success")
         failed_count = sum(1 for doc in uploaded_documents if doc["status"] == "failed")
         error_count = sum(1 for doc in uploaded_documents if doc["status"] == "error")
@@ -84,8 +103,6 @@ class LightRAGClient:
         logger.info(f"  错误: {error_count}")
         logger.info(f"  总计: {len(uploaded_documents)}")
 
-        return uploaded_documents
-
     def delete_document(self, doc_id, api_url, api_key=None):
         """
         删除lightRAG系统上的文档
@@ -101,7 +118,7 @@ class LightRAGClient:
             "delete_file": False
         }
 
-        response = requests.delete(url, json=data, headers=headers, timeout=10, verify=self.verify_ssl)
+        response = session_pool.delete(url, json=data, headers=headers, timeout=10, verify=self.verify_ssl)
 
         return response.json()
 
@@ -205,8 +222,8 @@ class LightRAGClient:
                 }
 
                 # 发送请求
-                response = requests.post(f"{base_url}/documents/paginated", json=payload, timeout=10,
-                                         verify=self.verify_ssl)
+                response = session_pool.post(f"{base_url}/documents/paginated", json=payload, timeout=10,
+                                             verify=self.verify_ssl)
                 response.raise_for_status()
                 result = response.json()
 
@@ -248,7 +265,7 @@ class LightRAGClient:
             }
 
             # 发送请求到/documents/paginated接口
-            response = requests.post(
+            response = session_pool.post(
                 f"{api_url}/documents/paginated",
                 json=payload,
                 timeout=10,
@@ -286,7 +303,7 @@ class LightRAGClient:
             }
 
             # 发送请求
-            response = requests.post(
+            response = session_pool.post(
                 f"{self.config['retrieval']['base_url']}/documents/paginated",
                 json=payload,
                 timeout=10,
@@ -322,7 +339,7 @@ class LightRAGClient:
 
         response = None
         try:
-            response = requests.get(url, headers=headers, timeout=10, verify=self.verify_ssl)
+            response = session_pool.get(url, headers=headers, timeout=10, verify=self.verify_ssl)
             response.raise_for_status()  # 检查HTTP状态码
             status_data = response.json()
 
@@ -351,3 +368,67 @@ class LightRAGClient:
             else:  # 管道空闲
                 logger.info("管道已空闲，开始执行操作")
                 break
+
+
+class AsyncLightRAGClient(AsyncHttpClientMixin, LightRAGClient):
+    """
+    LightRAGClient 的异步版本，文档上传在同一连接池上并发执行
+
+    并发上传数由 async_io.upload_concurrency 控制；删除、分页查询等仍使用同步方法。
+    """
+    def __init__(self, config):
+        super().__init__(config)
+        self.upload_concurrency = max(1, self.config.get('async_io', {}).get('upload_concurrency', 8))
+
+    async def upload_document(self, file_path, api_url, api_key=None):
+        """
+        上传文档到LightRAG系统
+        """
+        url = f"{api_url}/documents/upload"
+
+        headers = {}
+        if api_key:
+            headers["X-API-Key"] = api_key
+
+        with open(file_path, 'rb') as file:
+            content = file.read()
+        files = {'file': (os.path.basename(file_path), content)}
+        response = await self._get_http_client(self.verify_ssl).post(url, files=files, headers=headers, timeout=10)
+
+        return response.json()
+
+    async def upload_all_documents_from_file(self, file_list_path, api_url, api_key=None):
+        """
+        从文件列表中读取所有文件路径并发上传，返回的记录顺序与文件列表一致
+        """
+        # 上传文件前查询管道状态是否为空闲，若不为空闲则等待
+        await asyncio.to_thread(self.wait_for_pipeline_status_not_busy, api_url)
+
+        with open(file_list_path, 'r', encoding='utf-8') as f:
+            file_paths = [line.strip() for line in f.readlines() if line.strip()]
+
+        logger.info(f"找到 {len(file_paths)} 个文件需要上传，并发数 {self.upload_concurrency}")
+        semaphore = asyncio.Semaphore(self.upload_concurrency)
+
+        async def upload_one(file_path):
+            async with semaphore:
+                try:
+                    full_file_path = f"{self.config['lightrag_paths']['rag_data_dir']}/{file_path}"
+                    result = await self.upload_document(full_file_path, api_url, api_key)
+                    return self._upload_record(file_path, result)
+                except Exception as e:
+                    logger.error(f"  上传出错: {str(e)}")
+                    return {
+                        "file_path": file_path,
+                        "error": str(e),
+                        "status": "error"
+                    }
+
+        try:
+            uploaded_documents = await asyncio.gather(*(upload_one(file_path) for file_path in file_paths))
+        finally:
+            await self.close()
+
+        self._log_upload_summary(uploaded_documents)
+
+        return list(uploaded_documents)